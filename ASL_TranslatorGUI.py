@@ -17,6 +17,10 @@ sys.path.insert(0,arch_dir)
 # add path to LEAPUTILS to sys path
 # I don't think this is the correct way to handle this
 sys.path.append(os.path.abspath('../'))
+## With --profile-startup every import below is timed
+from LEAPUTILS.startup_profile import profile
+if "--profile-startup" in sys.argv:
+    profile.enable()
 
 try:
     from PyQt4.QtCore import *
@@ -26,19 +30,24 @@ except ImportError:
     from PyQt5.QtGui import *
     from PyQt5.QtWidgets import *
 
-import numpy as np
-import pandas as pd
-import scipy.misc
-from sklearn.externals import joblib
-from collections import OrderedDict
+import argparse
 
-# import the Leap API
-import Leap
-# import leap utilities created for this project
-# Note that the code was created from Leap examples.
-import LEAPUTILS.leap_utilities as lutils
-import PROCESSING.wrangle_leap_data as wrangle
-from ngrams import ngrams
+# import utilities created for this project.  The Leap API is imported by
+# frame_sources, the SDK is not needed for the synthetic source.
+import LEAPUTILS.frame_sources as frame_sources
+from LEAPUTILS.frame_mailbox import FrameMailbox
+from LEAPUTILS.image_pool import ImagePool
+from LEAPUTILS.features import loadSchema, schemaFile
+from LEAPUTILS.inference import SignPredictor, CachedPredictor, AsyncPredictor
+from LEAPUTILS.model_loader import ModelLoader
+from LEAPUTILS.instrumentation import Metrics, DISABLED, perf_counter
+from LEAPUTILS.pipeline import SignPipeline
+from LEAPUTILS.segmenter import WordSegmenter
+from LEAPUTILS.transcript import Transcript
+## ngrams is imported when first needed
+
+## Spans shown by --metrics, in the order of the loop
+METRICS_STAGES = ["fetch","snapshot","features","predict","images","loop","paint"]
 
 
 class FrameGrabber(QObject):
@@ -47,35 +56,167 @@ class FrameGrabber(QObject):
        the camera preview."""
     
     signalStatus = pyqtSignal(dict)
+    ## emitted for each sign, preview frames go through the mailbox
+    signalPrediction = pyqtSignal(dict)
+    ## carries new frame ids from the Leap listener thread into this thread
+    newFrame = pyqtSignal(object)
+    ## carries the finished ModelLoader from the loading thread into this thread
+    modelLoaded = pyqtSignal(object)
+    ## the state of the model ("Model loading...", load time and memory)
+    signalModelStatus = pyqtSignal(str)
     
-    def __init__(self,parent=None):
+    def __init__(self,parent=None,source=None,captureMode="listener",metrics=None,metricsFile=None,
+                 cacheStep=1.0,cacheSize=256,cacheVerify=0):
         super(self.__class__,self).__init__(parent)
         
+        ## Latencies of the loop stages, a disabled Metrics records nothing.
+        ## The histograms are appended to metricsFile when the camera stops
+        self.metrics = DISABLED if metrics is None else metrics
+        self._metricsFile = metricsFile
+        ## A held sign is predicted once per cell of cacheStep mm, a step of
+        ## 0 sends every frame to the model
+        self._cacheStep = cacheStep
+        self._cacheSize = cacheSize
+        self._cacheVerify = cacheVerify
+        
         self._modelFile = r"S:\Models\RF\RandomForest_Distance_ALL_clf.pkl"
-        self._model = joblib.load(self._modelFile)
-        self._prevFrameID = None
-        self._currFrameID = None
+        ## The model is loaded in the background by loadModel(), the preview
+        ## runs meanwhile and predictions start once onModelLoaded() is called
+        self._model = None
+        self._predictor = None
+        self._inference = None
+        ## A forest flattened by flat_forest.py predicts the same
+        ## probabilities with much less overhead per frame, and is used
+        ## when present
+        modelPath = self._modelFile
+        if os.path.isdir(os.path.splitext(self._modelFile)[0] + ".flat"):
+            modelPath = os.path.splitext(self._modelFile)[0] + ".flat"
+        self._loader = ModelLoader(modelPath,mmapMode="r",onLoaded=self.modelLoaded.emit)
+        self.modelLoaded.connect(self.onModelLoaded)
+        ## Feature schema of the model, created next to it by features.py.
+        ## It is checked against the model once loaded, predictions do not
+        ## start without a matching schema.
+        self._featureFile = schemaFile(self._modelFile)
+        self._modelStatus = None
+        ## Every hand in the frame is followed by its id.  A sign is emitted
+        ## once 3 of the last 5 predictions of a hand agree.  The hand is then
+        ## settled, and it is not predicted until it changes from the settled
+        ## snapshot.  The features of all hands go to the model together.
+        self._pipeline = SignPipeline(window=5,votes=3,metrics=self.metrics)
         self.iBox = None
-        self.controller = Leap.Controller()
-        self.controller.set_policy_flags(Leap.Controller.POLICY_IMAGES)
+        ## The frame source is the live Leap.Controller unless a replay or
+        ## synthetic source is given (see frame_sources.py)
+        if source is None:
+            source = frame_sources.LeapFrameSource()
+        self.controller = source
+        ## In listener mode the source calls back for each new frame, in poll
+        ## mode a QTimer reads the source
+        self._captureMode = captureMode
+        self._stats = frame_sources.CaptureStats(captureMode)
+        self._running = False
+        self._framePending = False
+        self.newFrame.connect(self.onNewFrame)
+        ## Preview images are copied into pooled buffers that stay valid
+        ## until the GUI releases them.  Preview frames are left in the
+        ## mailbox for the GUI to take.
+        self.imagePool = ImagePool(slots=4)
+        self.mailbox = FrameMailbox(onDrop=self.releaseFrame)
         ## Cannot instantiate QTimer here.  It must be instantiated in the thread
         ## in which it will be used.  So we will instantiate it when calling
         ## the startCamera() function from the QThread that controls it.
         
+    def loadModel(self):
+        
+        """This function starts loading the model on a background thread.  It
+           is called once the FrameGrabber has been moved to its thread, so
+           that onModelLoaded() runs there."""
+        
+        self.signalModelStatus.emit(self._loader.summary())
+        self._loader.start()
+        
+    @pyqtSlot(object)
+    def onModelLoaded(self,loader):
+        
+        """This function starts the inference thread once the model is loaded.
+        
+           PARAMETERS:  loader: ModelLoader
+                           the finished loader"""
+        
+        sys.stdout.write(loader.summary() + "\n")
+        if loader.error is None:
+            try:
+                self._pipeline.engine = loadSchema(self._featureFile,loader.model)
+            except ValueError as e:
+                ## shown instead of the hand position, once
+                self._modelStatus = str(e)
+                sys.stdout.write(self._modelStatus + "\n")
+                self.signalModelStatus.emit(self._modelStatus)
+                return
+            self._model = loader.model
+            self._predictor = SignPredictor(self._model,topK=3)
+            if self._cacheStep > 0:
+                self._predictor = CachedPredictor(self._predictor,step=self._cacheStep,
+                                                  capacity=self._cacheSize,
+                                                  verifyEvery=self._cacheVerify,
+                                                  metrics=self.metrics)
+            ## The model runs on its own thread.  The capture loop submits the
+            ## features of still hands and collects the predictions later, a
+            ## request not yet started is replaced by the newer frame.
+            self._inference = AsyncPredictor(self._predictor,metrics=self.metrics)
+        self.signalModelStatus.emit(loader.summary())
         
     @pyqtSlot()
     def startCamera(self):
 
-        """This function instantiates a QTimer object that is used to call the
-           runCamLoop() function at an interval of 1ms.
+        """This function starts the capture.  In listener mode the frame source
+           calls frameArrived() for each new frame.  In poll mode a QTimer
+           object is instantiated that is used to call the runCamLoop()
+           function at an interval of 100ms.
            
            PARAMETERS:  self: self
            
            RETURNS: NONE"""        
         
-        self._timer = QTimer()
-        self._timer.timeout.connect(self.runCamLoop)
-        self._timer.start(100)
+        self._running = True
+        self._stats.reset()
+        self.mailbox.reset()
+        if self._captureMode == "listener":
+            self.controller.listen(self.frameArrived)
+        else:
+            self._timer = QTimer()
+            self._timer.timeout.connect(self.runCamLoop)
+            self._timer.start(100)
+    
+    def frameArrived(self,frameID):
+        
+        """This function is called from the frame source thread for each new
+           frame.  The frame id is forwarded to the capture thread unless a
+           frame is already waiting there, in which case the newer frame will
+           be read when the waiting one is handled.
+           
+           PARAMETERS:  frameID: integer
+                           the id of the new frame
+           
+           RETURNS: NONE"""
+        
+        if not self._framePending:
+            self._framePending = True
+            self.newFrame.emit(frameID)
+    
+    @pyqtSlot(object)
+    def onNewFrame(self,frameID):
+        
+        """This function runs the capture loop for a frame announced by the
+           frame source.
+           
+           PARAMETERS:  frameID: integer
+                           the id of the new frame
+           
+           RETURNS: NONE"""
+        
+        self._framePending = False
+        if self._running:
+            self.runCamLoop()
     
     def runCamLoop(self):
 
@@ -87,108 +228,94 @@ class FrameGrabber(QObject):
            
            RETURNS: NONE"""
         
+        loopStart = perf_counter()
         frameData = {}
         frameData['image'] = None
-        prediction = {'Predict':None}
-        frame = self.controller.frame()
+        with self.metrics.span("fetch"):
+            frame = self.controller.frame()
+        self._stats.frameSeen(frame.id)
         if self.iBox is None:
             self.iBox = frame.interaction_box
-        if self._prevFrameID is None:
-            self._prevFrameID = frame.id
-        self._currFrameID = frame.id
-        #print self._currFrameID,self._prevFrameID
 #        self.iBoxWidth = self.iBox.width # x-axis
 #        self.iBoxHeight = self.iBox.height # y-axis
 #        self.iBoxDepth = self.iBox.depth # z-axis
 #        self.iBoxCenter = self.iBox.center # vector
 #        msg = ""
+        predictions = self.collectPredictions()
         if not frame.images.is_empty:
             images = frame.images
-            if frame.hands.is_empty:
-                msg = "No Hands in Frame"
-                prediction = {'Predict':None}
-            else:
-                palmPos = frame.hands[0].palm_position
-                msg = lutils.putHandInIBox(palmPos,self.iBox)
+            ## every hand is copied once, and checked on its snapshot
+            msg, ready = self._pipeline.gate(frame)
+            if self._inference is None:
                 if msg == "Hand in position":
-                    if not lutils.handMoving(frame.hands[0]):
-                        if self._prevFrameID != self._currFrameID:
-                            pHand = self.controller.frame(self._currFrameID - self._prevFrameID).hands[0]
-                            cHand = frame.hands[0]
-                            if lutils.handChanged(pHand,cHand):
-                                #print "Prediction on %d, %d" % (self._currFrameID,self._prevFrameID)
-                                prediction = self.predictSign(frame.hands[0])
-                                self._prevFrameID = self._currFrameID
-                            else:
-                                prediction = {'Predict':None}
-                                #self._prevFrameID = self._currFrameID
-                    else:
-                        prediction = {'Predict':None}
-                        #self._prevFrameID = self._currFrameID
-                else:
-                    prediction = {'Predict':None}
-                    self._prevFrameID = self._currFrameID
-            if images[0].is_valid:
-                try:
-                    img = lutils.image_to_np_array(images[0])
-                except:
-                    pass
-            elif images[1].is_valid:
-                try:
-                    img = lutils.image_to_np_array(images[1])
-                except:
-                    pass
-            else:
-                img = None
-    
-            frameData['image'] = img
-            frameData['Prediction'] = prediction
-            frameData['Message'] = msg
-                     
-            self.signalStatus.emit(frameData)
+                    msg = self._modelStatus or self._loader.summary()
+            elif ready:
+                ## one model call for all hands, the pose of each hand is
+                ## kept to drop the votes of a pose that changed meanwhile
+                features = self._pipeline.features(ready)
+                context = [(track,track.pose,snapshot) for track,snapshot,hand in ready]
+                self._inference.submit(frame.id,features,context)
+            ## one copy of the sensor images into a pooled slot, the left
+            ## image is shown unless only the right one is valid
+            with self.metrics.span("images"):
+                slot = self.imagePool.copyFrame(images)
+            if slot is not None:
+                frameData['image'] = slot.images[0] if images[0].is_valid else slot.images[1]
+                frameData['slot'] = slot
+                frameData['Message'] = msg
+                
+                ## the GUI takes the newest frame at its display rate
+                self.mailbox.put(frameData)
                      
         else:
             self.signalStatus.emit({})
+        ## the signs collected above are emitted also on frames without
+        ## images, they are not kept for the next frame
+        for prediction in predictions:
+            self.signalPrediction.emit(prediction)
+        self.metrics.record("loop",perf_counter() - loopStart)
             
-        #self._prevFrameID = self._currFrameID
-            
-    
-            
-    def predictSign(self,hand):
+    def releaseFrame(self,frameData):
         
-        """This function takes the hand instance found in the data and runs it 
-           through the specified model for prediction.
+        """This function returns the image slot of a preview frame to the
+           pool once the frame has been displayed or dropped.
            
-           PARAMETERS:  hand: Leap.Hand
-                           the hand to process through the model
-                           
-           RETURNS:     prediction : dictionary
-                           a dictionary containing the predicted sign and its
-                           probability"""
-        
-        data = OrderedDict()
-        orient = "Right" if hand.is_right else "Left"
-        #data = lutils.getDataTransformBasis(hand,data,orient)
-        data = wrangle.getDistanceData(hand,data,orient)
-        #data = wrangle.getDistanceDirData(hand,data,orient)
-        #data = wrangle.getDistanceDeg(hand,data,orient)
-        #data = wrangle.getDataPalmOrigin(hand,data,orient)
-        #data = wrangle.getReducedData(hand,data,orient)
-        
-        df = pd.DataFrame(data=data,index=[0])
-        
-
-        pred = self._model.predict(df)
-        prob = self._model.predict_proba(df)
-#        prob = prob[0][pred[0]]
+           PARAMETERS:  frameData: dict
+                           the preview frame posted to the mailbox
+           
+           RETURNS: NONE"""
         
-        return({"Predict":pred[0]})#,"Probability":prob})
+        if frameData.get('slot') is not None:
+            self.imagePool.release(frameData['slot'])
+    
+    def collectPredictions(self):
         
+        """This function picks up the predictions completed by the inference
+           thread and votes with them.
+           
+           RETURNS:     predictions : list of dictionary
+                           the emitted signs, each with its probability, the
+                           top 3 alternatives, and the 'HandId' and
+                           'Handedness' of the hand that signed it"""
+        
+        signs = []
+        if self._inference is None:
+            return signs
+        for frameID, results, context in self._inference.results():
+            for result, (track, pose, snapshot) in zip(results, context):
+                sign = self._pipeline.vote(track,pose,snapshot,result)
+                if sign is not None:
+                    #print "Prediction on %d" % frameID
+                    signs.append(sign)
+        
+        return signs
+    
     @pyqtSlot()
     def stopCamera(self):
 
-        """This function stops the QTimer object that is calling the runCamLoop
-           function.  It then emits an empty signal that is used by the main event
+        """This function stops the frame source callbacks or the QTimer object
+           that is calling the runCamLoop function, and reports the capture
+           statistics.  It then emits an empty signal that is used by the main event
            loop so that it knows the status of the thread.
            
            PARAMETERS:  self: self
@@ -196,31 +323,60 @@ class FrameGrabber(QObject):
            RETURNS: NONE"""
         
         #sys.stdout.write("Stop Camera Called")
-        self._timer.stop()
+        self._running = False
+        if self._captureMode == "listener":
+            self.controller.stopListening()
+        else:
+            self._timer.stop()
+        sys.stdout.write(self._stats.summary() + "\n")
+        sys.stdout.write(self.mailbox.summary() + "\n")
+        if self._inference is not None:
+            sys.stdout.write(self._inference.summary() + "\n")
+        if isinstance(self._predictor,CachedPredictor):
+            sys.stdout.write(self._predictor.summary() + "\n")
+        if self.metrics.enabled:
+            sys.stdout.write(self.metrics.summary() + "\n")
+            if self._metricsFile:
+                self.metrics.dump(self._metricsFile)
+        self.mailbox.clear()
         self.signalStatus.emit({})
 
 class MainWindow(QMainWindow):
     
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, source=None, captureMode="listener", metrics=None, metricsFile=None,
+                 cacheOptions=None, transcriptFile=None):
         super(MainWindow,self).__init__(parent)
 
-        self._camView = FrameGrabber()
+        self.metrics = DISABLED if metrics is None else metrics
+        with profile.stage("FrameGrabber"):
+            self._camView = FrameGrabber(source=source,captureMode=captureMode,
+                                         metrics=self.metrics,metricsFile=metricsFile,
+                                         **(cacheOptions or {}))
         self._camViewThread = QThread()
         
         self._camView.moveToThread(self._camViewThread)
         self._camViewThread.start()
         self._camView.signalStatus.connect(self.updateImage)
+        self._camView.signalPrediction.connect(self.updateTextBox)
+        self._camView.signalModelStatus.connect(self.updateModelStatus)
+        
+        ## Preview frames are taken from the mailbox at the display rate
+        self._displayTimer = QTimer()
+        self._displayTimer.timeout.connect(self.showLatestFrame)
+        self._displayTimer.start(33)
         
-        self.lastWord = ''
-        self.sentence = ''
-        self.inputChar = ''
+        self._pixmap = None
+        ## built from the ngrams word counts on the first sign
+        self._segmenter = None
+        self._transcriptFile = transcriptFile
         
         self.mainWidget = QWidget()        
         self.gridLayout = QGridLayout()
 
         self.setWindowTitle("ASL Translator")
         
-        self.createWidgets()
+        with profile.stage("createWidgets"):
+            self.createWidgets()
         
         ## Set the mainWidget layout to the grid layout
         self.mainWidget.setLayout(self.gridLayout)
@@ -235,6 +391,18 @@ class MainWindow(QMainWindow):
         self._defaultColor = 'rgb(240,240,240)'
         self._redColor = 'rgb(255,0,0)'
         self._greenColor = 'rgb(0,255,0)'
+        ## The model state stays in the corner of the status bar
+        self.modelLabel = QLabel()
+        self.status.addPermanentWidget(self.modelLabel)
+        ## With --metrics the median/95th percentile stage latencies are
+        ## refreshed every second next to it
+        if self.metrics.enabled:
+            self.metricsLabel = QLabel()
+            self.status.addPermanentWidget(self.metricsLabel)
+            self._metricsTimer = QTimer()
+            self._metricsTimer.timeout.connect(self.updateMetrics)
+            self._metricsTimer.start(1000)
+        self._camView.loadModel()
 
 
     def createWidgets(self):
@@ -293,6 +461,9 @@ class MainWindow(QMainWindow):
         self.inputEdit.setReadOnly(True)
         self.translateEdit = QTextEdit()
         self.translateEdit.setReadOnly(True)
+        ## Signs are appended at the end of the widget, which only keeps the
+        ## end of a long session, and written to the transcript file
+        self.transcript = Transcript(self.translateEdit,stream=self._transcriptFile)
 
         
         self.buttonBox = QGridLayout()
@@ -322,6 +493,19 @@ class MainWindow(QMainWindow):
             self._camViewThread.start()
 
     
+    def showLatestFrame(self):
+        
+        """This function displays the newest frame posted by the capture
+           thread, if any.
+           
+           PARAMETERS:  self: self
+           
+           RETURNS: NONE"""
+        
+        data = self._camView.mailbox.take()
+        if data is not None:
+            self.updateImage(data)
+    
     @pyqtSlot(list)
     def updateImage(self,data):
         
@@ -330,8 +514,8 @@ class MainWindow(QMainWindow):
            
            PARAMETERS:  data: dict
                            a dict that contains the numpy array of one of the images 
-                           data from the Leap Sensor, and any translation that 
-                           has occured.
+                           data from the Leap Sensor, and the message for the
+                           status bar.
                            
            RETURNS:  NONE"""
 
@@ -339,13 +523,18 @@ class MainWindow(QMainWindow):
             if data["image"] is not None:
                 self.startCamBtn.hide()
                 self.stopCamBtn.show()
+                paintStart = perf_counter()
                 img = data["image"]
+                ## the QImage wraps the pooled buffer, the pixmap is reused
                 qimg = QImage(img.data,img.shape[1],img.shape[0],QImage.Format_Indexed8)
-                self._pixmap = QPixmap.fromImage(qimg)
+                if self._pixmap is None:
+                    self._pixmap = QPixmap.fromImage(qimg)
+                else:
+                    self._pixmap.convertFromImage(qimg)
                 self.imageView.setPixmap(self._pixmap)     
+                self.metrics.record("paint",perf_counter() - paintStart)
+                self._camView.releaseFrame(data)
                 self.updateStatusBar(data['Message'])
-                self.updateTextBox(data['Prediction'])
-                QApplication.processEvents()
                 #print self.imageViewL.frameGeometry().width()
                 #print self.imageViewL.frameGeometry().height()       
            
@@ -367,60 +556,31 @@ class MainWindow(QMainWindow):
                          
            RETURNS:   NONE"""
         
-        #print predict
-        currText = self.translateEdit.toPlainText()
-        
         if predict['Predict'] is not None:
-            newText = currText + str(predict['Predict'])
-            self.translateEdit.setText(newText)
+            self.transcript.append(str(predict['Predict']))
     
     def updateTextBoxnGram(self,predict):
         
-        """This function updates the QTextBox with the current predicted sign.
+        """This function appends the predicted sign to the letters and shows
+           them split into words.  The segmenter only keeps the words that can
+           still change, so each sign costs the same however long the text is.
         
            PARAMETERS: data: dict
                          a dictionary containing the predicted value
                          
            RETURNS:   NONE"""
         
-        #print predict
-        currText = self.inputEdit.text()
-        #print "CURR:",currText
-        #self.inputChar += str(predict['Predict'])
-        #print "INPUT:",self.inputChar
-        
-        if predict['Predict'] is not None:
-            self.inputChar += str(predict['Predict']).lower()
-            print "CURR:",currText
-            print "INPUT:",self.inputChar
-            newText = currText + self.inputChar
-            if len(self.inputChar) == 1:
-                self.inputEdit.setText(newText)
-            else:
-                self.inputEdit.setText(newText[:-2] + newText[-1])
-            
-            #last = ''
-            #curr = ''
-            #sent = ''
-
-#        for char in source:
-            #curr += char
-            if ngrams.correct(newText) != newText:
-                try:
-                    if ngrams.correct(self.lastWord+newText) != self.lastWord + newText:
-                        self.sentence += self.lastWord
-                        self.lastWord = ngrams.correct(newText[:-1])
-                        self.inputChar = self.inputChar
-                except:
-                    seg = ngrams.segment(self.lastWord+self.inputChar)
-                    self.sentence += seg[:-2][0]
-                    self.lastWord = seg[-2:-1][0]
-                    self.inputChar = seg[-1]
-            try:
-                print ngrams.segment(self.sentence+self.lastWord+self.inputChar)   
-                self.translateEdit.setText(ngrams.segment(self.sentence+self.lastWord+self.inputChar))
-            except:
-                pass
+        if predict['Predict'] is None:
+            return
+        if self._segmenter is None:
+            from ngrams import ngrams
+            self._segmenter = WordSegmenter.fromNgrams(ngrams)
+        words = self._segmenter.push(str(predict['Predict']).lower())
+        if words:
+            self.transcript.append(" ".join(words) + " ")
+        ## the words that can still change follow the committed text
+        self.transcript.setPending(" ".join(self._segmenter.tailWords()))
+        self.inputEdit.setText(self._segmenter.tail)
         
     def updateStatusBar(self,message):
         
@@ -442,8 +602,74 @@ class MainWindow(QMainWindow):
                 self.status.setStyleSheet("QStatusBar{background:%s}" % self._redColor)
             self.status.showMessage(message)
         
+    @pyqtSlot(str)
+    def updateModelStatus(self,message):
+        
+        """This function shows the state of the model in the status bar.
+        
+           PARAMETERS: message: string
+                           e.g. "Model loading..." or the load time"""
+        
+        self.modelLabel.setText(message)
+        
+    def closeEvent(self,event):
+        
+        """This function closes the transcript file with the window."""
+        
+        self.transcript.close()
+        super(MainWindow,self).closeEvent(event)
+        
+    def updateMetrics(self):
+        
+        """This function shows the latencies of the loop stages in the status
+           bar."""
+        
+        self.metricsLabel.setText(self.metrics.summary(METRICS_STAGES))
+        
 if __name__ == "__main__":
-    app=QApplication(sys.argv)
-    form = MainWindow()
-    form.show()
+    parser = argparse.ArgumentParser(description="ASL Translator")
+    parser.add_argument("--source",choices=["live","replay","synthetic"],default="live",
+                        help="where frames come from (default: the Leap sensor)")
+    parser.add_argument("--replay-dir",help="Serialized directory to replay")
+    parser.add_argument("--rate",type=float,help="frames per second of replay/synthetic sources")
+    parser.add_argument("--fast",action="store_true",help="produce frames as fast as they are read")
+    parser.add_argument("--hands",type=int,choices=[1,2],default=1,help="hands of the synthetic source")
+    parser.add_argument("--capture",choices=["listener","poll"],default="listener",
+                        help="receive frames from the source's callbacks, or poll it with a timer")
+    parser.add_argument("--profile-startup",action="store_true",
+                        help="print the import and init timings once the window is shown")
+    parser.add_argument("--metrics",action="store_true",
+                        help="show the latency of each loop stage in the status bar")
+    parser.add_argument("--metrics-file",
+                        help="append the stage latency histograms to this file (JSON lines) when the camera stops")
+    parser.add_argument("--transcript-file",
+                        help="append the translated text to this file (or named pipe) as it is signed")
+    parser.add_argument("--cache-step",type=float,default=1.0,
+                        help="quantization step in mm of the prediction cache, 0 disables it (default: 1.0)")
+    parser.add_argument("--cache-size",type=int,default=256,help="entries of the prediction cache")
+    parser.add_argument("--cache-verify",type=int,default=0,
+                        help="check every Nth cache hit against the model (default: never)")
+    args, qtArgs = parser.parse_known_args()
+    profile.mark("imports done")
+    with profile.stage("frame source"):
+        source = frame_sources.createFrameSource(args.source,args.replay_dir,args.rate,not args.fast,
+                                                 args.hands)
+    
+    with profile.stage("QApplication"):
+        app=QApplication(sys.argv[:1] + qtArgs)
+    with profile.stage("MainWindow"):
+        metrics = Metrics(enabled=args.metrics or bool(args.metrics_file))
+        cacheOptions = {"cacheStep":args.cache_step,"cacheSize":args.cache_size,
+                        "cacheVerify":args.cache_verify}
+        form = MainWindow(source=source,captureMode=args.capture,
+                          metrics=metrics,metricsFile=args.metrics_file,
+                          cacheOptions=cacheOptions,transcriptFile=args.transcript_file)
+    with profile.stage("show"):
+        form.show()
+    if args.profile_startup:
+        def reportStartup():
+            profile.mark("event loop started")
+            profile.report()
+        ## runs once the event loop has started and painted the window
+        QTimer.singleShot(0,reportStartup)
     app.exec_()
\ No newline at end of file
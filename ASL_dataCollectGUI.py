@@ -17,6 +17,10 @@ sys.path.insert(0,arch_dir)
 # add path to LEAPUTILS to sys path
 # I don't think this is the correct way to handle this
 sys.path.append(os.path.abspath('../'))
+## With --profile-startup every import below is timed
+from LEAPUTILS.startup_profile import profile
+if "--profile-startup" in sys.argv:
+    profile.enable()
 
 try:
     from PyQt4.QtCore import *
@@ -26,12 +30,7 @@ except ImportError:
     from PyQt5.QtGui import *
     from PyQt5.QtWidgets import *
 
-import ctypes
-import cv2
-import math
-import numpy as np
-import pandas as pd
-import scipy.misc
+import argparse
 import string
 import time
 
@@ -39,6 +38,11 @@ import time
 import Leap
 # import leap utilities created for this project
 import LEAPUTILS.leap_utilities as lutils
+import LEAPUTILS.frame_sources as frame_sources
+from LEAPUTILS.frame_mailbox import FrameMailbox
+from LEAPUTILS.frame_writer import FrameWriter
+from LEAPUTILS.image_pool import ImagePool
+from LEAPUTILS.image_store import ImageStore
 
 class FrameGrabber(QObject):
     
@@ -46,13 +50,32 @@ class FrameGrabber(QObject):
        the camera preview."""
     
     signalStatus = pyqtSignal(list)
+    ## carries new frame ids from the Leap listener thread into this thread
+    newFrame = pyqtSignal(object)
     
-    def __init__(self,parent=None):
+    def __init__(self,parent=None,source=None,captureMode="listener"):
         super(self.__class__,self).__init__(parent)
         
-        self.controller = Leap.Controller()
-        self.controller.set_policy_flags(Leap.Controller.POLICY_IMAGES)
+        ## The frame source is the live Leap.Controller unless a replay or
+        ## synthetic source is given (see frame_sources.py)
+        if source is None:
+            source = frame_sources.LeapFrameSource()
+        self.controller = source
         self.iBox = None
+        ## the hand checked and shown, set from the GUI's Handedness buttons
+        self.isRight = True
+        ## In listener mode the source calls back for each new frame, in poll
+        ## mode a QTimer reads the source
+        self._captureMode = captureMode
+        self._stats = frame_sources.CaptureStats(captureMode)
+        self._running = False
+        self._framePending = False
+        self.newFrame.connect(self.onNewFrame)
+        ## Preview images are copied into pooled buffers that stay valid
+        ## until the GUI releases them.  Preview frames are left in the
+        ## mailbox for the GUI to take at its display rate.
+        self.imagePool = ImagePool(slots=4)
+        self.mailbox = FrameMailbox(onDrop=self.releaseFrame)
         ## Cannot instantiate QTimer here.  It must be instantiated in the thread
         ## in which it will be used.  So we will instantiate it when calling
         ## the startCamera() function from the QThread that controls it.
@@ -61,16 +84,55 @@ class FrameGrabber(QObject):
     @pyqtSlot()
     def startCamera(self):
 
-        """This function instantiates a QTimer object that is used to call the
-           runCamLoop() function at an interval of 1ms.
+        """This function starts the capture.  In listener mode the frame source
+           calls frameArrived() for each new frame.  In poll mode a QTimer
+           object is instantiated that is used to call the runCamLoop()
+           function at an interval of 1ms.
            
            PARAMETERS:  self: self
            
            RETURNS: NONE"""        
         
-        self._timer = QTimer()
-        self._timer.timeout.connect(self.runCamLoop)
-        self._timer.start(1)
+        self._running = True
+        self._stats.reset()
+        self.mailbox.reset()
+        if self._captureMode == "listener":
+            self.controller.listen(self.frameArrived)
+        else:
+            self._timer = QTimer()
+            self._timer.timeout.connect(self.runCamLoop)
+            self._timer.start(1)
+    
+    def frameArrived(self,frameID):
+        
+        """This function is called from the frame source thread for each new
+           frame.  The frame id is forwarded to the capture thread unless a
+           frame is already waiting there, in which case the newer frame will
+           be read when the waiting one is handled.
+           
+           PARAMETERS:  frameID: integer
+                           the id of the new frame
+           
+           RETURNS: NONE"""
+        
+        if not self._framePending:
+            self._framePending = True
+            self.newFrame.emit(frameID)
+    
+    @pyqtSlot(object)
+    def onNewFrame(self,frameID):
+        
+        """This function runs the capture loop for a frame announced by the
+           frame source.
+           
+           PARAMETERS:  frameID: integer
+                           the id of the new frame
+           
+           RETURNS: NONE"""
+        
+        self._framePending = False
+        if self._running:
+            self.runCamLoop()
     
     def runCamLoop(self):
 
@@ -84,6 +146,7 @@ class FrameGrabber(QObject):
         
 
         frame = self.controller.frame()
+        self._stats.frameSeen(frame.id)
         if self.iBox is None:
             self.iBox = frame.interaction_box
 #        self.iBoxWidth = self.iBox.width # x-axis
@@ -93,10 +156,14 @@ class FrameGrabber(QObject):
 #        msg = ""
         if not frame.images.is_empty:
             images = frame.images
+            isRight = self.isRight
+            hand = lutils.findHand(frame.hands,isRight)
             if frame.hands.is_empty:
                 msg = "No Hands in Frame"
+            elif hand is None:
+                msg = "No %s Hand in Frame" % ("Right" if isRight else "Left")
             else:
-                palmPos = frame.hands[0].palm_position
+                palmPos = hand.palm_position
                 msg = lutils.putHandInIBox(palmPos,self.iBox)
 #                ## Assuming orientation is facing user,light down (bottom right corner),plug on left
 #                if palmPos.z > (self.iBoxCenter.z + (self.iBoxDepth / 2)):
@@ -126,18 +193,36 @@ class FrameGrabber(QObject):
 #                if msg == "":
 #                    msg = "Hand in position"
                 
-            limg,rimg = lutils.images_to_np_arrays(images)
-            self.signalStatus.emit([limg,rimg,msg])
+            ## one copy of the sensor images into a pooled slot
+            slot = self.imagePool.copyFrame(images)
+            if slot is not None:
+                limg,rimg = slot.images
+                ## the GUI takes the newest frame at its display rate
+                self.mailbox.put([limg,rimg,msg,slot])
 
         else:
             #sys.stdout.write("Stopped Camera")                    
             self.signalStatus.emit([])
         
+    def releaseFrame(self,images):
+        
+        """This function returns the image slot of a preview frame to the
+           pool once the frame has been displayed or dropped.
+           
+           PARAMETERS:  images: list
+                           the preview frame posted to the mailbox
+           
+           RETURNS: NONE"""
+        
+        if len(images) > 3:
+            self.imagePool.release(images[3])
+    
     @pyqtSlot()
     def stopCamera(self):
 
-        """This function stops the QTimer object that is calling the runCamLoop
-           function.  It then emits an empty signal that is used by the main event
+        """This function stops the frame source callbacks or the QTimer object
+           that is calling the runCamLoop function, and reports the capture
+           statistics.  It then emits an empty signal that is used by the main event
            loop so that it knows the status of the thread.
            
            PARAMETERS:  self: self
@@ -145,15 +230,25 @@ class FrameGrabber(QObject):
            RETURNS: NONE"""
         
         #sys.stdout.write("Stop Camera Called")
-        self._timer.stop()
+        self._running = False
+        if self._captureMode == "listener":
+            self.controller.stopListening()
+        else:
+            self._timer.stop()
+        sys.stdout.write(self._stats.summary() + "\n")
+        sys.stdout.write(self.mailbox.summary() + "\n")
+        self.mailbox.clear()
         self.signalStatus.emit([None])
 
 class MainWindow(QMainWindow):
     
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, source=None, captureMode="listener", imageFormat="jpeg",
+                 frameFormat="files", collectSource=None):
         super(MainWindow,self).__init__(parent)
 
         self.iBox = None
+        self._pixmapL = None
+        self._pixmapR = None
         self._dataPath = r"S:\DATA"
         self._dataFolders = ['Data','Images','Serialized']
         self._staticChars = list(string.ascii_uppercase)
@@ -162,21 +257,42 @@ class MainWindow(QMainWindow):
         self._staticChars.remove('J')
         self._staticChars.remove('Z')
         self._numFramesToCollect = 50
-        self._controller = Leap.Controller()
-        self._controller.set_policy_flags(Leap.Controller.POLICY_IMAGES)
-        self._camPreview = FrameGrabber()
+        if source is None:
+            source = frame_sources.LeapFrameSource()
+        ## Sources that are not realtime advance on each frame() call, so the
+        ## data collection reads its own source rather than the preview's
+        self._controller = source if collectSource is None else collectSource
+        ## Images and serialized frames are encoded and written in the background
+        self._writer = FrameWriter(workers=2,maxQueue=64)
+        ## With the "store" format the images of each user are appended to
+        ## one memory-mapped image store per session instead of JPEG files
+        self._imageFormat = imageFormat
+        self._imageStore = None
+        self._session = time.strftime("session_%Y%m%d_%H%M%S")
+        ## With the "container" format the serialized frames of each user are
+        ## appended to one container file per session instead of .data files
+        self._frameFormat = frameFormat
+        self._frameContainer = None
+        with profile.stage("FrameGrabber"):
+            self._camPreview = FrameGrabber(source=source,captureMode=captureMode)
         self._camPrevThread = QThread()
         
         self._camPreview.moveToThread(self._camPrevThread)
         self._camPrevThread.start()
         self._camPreview.signalStatus.connect(self.updateImage)
         
+        ## Preview frames are taken from the mailbox at the display rate
+        self._displayTimer = QTimer()
+        self._displayTimer.timeout.connect(self.showLatestFrame)
+        self._displayTimer.start(33)
+        
         self.mainWidget = QWidget()        
         self.gridLayout = QGridLayout()
 
         self.setWindowTitle("ASL Data Collection Interface")
         
-        self.createWidgets()
+        with profile.stage("createWidgets"):
+            self.createWidgets()
         
         ## Set the mainWidget layout to the grid layout
         self.mainWidget.setLayout(self.gridLayout)
@@ -301,6 +417,8 @@ class MainWindow(QMainWindow):
         self.leftHandBtn = QRadioButton("Left")
         self.rightHandBtn = QRadioButton("Right")
         self.rightHandBtn.setChecked(True)
+        ## the preview checks the same hand as the data collection
+        self.rightHandBtn.toggled.connect(self.setPreviewHand)
         
         self.charBox.addWidget(self.leftHandBtn,0,1,1,1)
         self.charBox.addWidget(self.rightHandBtn,0,2,1,1)
@@ -392,6 +510,19 @@ class MainWindow(QMainWindow):
             self._camPrevThread.start()
 
     
+    def showLatestFrame(self):
+        
+        """This function displays the newest frame posted by the capture
+           thread, if any.
+           
+           PARAMETERS:  self: self
+           
+           RETURNS: NONE"""
+        
+        images = self._camPreview.mailbox.take()
+        if images is not None:
+            self.updateImage(images)
+    
     @pyqtSlot(list)
     def updateImage(self,images):
         
@@ -400,22 +531,29 @@ class MainWindow(QMainWindow):
            
            PARAMETERS:  images: list
                            a list that contains the numpy arrays of the image 
-                           data from the Leap Sensor.
+                           data from the Leap Sensor, the status message and
+                           the pooled image slot, if any.
                            
            RETURNS:  NONE"""
        
         if images[0] is not None:
-            message = images[-1]
+            message = images[2]
             self.previewCamBtn.hide()
             self.stopCamBtn.show()
             limg = images[0]
             rimg = images[1]
+            ## the QImages wrap the pooled buffers, the pixmaps are reused
             qimgL = QImage(limg.data,limg.shape[1],limg.shape[0],QImage.Format_Indexed8)
             qimgR = QImage(rimg.data,rimg.shape[1],rimg.shape[0],QImage.Format_Indexed8)
-            self._pixmapL = QPixmap.fromImage(qimgL)
-            self._pixmapR = QPixmap.fromImage(qimgR)
+            if self._pixmapL is None:
+                self._pixmapL = QPixmap.fromImage(qimgL)
+                self._pixmapR = QPixmap.fromImage(qimgR)
+            else:
+                self._pixmapL.convertFromImage(qimgL)
+                self._pixmapR.convertFromImage(qimgR)
             self.imageViewL.setPixmap(self._pixmapL)     
             self.imageViewR.setPixmap(self._pixmapR) 
+            self._camPreview.releaseFrame(images)
             #print self.imageViewL.frameGeometry().width()
             #print self.imageViewL.frameGeometry().height()     
            
@@ -428,6 +566,13 @@ class MainWindow(QMainWindow):
             self.status.clearMessage()
             self.status.setStyleSheet("QStatusBar{background:%s}" % self._defaultColor)
     
+    def setPreviewHand(self,isRight):
+        
+        """This function selects the hand the preview checks, when the
+           Handedness buttons change."""
+        
+        self._camPreview.isRight = isRight
+
     def updateStatusBar(self,message):
         
         currMessage = self.status.currentMessage()
@@ -449,16 +594,26 @@ class MainWindow(QMainWindow):
         handInPos = True
         print "Collecting Data Called!!"
         count = 0
+        imagesOnly = 0
+        lastFrameID = None
         self.initOutputDirs()
         self.startCollectBtn.setText("Collecting Data...")
         self.startCollectBtn.setEnabled(False)
         QApplication.processEvents()
         while count < self._numFramesToCollect:
             while(not self._controller.is_connected):
-                print "connecting..."
-                pass
+                ## wait for the sensor to (re)connect without spinning
+                self.updateStatusBar("Waiting for the Leap Motion Sensor...")
+                QApplication.processEvents()
+                self._controller.waitForConnection(0.1)
 
             frame = self._controller.frame()
+            if frame.id == lastFrameID:
+                ## saving no longer slows the loop down, wait for a new frame
+                QApplication.processEvents()
+                time.sleep(0.002)
+                continue
+            lastFrameID = frame.id
             if self.iBox is None:
                 self.iBox = frame.interaction_box
 #            self.iBoxWidth = self.iBox.width # x-axis
@@ -470,10 +625,13 @@ class MainWindow(QMainWindow):
                 (not frame.hands.is_empty) and (not frame.fingers.is_empty)):
                 l_img, r_img = lutils.images_to_np_arrays(frame.images)
                 
-                if frame.hands.is_empty:
-                    msg = "No Hands in Frame"
+                ## with both hands in view, the selected hand is the one checked
+                isRight = self.rightHandBtn.isChecked()
+                hand = lutils.findHand(frame.hands,isRight)
+                if hand is None:
+                    msg = "No %s Hand in Frame" % ("Right" if isRight else "Left")
                 else:
-                    palmPos = frame.hands[0].palm_position
+                    palmPos = hand.palm_position
                     msg = lutils.putHandInIBox(palmPos,self.iBox)
 #                    ## Assuming orientation is facing user,light down (bottom right corner),plug on left
 #                    if palmPos.z > (self.iBoxCenter.z + (self.iBoxDepth / 2)):
@@ -510,9 +668,21 @@ class MainWindow(QMainWindow):
                 QApplication.processEvents()
                 if handInPos:
                     #serialized = lutils.serializeData(frame)
-                    self.saveData(frame,l_img,r_img,count)
+                    if not self.saveData(frame,l_img,r_img,count):
+                        imagesOnly += 1
                     count += 1
                     print "Count",count
+        self.updateStatusBar("Saving...")
+        QApplication.processEvents()
+        self._writer.flush()
+        if self._imageStore is not None:
+            self._imageStore.flush()
+        if self._frameContainer is not None:
+            self._frameContainer.flush()
+        if imagesOnly:
+            self.updateStatusBar("Data Collected (images only, %d frames could not be serialized)" % imagesOnly)
+        else:
+            self.updateStatusBar("Data Collected")
         self.startCollectBtn.setText("Collect Data")
         self.startCollectBtn.setEnabled(True)
         
@@ -520,26 +690,44 @@ class MainWindow(QMainWindow):
         
     def saveData(self,frame,limg,rimg,count):
         
+        """This function queues the images and the serialized frame for the
+           background writer.  It returns once the data is copied, and only
+           blocks when the writer has fallen too far behind.
+
+           RETURNS:      serialized: boolean
+                           False if the frame could not be serialized (frames
+                           of the synthetic source) and only the images were
+                           saved"""
+        
         frameDir = self.userDir + "\\Serialized"
         imgDir = self.userDir + "\\Images"
         
         character = str(self.charCombo.currentText())
         hand = "RH" if self.rightHandBtn.isChecked() else "LH"
+        if not hasattr(frame,"serialize"):
+            ## synthetic frames are not Leap.Frame objects, only the images are saved
+            serialized = None
+            serialPath = None
+        elif self._frameContainer is not None:
+            serialized = lutils.serializeFrame(frame)
+            ## appended here rather than by the writer to keep the frames in order
+            self._frameContainer.append(serialized,hand,character.upper(),count)
+            serialPath = None
+        else:
+            serialized = lutils.serializeFrame(frame)
+            fname = "%s_Frame_%s_%s.data" % (hand,str(count).zfill(3),character.upper())
+            serialPath = frameDir + "\\" + fname
+        if self._imageStore is not None:
+            self._imageStore.append((limg,rimg),character.upper(),hand,count,frame.id)
+            if serialPath is not None:
+                self._writer.writeFile(serialPath,serialized)
+            return serialized is not None
+        
         lname = "%s_Left_Image_%s_%s.jpg" % (hand,str(count).zfill(3),character.upper())
         rname = "%s_Right_Image_%s_%s.jpg" % (hand,str(count).zfill(3),character.upper())
-        scipy.misc.toimage(limg, cmin=np.min(limg), cmax=np.max(limg)).save(imgDir+"\\"+lname)
-        scipy.misc.toimage(rimg, cmin=np.min(rimg), cmax=np.max(rimg)).save(imgDir+"\\"+rname)
-
-        
-        fname = "%s_Frame_%s_%s.data" % (hand,str(count).zfill(3),character.upper())
-        serialized_tuple = frame.serialize
-        serialized_data = serialized_tuple[0]
-        serialized_length = serialized_tuple[1]
-        data_address = serialized_data.cast().__long__()
-        bfr = (ctypes.c_ubyte * serialized_length).from_address(data_address)
-        serialPath = frameDir + "\\" + fname
-        with open(serialPath, 'wb') as data_file:
-            data_file.write(bfr)
+        self._writer.saveFrame(imgDir+"\\"+lname,imgDir+"\\"+rname,limg,rimg,serialPath,
+                               serialized)
+        return serialized is not None
         
     def initOutputDirs(self):
         
@@ -557,6 +745,18 @@ class MainWindow(QMainWindow):
         else:
             userID = "User_" + str(self.userIDSpin.value()).zfill(2)
             self.userDir = self._dataPath + "\\" + userID
+        if self._imageFormat == "store":
+            storePath = self.userDir + "\\Images\\" + self._session
+            if self._imageStore is None or self._imageStore.path != storePath:
+                if self._imageStore is not None:
+                    self._imageStore.close()
+                self._imageStore = ImageStore(storePath,user=self.userIDSpin.value())
+        if self._frameFormat == "container":
+            containerPath = self.userDir + "\\Serialized\\" + self._session + ".frames"
+            if self._frameContainer is None or self._frameContainer.path != containerPath:
+                if self._frameContainer is not None:
+                    self._frameContainer.close()
+                self._frameContainer = lutils.FrameContainerWriter(containerPath)
         
 
     def closeEvent(self,event):
@@ -569,10 +769,50 @@ class MainWindow(QMainWindow):
                             The event that triggers the function (application close)"""
         
         self._camPrevThread.terminate()
+        self._writer.close()
+        if self._imageStore is not None:
+            self._imageStore.close()
+        if self._frameContainer is not None:
+            self._frameContainer.close()
         event.accept()
         
 if __name__ == "__main__":
-    app=QApplication(sys.argv)
-    form = MainWindow()
-    form.show()
+    parser = argparse.ArgumentParser(description="ASL Data Collection Interface")
+    parser.add_argument("--source",choices=["live","replay","synthetic"],default="live",
+                        help="where frames come from (default: the Leap sensor)")
+    parser.add_argument("--replay-dir",help="Serialized directory to replay")
+    parser.add_argument("--rate",type=float,help="frames per second of replay/synthetic sources")
+    parser.add_argument("--fast",action="store_true",help="produce frames as fast as they are read")
+    parser.add_argument("--capture",choices=["listener","poll"],default="listener",
+                        help="receive frames from the source's callbacks, or poll it with a timer")
+    parser.add_argument("--profile-startup",action="store_true",
+                        help="print the import and init timings once the window is shown")
+    parser.add_argument("--image-format",choices=["jpeg","store"],default="jpeg",
+                        help="save images as JPEG files, or append them to a memory-mapped image store")
+    parser.add_argument("--frame-format",choices=["files","container"],default="files",
+                        help="save each serialized frame to its own .data file, or append them to one container per session")
+    args, qtArgs = parser.parse_known_args()
+    profile.mark("imports done")
+    with profile.stage("frame source"):
+        source = frame_sources.createFrameSource(args.source,args.replay_dir,args.rate,not args.fast)
+        ## the Leap controller can be shared, a replay or synthetic source is
+        ## created again so that the preview does not consume collected frames
+        collectSource = None
+        if args.source != "live":
+            collectSource = frame_sources.createFrameSource(args.source,args.replay_dir,args.rate,
+                                                            not args.fast)
+    
+    with profile.stage("QApplication"):
+        app=QApplication(sys.argv[:1] + qtArgs)
+    with profile.stage("MainWindow"):
+        form = MainWindow(source=source,captureMode=args.capture,imageFormat=args.image_format,
+                          frameFormat=args.frame_format,collectSource=collectSource)
+    with profile.stage("show"):
+        form.show()
+    if args.profile_startup:
+        def reportStartup():
+            profile.mark("event loop started")
+            profile.report()
+        ## runs once the event loop has started and painted the window
+        QTimer.singleShot(0,reportStartup)
     app.exec_()
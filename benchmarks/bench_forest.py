@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Benchmark of the per frame model latency.  Compares predict_proba of the
+    RandomForest with the FlatForest made from it, for one row at a time as
+    in the translator and for a batch, and checks that the probabilities are
+    identical.  Without --model, a forest is trained on synthetic features
+    with the size of the translator's (34 signs, 325 distances).  The
+    forest, and a small one with letter labels as the translator's, are also
+    saved and mapped back with FlatForest.save and load.
+
+    usage: python bench_forest.py [--model MODEL.pkl] [--rows N] [--repeat R]
+"""
+
+import argparse
+import os
+import shutil
+import string
+import sys
+import tempfile
+from timeit import default_timer
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from flat_forest import FlatForest
+from model_loader import loadModel
+
+
+def syntheticForest(numClasses=34, numFeatures=325, numSamples=5000, trees=100, seed=0,
+                    labels=None):
+    # class centers with noise, the trees come out about as deep as on real data
+    from sklearn.ensemble import RandomForestClassifier
+
+    rng = np.random.RandomState(seed)
+    centers = rng.rand(numClasses, numFeatures) * 100
+    y = rng.randint(0, numClasses, numSamples)
+    X = centers[y] + rng.randn(numSamples, numFeatures) * 15
+    if labels is not None:
+        # e.g. the letters of the translator, stored by sklearn as objects
+        y = np.array(list(labels), dtype=object)[y]
+    return RandomForestClassifier(trees, random_state=seed).fit(X, y), centers
+
+
+def checkRoundTrip(forest, flat, X):
+    # the forest is saved, mapped back, and predicts as the original
+    path = tempfile.mkdtemp()
+    try:
+        flat.save(path)
+        loaded = FlatForest.load(path)
+        assert np.array_equal(loaded.predict_proba(X), forest.predict_proba(X))
+        assert list(loaded.predict(X)) == list(forest.predict(X))
+    finally:
+        shutil.rmtree(path)
+
+
+def timeCalls(fn, rows, repeat):
+    # best of 'repeat' passes over the rows, per call
+    best = None
+    for r in range(repeat):
+        start = default_timer()
+        for row in rows:
+            fn(row)
+        elapsed = (default_timer() - start) / len(rows)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RandomForest latency benchmark")
+    parser.add_argument("--model", help="model saved with joblib.dump (default: synthetic)")
+    parser.add_argument("--rows", type=int, default=200, help="rows predicted one at a time")
+    parser.add_argument("--repeat", type=int, default=3, help="passes, the best is reported")
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(1)
+    if args.model:
+        forest = loadModel(args.model, None)
+        X = rng.rand(args.rows, forest.n_features_) * 100
+    else:
+        forest, centers = syntheticForest()
+        X = centers[rng.randint(0, len(centers), args.rows)] + rng.randn(args.rows, centers.shape[1]) * 15
+    X = X.astype(np.float32)
+    start = default_timer()
+    flat = FlatForest.fromForest(forest)
+    sys.stdout.write("%d trees, %d nodes, flattened in %.2f s\n" %
+                     (flat.n_estimators, len(flat.left), default_timer() - start))
+
+    rows = [X[i:i + 1] for i in range(len(X))]
+    for row in rows:
+        assert np.array_equal(flat.predict_proba(row), forest.predict_proba(row))
+    assert np.array_equal(flat.predict_proba(X), forest.predict_proba(X))
+    checkRoundTrip(forest, flat, X)
+    letters, centers = syntheticForest(numClasses=24, numFeatures=20, numSamples=500, trees=10,
+                                       labels=string.ascii_uppercase[:24])
+    letterX = (centers[rng.randint(0, len(centers), 50)] + rng.randn(50, 20) * 15).astype(np.float32)
+    checkRoundTrip(letters, FlatForest.fromForest(letters), letterX)
+
+    single = timeCalls(forest.predict_proba, rows, args.repeat)
+    singleFlat = timeCalls(flat.predict_proba, rows, args.repeat)
+    batch = timeCalls(forest.predict_proba, [X], args.repeat)
+    batchFlat = timeCalls(flat.predict_proba, [X], args.repeat)
+    sys.stdout.write("%-30s %12s %12s\n" % ("", "sklearn", "FlatForest"))
+    sys.stdout.write("%-30s %9.3f ms %9.3f ms\n" % ("one row per call", single * 1e3, singleFlat * 1e3))
+    sys.stdout.write("%-30s %9.3f ms %9.3f ms\n" % ("%d rows in one call" % len(X), batch * 1e3, batchFlat * 1e3))
+    sys.stdout.write("probabilities identical for all %d rows, also after save and load\n" % len(X))
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Benchmark of the motion detection in leap_utilities.  Compares the per
+    finger Python loop that handMoving/handChanged used before, the scalar
+    functions on SDK hands and on the HandSnapshots of the live pipeline, and
+    the batch functions handsMoving/handsChanged, both for live use (one hand
+    per call) and for offline reprocessing of a recorded session (all frames
+    in one call).  Hands come from the synthetic frame source, so
+    no sensor is required.
+
+    usage: python bench_motion.py [--frames N] [--repeat R]
+"""
+
+import argparse
+import os
+import sys
+from timeit import default_timer
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import frame_sources
+import leap_utilities as lutils
+from hand_snapshot import HandSnapshot
+
+
+def _loopHandMoving(hand):
+    # the per finger loop formerly used by lutils.handMoving
+    v = hand.palm_velocity
+    if np.sqrt(v.x**2 + v.y**2 + v.z**2) > lutils.SPEEDTHRESH:
+        return True
+    for i in range(0,5):
+        v = hand.fingers[i].tip_velocity
+        if np.sqrt(v.x**2 + v.y**2 + v.z**2) > lutils.SPEEDTHRESH:
+            return True
+    return False
+
+
+def _loopHandChanged(pHand, cHand):
+    # the per finger loop formerly used by lutils.handChanged
+    p, c = pHand.palm_position, cHand.palm_position
+    if lutils.distanceR3(p.x,c.x,p.y,c.y,p.z,c.z) > lutils.MOVETHRESH:
+        return True
+    for i in range(0,5):
+        p, c = pHand.fingers[i].tip_position, cHand.fingers[i].tip_position
+        if lutils.distanceR3(p.x,c.x,p.y,c.y,p.z,c.z) > lutils.MOVETHRESH:
+            return True
+    return False
+
+
+def _best(func, repeat):
+    times = []
+    for r in range(repeat):
+        start = default_timer()
+        result = func()
+        times.append(default_timer() - start)
+    return min(times), result
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Motion detection benchmark")
+    parser.add_argument("--frames", type=int, default=2000, help="number of frames")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions, the best is kept")
+    args = parser.parse_args(argv)
+
+    source = frame_sources.SyntheticFrameSource(realtime=False)
+    hands = [source.frame().hands[0] for i in range(args.frames)]
+    pairs = list(zip(hands[:-1], hands[1:]))
+    snapshots = [HandSnapshot.fromHand(h) for h in hands]
+    snapshotPairs = list(zip(snapshots[:-1], snapshots[1:]))
+    positions = np.array([lutils.handPositions(h) for h in hands])
+    velocities = np.array([lutils.handVelocities(h) for h in hands])
+
+    rows = []
+    t, loopMoving = _best(lambda: [_loopHandMoving(h) for h in hands], args.repeat)
+    rows.append(("handMoving, per finger loop", t, len(hands)))
+    t, scalarMoving = _best(lambda: [lutils.handMoving(h) for h in hands], args.repeat)
+    rows.append(("handMoving, SDK hand", t, len(hands)))
+    t, snapshotMoving = _best(lambda: [lutils.handMoving(s) for s in snapshots], args.repeat)
+    rows.append(("handMoving, HandSnapshot", t, len(hands)))
+    t, arrayMoving = _best(lambda: [bool(lutils.handsMoving(v)) for v in velocities], args.repeat)
+    rows.append(("handsMoving, one array per call", t, len(hands)))
+    t, batchMoving = _best(lambda: lutils.handsMoving(velocities), args.repeat)
+    rows.append(("handsMoving, batch of arrays", t, len(hands)))
+
+    t, loopChanged = _best(lambda: [_loopHandChanged(p, c) for p, c in pairs], args.repeat)
+    rows.append(("handChanged, per finger loop", t, len(pairs)))
+    t, scalarChanged = _best(lambda: [lutils.handChanged(p, c) for p, c in pairs], args.repeat)
+    rows.append(("handChanged, SDK hands", t, len(pairs)))
+    t, snapshotChanged = _best(lambda: [lutils.handChanged(p, c) for p, c in snapshotPairs],
+                               args.repeat)
+    rows.append(("handChanged, HandSnapshots", t, len(pairs)))
+    t, arrayChanged = _best(lambda: [bool(lutils.handsChanged(p, c)) for p, c in
+                                     zip(positions[:-1], positions[1:])], args.repeat)
+    rows.append(("handsChanged, one array per call", t, len(pairs)))
+    t, batchChanged = _best(lambda: lutils.handsChanged(positions[:-1], positions[1:]), args.repeat)
+    rows.append(("handsChanged, batch of arrays", t, len(pairs)))
+
+    assert list(batchMoving) == arrayMoving == loopMoving == scalarMoving == snapshotMoving
+    assert list(batchChanged) == arrayChanged == loopChanged == scalarChanged == snapshotChanged
+
+    sys.stdout.write("%-32s %14s\n" % ("stage", "us per frame"))
+    for name, t, n in rows:
+        sys.stdout.write("%-32s %14.2f\n" % (name, 1e6 * t / n))
+
+
+if __name__ == "__main__":
+    main()
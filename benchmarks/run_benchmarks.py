@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Benchmark suite of the translation pipeline.  Runs without a sensor, on
+    synthetic frames or on a replayed Serialized directory, and times each
+    stage of FrameGrabber.runCamLoop:
+
+        snapshot        HandSnapshot.fromHand
+        putHandInIBox   the interaction box check
+        handMoving      the still hand check
+        handChanged     the pose change check
+        features        FeatureEngine.transformSnapshots
+        inference       SignPredictor.predict, one row per call
+        cachedInference CachedPredictor.predict on consecutive frames
+        debounce        SignDebouncer.push
+        preview         ImagePool.copyFrame and release
+        updateTextBox   Transcript.append of a sign to the text box (needs PyQt)
+
+    and the whole loop (pipeline.SignPipeline and the preview copy), with
+    synchronous inference, in frames per second.
+    Stage results are in microseconds per call.
+
+    Results can be saved as a JSON baseline, and a later run compared with
+    it:  the run fails (exit status 1) if a stage is slower than the baseline
+    by more than the threshold, or the pipeline rate lower.  Baselines are
+    only comparable on the same machine, with the same frames and model:  a
+    baseline recorded with another configuration is refused (exit status 2).
+
+    Without --model, a forest is trained on the synthetic poses.  With
+    --model, the features are those of the model's schema (--features, or
+    the <model>_features.npz file written by features.py), and the run stops
+    if there is no schema matching the model.
+
+    usage: python run_benchmarks.py [--source synthetic|replay] [--replay-dir DIR] [--hands 1|2]
+                                    [--frames N] [--repeat R] [--model MODEL]
+                                    [--features SCHEMA.npz]
+                                    [--save-baseline FILE] [--baseline FILE]
+                                    [--threshold 0.2]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import frame_sources
+import leap_utilities as lutils
+from debounce import SignDebouncer
+from features import FeatureEngine, loadSchema, schemaFile
+from hand_snapshot import HandSnapshot
+from image_pool import ImagePool
+from inference import SignPredictor, CachedPredictor
+from model_loader import loadModel
+from pipeline import SignPipeline
+from transcript import Transcript
+
+# results that must match for a baseline to be comparable
+CONFIG_KEYS = ("machine", "python", "source", "replay_dir", "frames", "hands", "model", "features")
+
+
+def loadFrames(args):
+    # the frames are read once, so that the source is not timed
+    if args.source == "replay":
+        source = frame_sources.ReplayFrameSource(args.replay_dir, realtime=False)
+    else:
+        source = frame_sources.SyntheticFrameSource(realtime=False, numHands=args.hands)
+    frames = []
+    while len(frames) < args.frames and source.is_connected:
+        frame = source.frame()
+        if not frame.hands.is_empty:
+            frames.append(frame)
+    return frames, source
+
+
+def syntheticModel(engine, trees=50):
+    # one class per synthetic pose, trained on the held frames
+    from sklearn.ensemble import RandomForestClassifier
+
+    source = frame_sources.SyntheticFrameSource(realtime=False, numPoses=26,
+                                                holdFrames=60, moveFrames=20)
+    snapshots, labels = [], []
+    for index in range(26 * 80):
+        frame = source.frame()
+        if index % 80 < 60:
+            snapshots.append(HandSnapshot.fromHand(frame.hands[0], frame.id))
+            labels.append(chr(ord('A') + index // 80))
+    X = engine.transformSnapshots(snapshots)
+    return RandomForestClassifier(trees, random_state=0).fit(X, labels)
+
+
+def timeStage(fn, items, repeat):
+    # best of 'repeat' passes, in microseconds per item
+    best = None
+    for r in range(repeat):
+        start = default_timer()
+        for item in items:
+            fn(item)
+        elapsed = (default_timer() - start) / len(items)
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e6
+
+
+def textBoxStage(repeat):
+    # FrameGrabber.signalPrediction -> MainWindow.updateTextBox, on a widget
+    try:
+        from PyQt5.QtWidgets import QApplication, QTextEdit
+    except ImportError:
+        try:
+            from PyQt4.QtGui import QApplication, QTextEdit
+        except ImportError:
+            return None
+    app = QApplication.instance() or QApplication(["run_benchmarks", "-platform", "offscreen"])
+    edit = QTextEdit()
+    transcript = Transcript(edit)
+    predictions = [{'Predict': chr(ord('A') + i % 26)} for i in range(2000)]
+
+    def updateTextBox(predict):
+        if predict['Predict'] is not None:
+            transcript.append(str(predict['Predict']))
+
+    best = None
+    for r in range(repeat):
+        transcript.clear()
+        result = timeStage(updateTextBox, predictions, 1)
+        best = result if best is None else min(best, result)
+    return best
+
+
+def runBenchmarks(args):
+    frames, source = loadFrames(args)
+    if not frames:
+        raise ValueError("No frames with hands to benchmark")
+    iBox = frames[0].interaction_box
+    featuresFile = None
+    if args.model:
+        model = loadModel(args.model, None)
+        # the schema saved next to the model, as in the translator
+        featuresFile = args.features or schemaFile(args.model)
+        engine = loadSchema(featuresFile, model)
+    else:
+        engine = FeatureEngine()
+        model = syntheticModel(engine)
+    predictor = SignPredictor(model, topK=3)
+
+    snapshots = [HandSnapshot.fromHand(f.hands[0], f.id) for f in frames]
+    pairs = list(zip(snapshots[:-1], snapshots[1:]))
+    features = [engine.transformSnapshots(s) for s in snapshots]
+    predictions = [predictor.predict(f) for f in features[:200]]
+    debouncer = SignDebouncer(window=5, votes=3)
+    pool = ImagePool(slots=4)
+
+    def debounce(prediction):
+        if debouncer.push(prediction) is not None:
+            debouncer.reset()
+
+    def preview(frame):
+        slot = pool.copyFrame(frame.images)
+        if slot is not None:
+            pool.release(slot)
+
+    def cachedPass(rows):
+        # a cold cache per pass, as when the translator starts
+        cached = CachedPredictor(predictor)
+        for row in rows:
+            cached.predict(row)
+
+    r = args.repeat
+    stages = {
+        "snapshot": timeStage(lambda f: HandSnapshot.fromHand(f.hands[0], f.id), frames, r),
+        "putHandInIBox": timeStage(lambda s: lutils.putHandInIBox(s.palmPosition, iBox), snapshots, r),
+        "handMoving": timeStage(lutils.handMoving, snapshots, r),
+        "handChanged": timeStage(lambda p: lutils.handChanged(p[0], p[1]), pairs, r),
+        "features": timeStage(engine.transformSnapshots, snapshots, r),
+        "inference": timeStage(predictor.predict, features[:200], r),
+        "cachedInference": timeStage(cachedPass, [features], r) / len(features),
+        "debounce": timeStage(debounce, predictions, r),
+        "preview": timeStage(preview, frames, r),
+    }
+    textBox = textBoxStage(r)
+    if textBox is not None:
+        stages["updateTextBox"] = textBox
+
+    best = None
+    for i in range(r):
+        pipeline = SignPipeline(predictor, engine)
+        start = default_timer()
+        for frame in frames:
+            pipeline.process(frame)
+            preview(frame)
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {"machine": platform.node(),
+            "python": platform.python_version(),
+            "source": args.source,
+            "replay_dir": args.replay_dir,
+            "frames": len(frames),
+            "hands": args.hands,
+            "model": args.model or "synthetic",
+            "features": featuresFile,
+            "stages_us": stages,
+            "pipeline_fps": len(frames) / best}
+
+
+def incompatible(results, baseline):
+
+    """This function lists the configuration entries in which a baseline
+       differs from the results.  A baseline saved before an entry was
+       recorded differs in it.
+
+       RETURNS:      differences: list of string"""
+
+    return ["%s: %s, baseline %s" % (key, results.get(key), baseline.get(key, "not recorded"))
+            for key in CONFIG_KEYS if results.get(key) != baseline.get(key)]
+
+
+def compare(results, baseline, threshold):
+
+    """This function lists the stages that regressed.
+
+       RETURNS:      regressions: list of string"""
+
+    regressions = []
+    for name, value in sorted(results["stages_us"].items()):
+        old = baseline["stages_us"].get(name)
+        if old is not None and value > old * (1.0 + threshold):
+            regressions.append("%s: %.1f us, baseline %.1f us (+%.0f%%)" %
+                               (name, value, old, (value / old - 1.0) * 100))
+    old = baseline.get("pipeline_fps")
+    fps = results["pipeline_fps"]
+    if old is not None and fps < old / (1.0 + threshold):
+        regressions.append("pipeline: %.0f fps, baseline %.0f fps (-%.0f%%)" %
+                           (fps, old, (1.0 - fps / old) * 100))
+    return regressions
+
+
+def report(results, baseline=None):
+    sys.stdout.write("%d %s frames, model: %s\n" % (results["frames"], results["source"], results["model"]))
+    for name, value in sorted(results["stages_us"].items(), key=lambda s: -s[1]):
+        line = "  %-16s %10.1f us" % (name, value)
+        if baseline is not None and name in baseline["stages_us"]:
+            line += "   baseline %10.1f us" % baseline["stages_us"][name]
+        sys.stdout.write(line + "\n")
+    line = "  %-16s %10.0f fps" % ("pipeline", results["pipeline_fps"])
+    if baseline is not None and "pipeline_fps" in baseline:
+        line += "  baseline %10.0f fps" % baseline["pipeline_fps"]
+    sys.stdout.write(line + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Translation pipeline benchmarks")
+    parser.add_argument("--source", choices=["synthetic", "replay"], default="synthetic")
+    parser.add_argument("--replay-dir", help="Serialized directory to replay")
+    parser.add_argument("--hands", type=int, choices=[1, 2], default=1,
+                        help="hands of the synthetic frames, the pipeline predicts both at once")
+    parser.add_argument("--frames", type=int, default=1000, help="frames with a hand to use")
+    parser.add_argument("--repeat", type=int, default=3, help="passes, the best is kept")
+    parser.add_argument("--model", help="model file or FlatForest directory (default: synthetic)")
+    parser.add_argument("--features", help="feature schema of the model (default: <model>_features.npz, "
+                        "created by features.py)")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON baseline to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="accepted slowdown against the baseline (default: 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    try:
+        results = runBenchmarks(args)
+    except ValueError as error:
+        sys.exit(str(error))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    report(results, baseline)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+    if baseline is not None:
+        differences = incompatible(results, baseline)
+        for difference in differences:
+            sys.stdout.write("INCOMPATIBLE BASELINE %s\n" % difference)
+        if differences:
+            sys.exit(2)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            sys.stdout.write("REGRESSION %s\n" % regression)
+        if regressions:
+            sys.exit(1)
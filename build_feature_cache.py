@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Builds the feature cache used for training.  The serialized frames of
+    every User_XX\\Serialized directory below the data directory are
+    deserialized and converted to distance features on a process pool, and
+    the features are written to one .npz file per user, character and hand:
+
+        <cache>\\User_01\\RH_A.npz    features (N,P) float32, files, counts,
+                                     frameIDs and the column names
+
+    manifest.json records the size and modification time of every frame file
+    that was processed.  On a rebuild only new or changed files are
+    extracted, the rows of unchanged files are taken from the existing cache,
+    and rows of deleted files are dropped.  Changing the feature schema
+    rebuilds everything.
+
+    usage: python build_feature_cache.py [--data S:\\DATA] [--cache DIR]
+                                         [--features SCHEMA.npz] [--workers N]
+                                         [--force]
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+from timeit import default_timer
+
+import numpy as np
+
+from features import FeatureEngine
+from frame_sources import FRAME_FILE_RE
+
+MANIFEST_FILE = "manifest.json"
+USER_DIR_RE = re.compile(r"^User_\d+$")
+# frame files per pool task, large enough to amortize the controller setup
+CHUNK_SIZE = 64
+
+_engine = None
+
+
+def _initWorker(pairs, columns):
+    global _engine
+    _engine = FeatureEngine(pairs, columns)
+
+
+def _extractChunk(paths):
+
+    """This function runs in a pool process.  It deserializes the frames of
+       'paths' and computes the features of the hand named by each file (RH
+       or LH), or of the first hand if the file name does not say.  A file
+       that cannot be read, or whose named hand is not in the frame, is
+       skipped with the reason, so that it does not stop the other files.
+
+       RETURNS:      results: list of tuple
+                       (path, features or None, frameID, skipped) for each
+                       file.  features is None for frames without hands and
+                       for skipped files, skipped is None or the reason"""
+
+    import leap_utilities as lutils
+
+    results = []
+    snapshots = []
+
+    def unreadable(path, error):
+        results.append([path, None, -1, "unreadable: %s" % error])
+
+    for path, hands in lutils.iterDeserialize(paths, snapshots=True, onError=unreadable):
+        if hands:
+            hand = _labelledHand(path, hands)
+            if hand is None:
+                results.append([path, None, -1, "labelled hand not in the frame"])
+                continue
+            results.append([path, len(snapshots), hand.frameID, None])
+            snapshots.append(hand)
+        else:
+            results.append([path, None, -1, None])
+    if snapshots:
+        features = _engine.transformSnapshots(snapshots)
+        if features.ndim == 1:
+            features = features[np.newaxis]
+        for result in results:
+            if result[1] is not None:
+                result[1] = features[result[1]]
+
+    return [tuple(result) for result in results]
+
+
+def _labelledHand(path, hands):
+    # the hand the frame was recorded for, None if it is not in the frame
+    match = FRAME_FILE_RE.match(os.path.basename(path))
+    if match is None:
+        return hands[0]
+    isRight = match.group("hand") == "RH"
+    for hand in hands:
+        if hand.isRight == isRight:
+            return hand
+    return None
+
+
+def schemaKey(engine):
+    # identifies the feature schema, a new schema invalidates the cache
+    digest = hashlib.sha1(engine.pairs.astype(np.int64).tobytes())
+    digest.update("\n".join(engine.columns).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def scanFrames(dataPath):
+
+    """This function finds the serialized frames below the data directory.
+
+       PARAMETERS:   dataPath: string
+                       the directory holding the User_XX directories
+
+       RETURNS:      groups: dictionary
+                       (user, char, hand) -> list of (name, path, count,
+                       size, mtime), sorted by count"""
+
+    groups = {}
+    for user in sorted(os.listdir(dataPath)):
+        serialDir = os.path.join(dataPath, user, "Serialized")
+        if not USER_DIR_RE.match(user) or not os.path.isdir(serialDir):
+            continue
+        for name in os.listdir(serialDir):
+            match = FRAME_FILE_RE.match(name)
+            if match is None:
+                continue
+            path = os.path.join(serialDir, name)
+            stat = os.stat(path)
+            key = (user, match.group("char"), match.group("hand"))
+            groups.setdefault(key, []).append((name, path, int(match.group("count")),
+                                               stat.st_size, stat.st_mtime))
+    for files in groups.values():
+        files.sort(key=lambda f: f[2])
+
+    return groups
+
+
+def cacheFile(cachePath, key):
+    user, char, hand = key
+    return os.path.join(cachePath, user, "%s_%s.npz" % (hand, char))
+
+
+def loadCache(cachePath):
+
+    """This function loads every cached group, for training.
+
+       PARAMETERS:   cachePath: string
+                       the cache directory
+
+       RETURNS:      features: numpy.ndarray
+                       (N,P) feature rows
+
+                     labels: numpy.ndarray
+                       (N,) character of each row
+
+                     hands: numpy.ndarray
+                       (N,) 'LH' or 'RH'
+
+                     users: numpy.ndarray
+                       (N,) user directory name
+
+                     columns: list of string
+                       the column names"""
+
+    with open(os.path.join(cachePath, MANIFEST_FILE)) as manifest_file:
+        manifest = json.load(manifest_file)
+    features, labels, hands, users = [], [], [], []
+    columns = manifest["columns"]
+    for entry in manifest["groups"]:
+        with np.load(os.path.join(cachePath, entry["file"])) as group:
+            rows = group["features"]
+        features.append(rows)
+        labels.extend([entry["char"]] * len(rows))
+        hands.extend([entry["hand"]] * len(rows))
+        users.extend([entry["user"]] * len(rows))
+    if features:
+        features = np.concatenate(features)
+    else:
+        features = np.zeros((0, len(columns)), dtype=np.float32)
+
+    return features, np.array(labels), np.array(hands), np.array(users), columns
+
+
+def buildCache(dataPath, cachePath, engine, workers=None, force=False):
+
+    """This function brings the cache up to date with the data directory.
+
+       PARAMETERS:   dataPath: string
+                       the directory holding the User_XX directories
+
+                     cachePath: string
+                       the cache directory, created if needed
+
+                     engine: FeatureEngine
+                       the feature schema
+
+                     workers: integer
+                       pool processes, defaults to the number of CPUs
+
+                     force: boolean
+                       ignore the existing cache
+
+       RETURNS:      stats: dictionary
+                       counts of the files extracted, reused and dropped and
+                       of the groups written, and the list of (path, reason)
+                       of the files skipped.  Skipped files are extracted
+                       again on the next build"""
+
+    schema = schemaKey(engine)
+    manifestPath = os.path.join(cachePath, MANIFEST_FILE)
+    seen = {}
+    previousGroups = []
+    if not force and os.path.exists(manifestPath):
+        with open(manifestPath) as manifest_file:
+            manifest = json.load(manifest_file)
+        previousGroups = manifest["groups"]
+        if manifest.get("schema") == schema:
+            seen = manifest["files"]
+
+    groups = scanFrames(dataPath)
+    stats = {"extracted": 0, "reused": 0, "dropped": 0, "written": 0, "skipped": []}
+    work = []
+    kept = {}
+    cachedRows = {}
+    current = set()
+    for key, files in groups.items():
+        fname = cacheFile(cachePath, key)
+        old = {}
+        if os.path.exists(fname):
+            unchanged = set(f[0] for f in files
+                            if seen.get(_relName(key, f[0])) == [f[3], f[4]])
+            with np.load(fname) as group:
+                cachedRows[key] = len(group["files"])
+                for name, row, frameID in zip(group["files"], group["features"], group["frameIDs"]):
+                    if str(name) in unchanged:
+                        old[str(name)] = (row, int(frameID))
+        else:
+            unchanged = set()
+        kept[key] = old
+        work.extend(f[1] for f in files if f[0] not in unchanged)
+        stats["reused"] += len(unchanged)
+        current.update(_relName(key, f[0]) for f in files)
+    stats["dropped"] = len([name for name in seen if name not in current])
+
+    results = {}
+    if work:
+        chunks = [work[i:i + CHUNK_SIZE] for i in range(0, len(work), CHUNK_SIZE)]
+        pool = multiprocessing.Pool(workers, _initWorker, (engine.pairs, engine.columns))
+        try:
+            for chunk in pool.imap_unordered(_extractChunk, chunks):
+                for path, features, frameID, skipped in chunk:
+                    if skipped is not None:
+                        stats["skipped"].append((path, skipped))
+                        continue
+                    results[path] = (features, frameID)
+        finally:
+            pool.close()
+            pool.join()
+    stats["extracted"] = len(work) - len(stats["skipped"])
+    skipped = set(path for path, reason in stats["skipped"])
+
+    files = {}
+    entries = []
+    for key in sorted(groups):
+        fname = cacheFile(cachePath, key)
+        changed = False
+        names, rows, counts, frameIDs = [], [], [], []
+        for name, path, count, size, mtime in groups[key]:
+            if path in skipped:
+                # not recorded, so that the file is tried again
+                continue
+            files[_relName(key, name)] = [size, mtime]
+            if path in results:
+                changed = True
+                features, frameID = results[path]
+            else:
+                # unchanged, or a frame without hands
+                features, frameID = kept[key].get(name, (None, -1))
+            if features is None:
+                continue
+            names.append(name)
+            rows.append(features)
+            counts.append(count)
+            frameIDs.append(frameID)
+        if changed or len(names) != cachedRows.get(key):
+            _writeGroup(fname, engine, names, rows, counts, frameIDs)
+            stats["written"] += 1
+        entries.append({"user": key[0], "char": key[1], "hand": key[2], "rows": len(names),
+                        "file": os.path.relpath(fname, cachePath)})
+    # groups whose frames were all deleted
+    for entry in previousGroups:
+        if (entry["user"], entry["char"], entry["hand"]) not in groups:
+            fname = os.path.join(cachePath, entry["file"])
+            if os.path.exists(fname):
+                os.remove(fname)
+
+    manifest = {"schema": schema, "columns": engine.columns, "files": files, "groups": entries}
+    if not os.path.isdir(cachePath):
+        os.makedirs(cachePath)
+    with open(manifestPath + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    _replace(manifestPath + ".tmp", manifestPath)
+
+    return stats
+
+
+def _relName(key, name):
+    # manifest key of a frame file, relative to the data directory
+    return os.path.join(key[0], "Serialized", name)
+
+
+def _writeGroup(fname, engine, names, rows, counts, frameIDs):
+    if not os.path.isdir(os.path.dirname(fname)):
+        os.makedirs(os.path.dirname(fname))
+    if rows:
+        features = np.array(rows, dtype=np.float32)
+    else:
+        features = np.zeros((0, engine.numFeatures), dtype=np.float32)
+    tmp = fname + ".tmp.npz"
+    np.savez(tmp, features=features, files=np.array(names), counts=np.array(counts, dtype=np.int32),
+             frameIDs=np.array(frameIDs, dtype=np.int64), columns=np.array(engine.columns))
+    _replace(tmp, fname)
+
+
+def _replace(src, dst):
+    # os.rename does not overwrite on Windows
+    if os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the training feature cache")
+    parser.add_argument("--data", default=r"S:\DATA", help="directory holding the User_XX directories")
+    parser.add_argument("--cache", help="cache directory (default: <data>\\FeatureCache)")
+    parser.add_argument("--features", help="feature schema saved by FeatureEngine.save "
+                        "(default: every joint pair)")
+    parser.add_argument("--workers", type=int, help="pool processes (default: the number of CPUs)")
+    parser.add_argument("--force", action="store_true", help="rebuild the whole cache")
+    args = parser.parse_args()
+
+    engine = FeatureEngine.load(args.features) if args.features else FeatureEngine()
+    cachePath = args.cache or os.path.join(args.data, "FeatureCache")
+    start = default_timer()
+    stats = buildCache(args.data, cachePath, engine, args.workers, args.force)
+    sys.stdout.write("%d frames extracted, %d reused, %d dropped, %d skipped, %d groups written "
+                     "in %.1f s\n" % (stats["extracted"], stats["reused"], stats["dropped"],
+                                      len(stats["skipped"]), stats["written"], default_timer() - start))
+    for path, reason in sorted(stats["skipped"]):
+        sys.stdout.write("  skipped %s: %s\n" % (path, reason))
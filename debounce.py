@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Temporal voting for the predicted signs.  The translator predicts a sign
+    on every frame in which the hand is still, so a held pose used to be
+    written to the text box over and over.  A SignDebouncer keeps the recent
+    predictions in a fixed-size ring buffer and emits a sign once, when
+    enough of them agree (and optionally after the sign has been held for
+    some time).  The debouncer is then settled: further frames of the same
+    pose need not be predicted until the pose changes and reset() is called.
+"""
+
+from timeit import default_timer
+
+import numpy as np
+
+
+class SignDebouncer(object):
+
+    """Ring buffer of the last 'window' predictions and their confidences.
+       A sign is emitted when at least 'votes' of the buffered predictions
+       agree, each with a probability of at least minConfidence, and the sign
+       has led the vote for holdTime seconds."""
+
+    def __init__(self, window=5, votes=3, holdTime=0.0, minConfidence=0.0):
+
+        if votes > window:
+            raise ValueError("votes cannot exceed the window size")
+        self.window = window
+        self.votes = votes
+        self.holdTime = holdTime
+        self.minConfidence = minConfidence
+        self._codes = np.full(window, -1, dtype=np.int32)
+        self._confidences = np.zeros(window)
+        # the predictions themselves, the emitted sign is built from one of
+        # the leader's
+        self._predictions = [None] * window
+        self._labels = []
+        self._labelCodes = {}
+        self.reset()
+
+    @property
+    def settled(self):
+        # True once a sign has been emitted for the current pose
+        return self._settled is not None
+
+    @property
+    def settledSign(self):
+        return self._settled
+
+    def reset(self):
+
+        """This function clears the votes, to be called when the pose
+           changes."""
+
+        self._codes.fill(-1)
+        self._confidences.fill(0.0)
+        self._predictions = [None] * self.window
+        self._next = 0
+        self._leader = -1
+        self._leaderSince = None
+        self._settled = None
+
+    def push(self, prediction, timestamp=None):
+
+        """This function adds a prediction to the ring buffer.
+
+           PARAMETERS:   prediction: dictionary
+                           a prediction from SignPredictor, with the 'Predict'
+                           and 'Probability' entries
+
+                         timestamp: float
+                           time of the prediction in seconds, defaults to now
+
+           RETURNS:      sign: dictionary
+                           the latest prediction of the agreeing votes, with
+                           their mean probability, or None"""
+
+        if self._settled is not None or prediction['Predict'] is None:
+            return None
+        if timestamp is None:
+            timestamp = default_timer()
+
+        label = prediction['Predict']
+        confidence = prediction.get('Probability', 1.0)
+        code = -1
+        if confidence >= self.minConfidence:
+            code = self._labelCodes.get(label)
+            if code is None:
+                code = len(self._labels)
+                self._labels.append(label)
+                self._labelCodes[label] = code
+        self._codes[self._next] = code
+        self._confidences[self._next] = confidence
+        self._predictions[self._next] = prediction
+        self._next = (self._next + 1) % self.window
+
+        valid = self._codes[self._codes >= 0]
+        if len(valid) == 0:
+            return None
+        counts = np.bincount(valid)
+        leader = int(np.argmax(counts))
+        if leader != self._leader:
+            self._leader = leader
+            self._leaderSince = timestamp
+        if counts[leader] < self.votes or timestamp - self._leaderSince < self.holdTime:
+            return None
+
+        agree = self._codes == leader
+        # the other entries (TopK, ...) must belong to the leader, the newest
+        # prediction may be of another label
+        for i in range(1, self.window + 1):
+            slot = (self._next - i) % self.window
+            if self._codes[slot] == leader:
+                break
+        sign = dict(self._predictions[slot])
+        sign['Predict'] = self._labels[leader]
+        sign['Probability'] = float(self._confidences[agree].mean())
+        sign['Votes'] = int(counts[leader])
+        self._settled = sign['Predict']
+
+        return sign
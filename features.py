@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Vectorized joint-to-joint distance features.  The palm and the 25 finger
+    joints of a HandSnapshot form a (26,3) joint array, and a FeatureEngine
+    computes a fixed, ordered set of distances between joint pairs with NumPy,
+    for one frame or for thousands of frames at once.  The pairs and the
+    column names are the engine's schema, which can be saved next to a model.
+
+    The schema used by the translator model comes from
+    wrangle.getDistanceData.  FeatureEngine.fromReference() matches each
+    column produced by getDistanceData for reference hands to the joint pair
+    with the same distance, so the engine reproduces those columns, in the
+    same order, without building an OrderedDict per frame.  The match is
+    made offline, on many recorded hands so that distances that agree by
+    chance on one hand cannot select the wrong pair, and the schema is saved
+    next to the model as <model>_features.npz.
+
+    usage: python features.py MODEL.pkl --serialized DIR [--frames N]
+                                        [--output SCHEMA.npz]
+"""
+
+import os
+
+import numpy as np
+
+from hand_snapshot import HandSnapshot, JOINTS, stackSnapshots
+
+FINGER_NAMES = ["Thumb", "Index", "Middle", "Ring", "Pinky"]
+# metacarpal base, then the end of the metacarpal, proximal, intermediate
+# and distal bones
+JOINT_NAMES = ["Base", "MCP", "PIP", "DIP", "Tip"]
+JOINT_LABELS = ["Palm"] + ["%s_%s" % (f, j) for f in FINGER_NAMES for j in JOINT_NAMES]
+NUM_JOINTS = len(JOINT_LABELS)
+
+# rows converted per step by FeatureEngine.transform, bounds the temporaries
+_CHUNK = 4096
+# the schema of a model is saved next to it with this suffix
+SCHEMA_SUFFIX = "_features.npz"
+
+
+def schemaFile(modelFile):
+
+    """This function returns the name of the schema saved next to a model.
+
+       PARAMETERS:   modelFile: string
+                       the model file, e.g. RandomForest_Distance_ALL_clf.pkl
+
+       RETURNS:      fname: string
+                       e.g. RandomForest_Distance_ALL_clf_features.npz"""
+
+    return os.path.splitext(modelFile)[0] + SCHEMA_SUFFIX
+
+
+def loadSchema(fname, model=None):
+
+    """This function loads the feature schema of a model, and checks that it
+       has the number of features the model was trained with.
+
+       PARAMETERS:   fname: string
+                       the .npz schema file
+
+                     model: classifier or FlatForest
+                       the model to check the schema against, optional
+
+       RETURNS:      engine: FeatureEngine
+
+       RAISES:       ValueError
+                       if the file is missing or does not fit the model"""
+
+    if not os.path.exists(fname):
+        raise ValueError("No feature schema %s, create it with features.py" % fname)
+    engine = FeatureEngine.load(fname)
+    if model is not None:
+        # sklearn records the features it was fitted with, a FlatForest only
+        # knows the highest feature used by a split
+        expected = getattr(model, "n_features_in_", getattr(model, "n_features_", None))
+        if expected is not None and expected != engine.numFeatures:
+            raise ValueError("The model uses %d features, the schema %s has %d" %
+                             (expected, fname, engine.numFeatures))
+        if getattr(model, "n_features", 0) > engine.numFeatures:
+            raise ValueError("The model uses at least %d features, the schema %s has %d" %
+                             (model.n_features, fname, engine.numFeatures))
+    return engine
+
+
+def jointArray(hand):
+
+    """This function returns the (26,3) joint array of a hand, the palm
+       position followed by the five joints of each finger.
+
+       PARAMETERS:   hand: HandSnapshot or numpy.ndarray
+                       a snapshot, or stacked snapshot buffers (N,SNAPSHOT_SIZE)
+
+       RETURNS:      joints: numpy.ndarray
+                       (26,3) or (N,26,3) float32 array"""
+
+    buffers = hand.buffer if isinstance(hand, HandSnapshot) else np.asarray(hand)
+    joints = np.concatenate((buffers[..., 0:3], buffers[..., JOINTS]), axis=-1)
+    return joints.reshape(buffers.shape[:-1] + (NUM_JOINTS, 3))
+
+
+class FeatureEngine(object):
+
+    """Computes the distances between a fixed list of joint pairs.  The
+       schema is the (P,2) array of joint indices into JOINT_LABELS and the
+       P column names.  The default schema is every pair of joints, in
+       scipy.spatial.distance.pdist order."""
+
+    def __init__(self, pairs=None, columns=None):
+
+        if pairs is None:
+            first, second = np.triu_indices(NUM_JOINTS, 1)
+            pairs = np.column_stack((first, second))
+        self.pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        if columns is None:
+            columns = ["%s-%s" % (JOINT_LABELS[i], JOINT_LABELS[j]) for i, j in self.pairs]
+        if len(columns) != len(self.pairs):
+            raise ValueError("The schema needs one column name per joint pair")
+        self.columns = list(columns)
+        self._first = self.pairs[:, 0].copy()
+        self._second = self.pairs[:, 1].copy()
+
+    @property
+    def numFeatures(self):
+        return len(self.columns)
+
+    @classmethod
+    def fromReference(cls, hands, references, tol=1e-3):
+
+        """This function builds the engine matching the columns of existing
+           feature dictionaries, such as the OrderedDict filled by
+           wrangle.getDistanceData.  Each column is matched to the joint pair
+           whose distance agrees with the reference value for every given
+           hand.  Joints that coincide on every hand (the thumb has no
+           metacarpal) give identical distances, and the first matching pair
+           is used.  Other pairs can agree by chance on a few hands, so many
+           hands should be given:  a column matched by pairs of different
+           joints is an error.
+
+           PARAMETERS:   hands: list of HandSnapshot
+                           the reference hands
+
+                         references: list of dict
+                           the ordered feature dictionary of each hand
+
+                         tol: float
+                           largest accepted difference, in millimeters
+
+           RETURNS:      engine: FeatureEngine"""
+
+        allPairs = cls()
+        distances = allPairs.transform(np.array([jointArray(h) for h in hands]),
+                                       dtype=np.float64)
+        # each joint is replaced by the first joint it coincides with
+        same = list(range(NUM_JOINTS))
+        for (i, j), close in zip(allPairs.pairs, np.all(distances <= tol, axis=0)):
+            if close:
+                same[j] = same[i]
+        columns = list(references[0].keys())
+        pairs = []
+        for name in columns:
+            values = np.array([float(ref[name]) for ref in references])
+            match = np.all(np.abs(distances - values[:, np.newaxis]) <= tol, axis=0)
+            candidates = allPairs.pairs[np.flatnonzero(match)]
+            if len(candidates) == 0:
+                raise ValueError("Feature %s is not a joint-to-joint distance" % name)
+            if len(set(frozenset((same[i], same[j])) for i, j in candidates)) > 1:
+                raise ValueError("Feature %s matches %d joint pairs on %d hands, more "
+                                 "reference hands are needed" % (name, len(candidates), len(hands)))
+            pairs.append(candidates[0])
+
+        return cls(pairs, columns)
+
+    @classmethod
+    def load(cls, fname):
+
+        """This function loads a schema written by FeatureEngine.save.
+
+           PARAMETERS:   fname: string
+                           the .npz schema file
+
+           RETURNS:      engine: FeatureEngine"""
+
+        with np.load(fname) as schema:
+            return cls(schema["pairs"], [str(c) for c in schema["columns"]])
+
+    def save(self, fname):
+
+        """This function writes the schema, the joint pairs and the column
+           names, to a .npz file.
+
+           PARAMETERS:   fname: string
+                           the output file"""
+
+        np.savez(fname, pairs=self.pairs, columns=np.array(self.columns))
+
+    def transform(self, joints, out=None, dtype=np.float32):
+
+        """This function computes the feature vector of one or more hands.
+
+           PARAMETERS:   joints: numpy.ndarray
+                           (26,3) joint array, or (N,26,3) for N hands
+
+                         out: numpy.ndarray
+                           optional preallocated (P,) or (N,P) output
+
+                         dtype: numpy.dtype
+                           the output type when out is not given
+
+           RETURNS:      features: numpy.ndarray
+                           (P,) or (N,P) distances in column order"""
+
+        joints = np.asarray(joints)
+        single = joints.ndim == 2
+        if single:
+            joints = joints[np.newaxis]
+        if out is None:
+            shape = (self.numFeatures,) if single else (len(joints), self.numFeatures)
+            out = np.empty(shape, dtype=dtype)
+        rows = out[np.newaxis] if single else out
+        # distances are computed in double precision and cast on output
+        for start in range(0, len(joints), _CHUNK):
+            block = joints[start:start + _CHUNK].astype(np.float64)
+            diff = block[:, self._first] - block[:, self._second]
+            rows[start:start + _CHUNK] = np.sqrt(np.einsum('...ij,...ij->...i', diff, diff))
+
+        return out
+
+    def transformSnapshots(self, snapshots, out=None):
+
+        """This function computes the feature vectors of a HandSnapshot, a
+           list of snapshots or stacked snapshot buffers.
+
+           RETURNS:      features: numpy.ndarray
+                           (P,) for a single snapshot, (N,P) otherwise"""
+
+        if isinstance(snapshots, HandSnapshot):
+            return self.transform(jointArray(snapshots), out)
+        if isinstance(snapshots, (list, tuple)):
+            snapshots = stackSnapshots(snapshots)
+        return self.transform(jointArray(snapshots), out)
+
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from collections import OrderedDict
+
+    # PROCESSING sits next to this directory, as for the GUIs
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    import PROCESSING.wrangle_leap_data as wrangle
+
+    import leap_utilities as lutils
+    from model_loader import loadModel
+
+    parser = argparse.ArgumentParser(description="Create the feature schema of a model")
+    parser.add_argument("model", help="model saved with joblib.dump, or a FlatForest directory")
+    parser.add_argument("--serialized", required=True,
+                        help="Serialized directory of recorded frames (e.g. S:\\DATA\\User_01\\Serialized)")
+    parser.add_argument("--frames", type=int, default=500,
+                        help="frames used as reference, spread over the directory (default: 500)")
+    parser.add_argument("--output", help="schema file (default: the model name with %s)" % SCHEMA_SUFFIX)
+    args = parser.parse_args()
+
+    names = sorted(name for name in os.listdir(args.serialized) if name.endswith(".data"))
+    step = max(1, len(names) // args.frames)
+    paths = [os.path.join(args.serialized, name) for name in names[::step][:args.frames]]
+    hands, references = [], []
+    for path, frame in lutils.iterDeserialize(paths):
+        for hand in frame.hands:
+            snapshot = HandSnapshot.fromHand(hand, frame.id)
+            hands.append(snapshot)
+            references.append(wrangle.getDistanceData(hand, OrderedDict(), snapshot.orient))
+    if not hands:
+        sys.exit("No hands in the frames of %s" % args.serialized)
+
+    engine = FeatureEngine.fromReference(hands, references)
+    output = args.output or schemaFile(args.model)
+    engine.save(output)
+    # the saved schema must fit the model it is loaded for
+    loadSchema(output, loadModel(args.model, None))
+    sys.stdout.write("%d features matched on %d hands, written to %s\n" %
+                     (engine.numFeatures, len(hands), output))
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+"""
+    A RandomForestClassifier flattened into contiguous NumPy arrays.  For a
+    single frame, sklearn's predict_proba spends most of its time validating
+    the input and dispatching each tree through joblib, not walking the
+    trees.  A FlatForest holds the nodes of every tree in one set of arrays
+    (feature, threshold, left and right child, leaf probabilities) and walks
+    all trees for all samples together, one tree level per step, dropping
+    the paths that have reached a leaf.
+
+    The probabilities are the same as sklearn's, bit for bit:
+      * the input is cast to float32 and compared with the float64
+        thresholds, as sklearn's trees do,
+      * each leaf holds the tree's normalized class probabilities, computed
+        with the same operations as DecisionTreeClassifier.predict_proba,
+      * the trees are summed in order, with a sequential cumulative sum,
+        then divided by the number of trees, as RandomForestClassifier does
+        with n_jobs=1.
+
+    A FlatForest is saved as a directory of .npy files, which load() maps
+    read-only, so that several translators share the pages of one model.
+
+    usage: python flat_forest.py MODEL.pkl [--output DIR]
+"""
+
+import os
+
+import numpy as np
+
+# the arrays saved by FlatForest.save, one .npy file each
+_ARRAYS = ("feature", "threshold", "left", "right", "roots", "values", "classes")
+# leaf values gathered per step by FlatForest.predict_proba
+_BLOCK = 1 << 20
+
+
+class FlatForest(object):
+
+    """Evaluates a flattened forest.  Provides the classes_, predict_proba
+       and predict of the original classifier, so it can replace it, e.g. in
+       a SignPredictor."""
+
+    def __init__(self, feature, threshold, left, right, roots, values, classes):
+
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.roots = roots
+        self.values = values
+        self.classes_ = classes
+        self.n_estimators = len(roots)
+        self.n_features = int(feature.max()) + 1 if len(feature) else 0
+        self._isLeaf = np.asarray(left) == np.arange(len(left))
+
+    @classmethod
+    def fromForest(cls, forest):
+
+        """This function flattens a fitted single-output classifier forest,
+           such as sklearn.ensemble.RandomForestClassifier.
+
+           PARAMETERS:   forest: RandomForestClassifier
+
+           RETURNS:      flat: FlatForest"""
+
+        if getattr(forest, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output forests can be flattened")
+        numClasses = forest.n_classes_
+        features, thresholds, lefts, rights, roots, values = [], [], [], [], [], []
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            count = tree.node_count
+            index = np.arange(count)
+            leaf = tree.children_left == -1
+            # leaves point to themselves, so that walking stops there
+            lefts.append(np.where(leaf, index, tree.children_left) + offset)
+            rights.append(np.where(leaf, index, tree.children_right) + offset)
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            # as DecisionTreeClassifier.predict_proba
+            proba = tree.value[:, 0, :numClasses].copy()
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba /= normalizer
+            values.append(proba)
+            roots.append(offset)
+            offset += count
+
+        return cls(np.concatenate(features).astype(np.intp),
+                   np.concatenate(thresholds).astype(np.float64),
+                   np.concatenate(lefts).astype(np.intp),
+                   np.concatenate(rights).astype(np.intp),
+                   np.array(roots, dtype=np.intp),
+                   np.concatenate(values),
+                   np.asarray(forest.classes_))
+
+    @classmethod
+    def load(cls, path, mmapMode="r"):
+
+        """This function loads a forest written by save().
+
+           PARAMETERS:   path: string
+                           the forest directory
+
+                         mmapMode: string
+                           numpy.load mode, None reads the arrays into memory
+
+           RETURNS:      flat: FlatForest"""
+
+        # the few class labels are read into memory
+        arrays = [np.load(os.path.join(path, name + ".npy"),
+                          mmap_mode=None if name == "classes" else mmapMode)
+                  for name in _ARRAYS]
+        return cls(*arrays)
+
+    def save(self, path):
+
+        """This function writes the forest arrays to a directory.
+
+           PARAMETERS:   path: string
+                           the output directory, created if needed"""
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name in _ARRAYS:
+            value = np.asarray(self.classes_ if name == "classes" else getattr(self, name))
+            if value.dtype == object:
+                # string labels of sklearn are Python objects, which np.save
+                # pickles
+                value = np.asarray(value, dtype="U")
+            np.save(os.path.join(path, name + ".npy"), value)
+
+    def apply(self, X):
+
+        """This function finds the leaf reached in each tree.
+
+           PARAMETERS:   X: numpy.ndarray
+                           (N,F) samples, or a single (F,) sample
+
+           RETURNS:      leaves: numpy.ndarray
+                           (N,T) node indices"""
+
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis]
+        numSamples, numFeatures = X.shape
+        if numFeatures < self.n_features:
+            raise ValueError("The forest uses %d features, got %d" % (self.n_features, numFeatures))
+        flatX = X.ravel()
+        # one entry per (sample, tree), paths that reached a leaf drop out
+        nodes = np.tile(self.roots, numSamples)
+        offsets = np.repeat(np.arange(numSamples) * numFeatures, self.n_estimators)
+        active = np.flatnonzero(~self._isLeaf[nodes])
+        while len(active):
+            current = nodes[active]
+            # float32 values compared with float64 thresholds, as in sklearn
+            goLeft = flatX[offsets[active] + self.feature[current]] <= self.threshold[current]
+            current = np.where(goLeft, self.left[current], self.right[current])
+            nodes[active] = current
+            active = active[~self._isLeaf[current]]
+
+        return nodes.reshape(numSamples, self.n_estimators)
+
+    def predict_proba(self, X):
+
+        """This function computes the class probabilities.
+
+           PARAMETERS:   X: numpy.ndarray
+                           (N,F) samples, or a single (F,) sample
+
+           RETURNS:      proba: numpy.ndarray
+                           (N,n_classes) probabilities in classes_ order"""
+
+        leaves = self.apply(X)
+        numClasses = self.values.shape[1]
+        proba = np.empty((len(leaves), numClasses))
+        # the (rows,T,C) leaf values are summed over the trees in order, like
+        # sklearn, in blocks of rows to bound the temporary
+        block = max(1, _BLOCK // (self.n_estimators * numClasses))
+        for start in range(0, len(leaves), block):
+            rows = self.values[leaves[start:start + block]]
+            proba[start:start + block] = np.cumsum(rows, axis=1)[:, -1]
+        proba /= self.n_estimators
+
+        return proba
+
+    def predict(self, X):
+
+        """This function predicts the class of each sample."""
+
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+if __name__ == "__main__":
+    import argparse
+    from timeit import default_timer
+
+    from model_loader import loadModel
+
+    parser = argparse.ArgumentParser(description="Flatten a fitted RandomForest")
+    parser.add_argument("model", help="model saved with joblib.dump")
+    parser.add_argument("--output", help="forest directory (default: the model name with .flat)")
+    args = parser.parse_args()
+
+    start = default_timer()
+    forest = loadModel(args.model, None)
+    flat = FlatForest.fromForest(forest)
+    output = args.output or os.path.splitext(args.model)[0] + ".flat"
+    flat.save(output)
+    print("%d trees, %d nodes, written to %s in %.1f s" %
+          (flat.n_estimators, len(flat.left), output, default_timer() - start))
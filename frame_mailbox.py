@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+    A single slot mailbox between the capture thread and the GUI.  Emitting a
+    Qt signal per frame queues every frame in the GUI event loop, and when
+    the GUI falls behind the queue, and the preview latency, grow without
+    limit.  With a FrameMailbox the capture thread overwrites the pending
+    frame and the GUI takes the newest one at its display rate, so at most one
+    frame is ever waiting.  Frames that are overwritten before being displayed
+    are counted.
+"""
+
+import threading
+
+
+class FrameMailbox(object):
+
+    """Holds the newest frame posted by the capture thread until the GUI
+       takes it.  onDrop(item) is called for each frame that is overwritten
+       before it was taken, so that its resources can be released."""
+
+    def __init__(self, onDrop=None):
+
+        self._lock = threading.Lock()
+        self._item = None
+        self._onDrop = onDrop
+        self.reset()
+
+    def reset(self):
+
+        """This function clears the counters."""
+
+        with self._lock:
+            self.posted = 0
+            self.taken = 0
+            self.dropped = 0
+            self.coalesced = 0
+            self._droppedSinceTake = 0
+
+    def put(self, item):
+
+        """This function posts a frame, replacing the pending one.
+
+           PARAMETERS:   item: object
+                           the frame data, not None"""
+
+        with self._lock:
+            old = self._item
+            self._item = item
+            self.posted += 1
+            if old is not None:
+                self.dropped += 1
+                self._droppedSinceTake += 1
+        if old is not None and self._onDrop is not None:
+            self._onDrop(old)
+
+    def take(self):
+
+        """This function takes the pending frame.
+
+           RETURNS:      item: object
+                           the newest frame, or None if no frame was posted
+                           since the last take"""
+
+        with self._lock:
+            item = self._item
+            self._item = None
+            if item is not None:
+                self.taken += 1
+                if self._droppedSinceTake:
+                    # this frame stands in for the frames dropped before it
+                    self.coalesced += 1
+                    self._droppedSinceTake = 0
+            return item
+
+    def clear(self):
+
+        """This function discards the pending frame."""
+
+        with self._lock:
+            item = self._item
+            self._item = None
+        if item is not None and self._onDrop is not None:
+            self._onDrop(item)
+
+    def summary(self):
+        return ("Preview: %d frames posted, %d displayed, %d dropped, "
+                "%d displays coalesced newer frames" %
+                (self.posted, self.taken, self.dropped, self.coalesced))
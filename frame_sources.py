@@ -0,0 +1,703 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Frame sources for the ASL Translator and Data Collection GUIs.  A frame
+    source stands in for the Leap.Controller used by the FrameGrabber classes
+    so that the capture loop can be driven by the live sensor, by serialized
+    frames recorded with the data collection GUI, or by a synthetic hand when
+    no sensor is attached.
+
+    Every source provides the part of the Leap.Controller interface used by
+    the GUIs:  frame(history), is_connected and set_policy_flags(flags).
+    Sources can also push new frames:  listen(onFrame, onConnection) calls
+    onFrame(frameID) once for each new frame, through a Leap.Listener for
+    the live sensor, instead of the GUIs polling the source with a QTimer.
+"""
+
+import collections
+import os
+import re
+import threading
+from timeit import default_timer
+
+import numpy as np
+
+try:
+    import Leap
+except ImportError:
+    # The SDK is only required by the live and replay sources
+    Leap = None
+
+# Nominal frame rate of the Leap Motion Sensor, in frames per second
+SENSOR_RATE = 110.0
+# Number of frames the Leap.Controller keeps in its history
+HISTORY_SIZE = 60
+# Shape of a single Leap sensor image (height, width)
+IMAGE_SHAPE = (240, 640)
+
+# File name written by ASL_dataCollectGUI.MainWindow.saveData
+FRAME_FILE_RE = re.compile(r"^(?P<hand>[LR]H)_Frame_(?P<count>\d+)_(?P<char>\w+)\.data$")
+
+
+def createFrameSource(kind="live", path=None, rate=None, realtime=True, numHands=1):
+
+    """This function creates a frame source from the options given on the
+       command line of the GUIs.
+
+       PARAMETERS:   kind: string
+                       one of 'live', 'replay' or 'synthetic'
+
+                     path: string
+                       the Serialized directory to replay (replay only)
+
+                     rate: float
+                       frames per second produced by replay/synthetic sources
+
+                     realtime: boolean
+                       if False, frames are produced as fast as requested
+
+                     numHands: integer
+                       hands of the synthetic source, 1 or 2
+
+       RETURNS:      source: FrameSource"""
+
+    rate = SENSOR_RATE if rate is None else rate
+    if kind == "live":
+        return LeapFrameSource()
+    elif kind == "replay":
+        if path is None:
+            raise ValueError("A Serialized directory is required for replay")
+        return ReplayFrameSource(path, rate=rate, realtime=realtime)
+    elif kind == "synthetic":
+        return SyntheticFrameSource(rate=rate, realtime=realtime, numHands=numHands)
+    raise ValueError("Unknown frame source: %s" % kind)
+
+
+class FrameSource(object):
+
+    """Base class for the frame sources.  Subclasses produce the frame for a
+       given frame index through _frameAt().  The base class maps wall clock
+       time onto frame indices, at the source rate when running in realtime,
+       or one new frame per frame() call when running as fast as possible.
+       A realtime source may be shared by the preview thread and the GUI
+       thread, otherwise each reader needs its own source."""
+
+    def __init__(self, rate=SENSOR_RATE, realtime=True):
+
+        self.rate = float(rate)
+        self.realtime = realtime
+        self._startTime = None
+        self._index = -1
+        self._frames = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def is_connected(self):
+        return True
+
+    def set_policy_flags(self, flags):
+        # Recorded and synthetic sources always provide the images
+        pass
+
+    def frame(self, history=0):
+
+        """This function returns the most recent frame, or the frame produced
+           'history' frames before it, mirroring Leap.Controller.frame().
+
+           PARAMETERS:   history: integer
+                           the number of frames to look back
+
+           RETURNS:      frame: Leap.Frame like object"""
+
+        with self._lock:
+            if history == 0:
+                self._advance()
+            index = self._index - history
+            if history < 0 or history >= HISTORY_SIZE or index < 0:
+                return _EmptyFrame()
+            frame = self._frames.get(index)
+            if frame is None:
+                frame = self._frameAt(index)
+                self._remember(index, frame)
+            return frame
+
+    def listen(self, onFrame, onConnection=None):
+
+        """This function calls onFrame(frameID) from a background thread each
+           time the source produces a new frame, and onConnection(connected)
+           when the source starts or stops producing frames.  Listening paces
+           the source at its rate.
+
+           PARAMETERS:   onFrame: callable
+                           called with the id of each new frame
+
+                         onConnection: callable
+                           called with True/False on connection changes"""
+
+        self.stopListening()
+        self._stopEvent = threading.Event()
+        thread = threading.Thread(target=self._tick, name="FrameSource",
+                                  args=(onFrame, onConnection, self._stopEvent))
+        thread.daemon = True
+        thread.start()
+
+    def stopListening(self):
+
+        """This function stops the callbacks started by listen()."""
+
+        stopEvent = getattr(self, "_stopEvent", None)
+        if stopEvent is not None:
+            stopEvent.set()
+            self._stopEvent = None
+
+    def waitForConnection(self, timeout):
+
+        """This function waits up to timeout seconds for the source to be
+           connected.
+
+           RETURNS:      connected: boolean"""
+
+        return self.is_connected
+
+    def reset(self):
+
+        """This function rewinds the source to its first frame."""
+
+        with self._lock:
+            self._startTime = None
+            self._index = -1
+            self._frames.clear()
+
+    def _nextIndex(self):
+        if self.realtime:
+            now = default_timer()
+            if self._startTime is None:
+                self._startTime = now
+            return int((now - self._startTime) * self.rate)
+        return self._index + 1
+
+    def _tick(self, onFrame, onConnection, stopEvent):
+        lastIndex = None
+        connected = None
+        while not stopEvent.is_set():
+            if self.is_connected != connected:
+                connected = self.is_connected
+                if onConnection is not None:
+                    onConnection(connected)
+            with self._lock:
+                index = self._nextIndex()
+            if connected and index != lastIndex:
+                lastIndex = index
+                onFrame(index)
+            delay = 1.0 / self.rate
+            if self.realtime and self._startTime is not None:
+                ## sleep until the next frame is due
+                delay = self._startTime + (index + 1) / self.rate - default_timer()
+            stopEvent.wait(max(delay, 0.0005))
+
+    def _advance(self):
+        index = self._nextIndex()
+        if index != self._index:
+            self._index = index
+            self._remember(index, self._frameAt(index))
+
+    def _remember(self, index, frame):
+        self._frames[index] = frame
+        while len(self._frames) > HISTORY_SIZE:
+            self._frames.popitem(last=False)
+
+    def _frameAt(self, index):
+        raise NotImplementedError
+
+
+class LeapFrameSource(object):
+
+    """Frame source backed by the live Leap.Controller.  A Leap.Listener
+       keeps track of the connection state and, while listen() is active,
+       forwards the id of each new frame.  Attributes that are not defined
+       here are passed through to the controller."""
+
+    def __init__(self, controller=None):
+
+        if controller is None:
+            if Leap is None:
+                raise ImportError("The Leap SDK is required for the live frame source")
+            controller = Leap.Controller()
+        self.controller = controller
+        self.controller.set_policy_flags(Leap.Controller.POLICY_IMAGES)
+        self._connected = threading.Event()
+        self.state = "connecting"
+        if controller.is_connected:
+            self._connected.set()
+            self.state = "connected"
+        self._onFrame = None
+        self._onConnection = None
+        self._lastID = -1
+        self._listener = _makeListener(self)
+        self.controller.add_listener(self._listener)
+
+    def frame(self, history=0):
+        return self.controller.frame(history)
+
+    def listen(self, onFrame, onConnection=None):
+
+        """This function calls onFrame(frameID) from the Leap thread for each
+           frame with a new id, and onConnection(connected) when the sensor
+           connects or disconnects.  See FrameSource.listen."""
+
+        self._lastID = -1
+        self._onConnection = onConnection
+        self._onFrame = onFrame
+        if onConnection is not None:
+            onConnection(self._connected.is_set())
+
+    def stopListening(self):
+        self._onFrame = None
+        self._onConnection = None
+
+    def waitForConnection(self, timeout):
+
+        """This function waits up to timeout seconds for the sensor to be
+           connected, without spinning.
+
+           RETURNS:      connected: boolean"""
+
+        self._connected.wait(timeout)
+        return self._connected.is_set()
+
+    def _connectionChanged(self, connected):
+        if connected:
+            self._connected.set()
+            self.state = "connected"
+        else:
+            self._connected.clear()
+            ## the controller reconnects by itself once the sensor is back
+            self.state = "reconnecting"
+        onConnection = self._onConnection
+        if onConnection is not None:
+            onConnection(connected)
+
+    def _frameArrived(self, controller):
+        onFrame = self._onFrame
+        if onFrame is None:
+            return
+        frameID = controller.frame().id
+        if frameID > self._lastID:
+            self._lastID = frameID
+            onFrame(frameID)
+
+    def __getattr__(self, name):
+        return getattr(self.controller, name)
+
+
+def _makeListener(source):
+
+    # The listener class can only be defined once the SDK has been imported
+    class FrameListener(Leap.Listener):
+
+        def on_connect(self, controller):
+            source._connectionChanged(True)
+
+        def on_disconnect(self, controller):
+            source._connectionChanged(False)
+
+        def on_frame(self, controller):
+            source._frameArrived(controller)
+
+    return FrameListener()
+
+
+class CaptureStats(object):
+
+    """Counts the frames handled by a capture loop, to compare the polling
+       and listener capture modes.  Coverage is the fraction of the sensor
+       frames (by frame id) that were handled, duplicates are frames read
+       again with an id already handled, and the CPU use is the process CPU
+       time over the wall time."""
+
+    def __init__(self, mode):
+
+        self.mode = mode
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.duplicates = 0
+        self._firstID = None
+        self._lastID = None
+        self._wallStart = default_timer()
+        self._cpuStart = _cpuTime()
+
+    def frameSeen(self, frameID):
+
+        """This function records a frame read by the capture loop."""
+
+        if frameID == self._lastID:
+            self.duplicates += 1
+            return
+        if self._firstID is None:
+            self._firstID = frameID
+        self._lastID = frameID
+        self.frames += 1
+
+    def report(self):
+
+        """This function returns the statistics since the last reset.
+
+           RETURNS:      report: dictionary"""
+
+        wall = default_timer() - self._wallStart
+        cpu = _cpuTime() - self._cpuStart
+        span = 0 if self._firstID is None else self._lastID - self._firstID + 1
+        return {"mode": self.mode,
+                "frames": self.frames,
+                "duplicates": self.duplicates,
+                "coverage": float(self.frames) / span if span > 0 else 0.0,
+                "cpu": cpu / wall if wall > 0 else 0.0,
+                "seconds": wall}
+
+    def summary(self):
+        r = self.report()
+        return ("Capture (%s): %d frames in %.1f s, coverage %.1f%%, "
+                "%d duplicate reads, CPU %.1f%%" %
+                (r["mode"], r["frames"], r["seconds"], 100 * r["coverage"],
+                 r["duplicates"], 100 * r["cpu"]))
+
+
+def _cpuTime():
+    # user + system CPU time of the process
+    times = os.times()
+    return times[0] + times[1]
+
+
+class ReplayFrameSource(FrameSource):
+
+    """Frame source that replays the serialized frames written by
+       ASL_dataCollectGUI.MainWindow.saveData.  Frames are ordered by hand,
+       character and count.  The matching JPEG images in the sibling Images
+       directory are attached to the frames when present, otherwise blank
+       images are used so that the capture loops still run.  Once all files
+       have been played an empty frame is returned, as for a disconnected
+       sensor, unless loop is set."""
+
+    def __init__(self, path, rate=SENSOR_RATE, realtime=True, loop=False,
+                 controller=None):
+
+        super(ReplayFrameSource, self).__init__(rate, realtime)
+        if controller is None:
+            if Leap is None:
+                raise ImportError("The Leap SDK is required to deserialize frames")
+            controller = Leap.Controller()
+        self._controller = controller
+        self._loop = loop
+        self._imageDir = os.path.join(os.path.dirname(os.path.normpath(path)), "Images")
+        self._blank = np.zeros(IMAGE_SHAPE, dtype=np.uint8)
+
+        files = []
+        for name in os.listdir(path):
+            match = FRAME_FILE_RE.match(name)
+            if match is not None:
+                key = (match.group("hand"), match.group("char"), int(match.group("count")))
+                files.append((key, os.path.join(path, name)))
+        files.sort()
+        self.files = [f for key, f in files]
+        self._keys = [key for key, f in files]
+
+    @property
+    def is_connected(self):
+        return self._loop or self._index < len(self.files)
+
+    def _frameAt(self, index):
+        if len(self.files) == 0:
+            return _EmptyFrame()
+        if self._loop:
+            index = index % len(self.files)
+        elif index >= len(self.files):
+            return _EmptyFrame()
+
+        import leap_utilities as lutils
+        frame = lutils.deserializeData(self.files[index], self._controller)
+        if frame is None:
+            return _EmptyFrame()
+        hand, char, count = self._keys[index]
+        images = _ImageList([_Image(self._loadImage(hand, side, count, char))
+                             for side in ("Left", "Right")])
+
+        return _ReplayFrame(frame, index, images)
+
+    def _loadImage(self, hand, side, count, char):
+        name = "%s_%s_Image_%s_%s.jpg" % (hand, side, str(count).zfill(3), char)
+        fname = os.path.join(self._imageDir, name)
+        if os.path.exists(fname):
+            import cv2
+            img = cv2.imread(fname, cv2.IMREAD_GRAYSCALE)
+            if img is not None:
+                return np.ascontiguousarray(img)
+        return self._blank.copy()
+
+
+class SyntheticFrameSource(FrameSource):
+
+    """Frame source that generates a right hand with NumPy.  The hand holds a
+       pose for holdFrames frames, then moves to the next pose over moveFrames
+       frames.  Poses are random finger curls drawn from a seeded generator, so
+       a given seed always produces the same frames.  The palm, finger, bone
+       and image data follow the layout of the Leap API, in millimeters and
+       millimeters per second.
+
+       With numHands=2 a left hand, the mirror image of the right hand half a
+       pose cycle later, is added on the left side and the right hand moves
+       to the right side."""
+
+    def __init__(self, rate=SENSOR_RATE, realtime=True, seed=0, numPoses=26,
+                 holdFrames=60, moveFrames=20, numFrames=None, numHands=1):
+
+        super(SyntheticFrameSource, self).__init__(rate, realtime)
+        rng = np.random.RandomState(seed)
+        self._curls = rng.uniform(0.0, 1.0, (numPoses, 5))
+        self._offsets = rng.uniform(-30.0, 30.0, (numPoses, 3))
+        self._holdFrames = holdFrames
+        self._moveFrames = moveFrames
+        self._numFrames = numFrames
+        if numHands not in (1, 2):
+            raise ValueError("The synthetic source has 1 or 2 hands")
+        self._numHands = numHands
+        self._noise = rng.randint(0, 48, IMAGE_SHAPE).astype(np.uint8)
+        self._tremor = rng.normal(0.0, 0.02, (997, 3))
+        self.interaction_box = _InteractionBox()
+
+    @property
+    def is_connected(self):
+        return self._numFrames is None or self._index < self._numFrames
+
+    def _frameAt(self, index):
+        if self._numFrames is not None and index >= self._numFrames:
+            return _EmptyFrame()
+
+        if self._numHands == 1:
+            hands = [self._hand(1, index, 0, 0.0, True)]
+        else:
+            # half a pose cycle apart, so that the hands sign different poses
+            shift = (self._holdFrames + self._moveFrames) * (len(self._curls) // 2)
+            hands = [self._hand(1, index, 0, _HAND_SPACING, True),
+                     self._hand(2, index, shift, _HAND_SPACING, False)]
+        palms = [hand.palm_position.to_float_array() for hand in hands]
+        images = _ImageList([_Image(self._image(palms, 0)), _Image(self._image(palms, 24))])
+
+        return _Frame(index, int(index * 1e6 / self.rate), _ItemList(hands),
+                      images, self.interaction_box)
+
+    def _hand(self, handID, index, shift, spacing, isRight):
+        # the hand of frame index, moved right by spacing / 2, or mirrored
+        palm, joints = self._handArrays(index + shift)
+        prevPalm, prevJoints = self._handArrays(index + shift - 1)
+        offset = np.array([spacing / 2.0, 0.0, 0.0])
+        palm, prevPalm = palm + offset, prevPalm + offset
+        joints, prevJoints = joints + offset, prevJoints + offset
+        if not isRight:
+            palm, prevPalm, joints, prevJoints = [a * _MIRROR for a in (palm, prevPalm, joints, prevJoints)]
+        return _Hand(handID, palm, (palm - prevPalm) * self.rate, joints,
+                     (joints[:, -1] - prevJoints[:, -1]) * self.rate, isRight)
+
+    def _handArrays(self, index):
+
+        # palm position (3,) and joint positions (5 fingers, 5 joints, 3)
+        period = self._holdFrames + self._moveFrames
+        pose, step = divmod(max(index, 0), period)
+        t = max(step - self._holdFrames, 0) / float(self._moveFrames)
+        t = 0.5 - 0.5 * np.cos(np.pi * t)
+        a = pose % len(self._curls)
+        b = (pose + 1) % len(self._curls)
+        curls = (1.0 - t) * self._curls[a] + t * self._curls[b]
+        offset = (1.0 - t) * self._offsets[a] + t * self._offsets[b]
+
+        palm = _PALM_CENTER + offset + self._tremor[index % len(self._tremor)]
+        # bend each bone towards the palm normal by the cumulative curl angle
+        angles = curls[:, np.newaxis] * _BEND_ANGLES[np.newaxis, :]
+        dirs = (np.cos(angles)[:, :, np.newaxis] * _FINGER_DIRS[:, np.newaxis, :] +
+                np.sin(angles)[:, :, np.newaxis] * _PALM_NORMAL)
+        bones = dirs * _BONE_LENGTHS[:, :, np.newaxis]
+        joints = np.empty((5, 5, 3))
+        joints[:, 0] = palm + _KNUCKLES
+        joints[:, 1:] = joints[:, :1] + np.cumsum(bones, axis=1)
+
+        return palm, joints
+
+    def _image(self, palms, disparity):
+        img = self._noise.copy()
+        height, width = IMAGE_SHAPE
+        for palm in palms:
+            col = int((palm[0] + 117.5) / 235.0 * width) + disparity
+            row = int((palm[2] + 73.5) / 147.0 * height)
+            col = min(max(col, 40), width - 40)
+            row = min(max(row, 40), height - 40)
+            img[row - 40:row + 40, col - 40:col + 40] += 160
+        return img
+
+
+###############################################################################
+# Geometry of the synthetic hand.  Leap coordinates: x to the right, y up from
+# the sensor, z towards the user.  Bone lengths are in millimeters, ordered
+# metacarpal, proximal, intermediate, distal.  The thumb has no metacarpal.
+_PALM_CENTER = np.array([0.0, 200.0, 0.0])
+_PALM_NORMAL = np.array([0.0, -1.0, 0.0])
+_PALM_DIRECTION = np.array([0.0, 0.0, -1.0])
+_KNUCKLES = np.array([[-20.0, 0.0, 20.0],
+                      [-12.0, 0.0, 25.0],
+                      [0.0, 0.0, 25.0],
+                      [12.0, 0.0, 25.0],
+                      [22.0, 0.0, 22.0]])
+_FINGER_DIRS = np.array([[-0.7071, 0.0, -0.7071],
+                         [-0.05, 0.0, -1.0],
+                         [0.0, 0.0, -1.0],
+                         [0.05, 0.0, -1.0],
+                         [0.1, 0.0, -1.0]])
+_FINGER_DIRS /= np.sqrt((_FINGER_DIRS ** 2).sum(axis=1))[:, np.newaxis]
+_BONE_LENGTHS = np.array([[0.0, 46.0, 32.0, 24.0],
+                          [68.0, 39.0, 22.0, 16.0],
+                          [64.0, 44.0, 26.0, 17.0],
+                          [58.0, 41.0, 25.0, 17.0],
+                          [53.0, 33.0, 18.0, 16.0]])
+_BEND_ANGLES = np.radians([0.0, 60.0, 140.0, 190.0])
+# distance between the palms of two synthetic hands, and the mirror of a
+# right hand into a left hand
+_HAND_SPACING = 120.0
+_MIRROR = np.array([-1.0, 1.0, 1.0])
+
+
+###############################################################################
+# Lightweight stand-ins for the Leap API objects produced by the replay and
+# synthetic sources.  Only the attributes read by this project are provided.
+class _Vector(object):
+
+    __slots__ = ("x", "y", "z")
+
+    def __init__(self, xyz):
+        self.x, self.y, self.z = float(xyz[0]), float(xyz[1]), float(xyz[2])
+
+    def __getitem__(self, i):
+        return (self.x, self.y, self.z)[i]
+
+    def to_float_array(self):
+        return [self.x, self.y, self.z]
+
+    def distance_to(self, other):
+        return float(np.sqrt((self.x - other.x) ** 2 + (self.y - other.y) ** 2 +
+                             (self.z - other.z) ** 2))
+
+
+class _Matrix(object):
+
+    def __init__(self, xBasis, yBasis, zBasis, origin):
+        self.x_basis = _Vector(xBasis)
+        self.y_basis = _Vector(yBasis)
+        self.z_basis = _Vector(zBasis)
+        self.origin = _Vector(origin)
+
+
+class _ItemList(list):
+
+    @property
+    def is_empty(self):
+        return len(self) == 0
+
+
+class _ImageList(_ItemList):
+    pass
+
+
+class _Image(object):
+
+    def __init__(self, data):
+        # keep a reference to the array so that data_pointer stays valid
+        self.data = data
+        self.height, self.width = data.shape
+        self.data_pointer = data.ctypes.data
+        self.is_valid = True
+
+
+class _InteractionBox(object):
+
+    def __init__(self):
+        self.center = _Vector(_PALM_CENTER)
+        self.width = 235.0
+        self.height = 235.0
+        self.depth = 147.0
+        self.is_valid = True
+
+
+class _Bone(object):
+
+    def __init__(self, boneType, prevJoint, nextJoint):
+        self.type = boneType
+        self.prev_joint = _Vector(prevJoint)
+        self.next_joint = _Vector(nextJoint)
+        self.is_valid = True
+
+
+class _Finger(object):
+
+    def __init__(self, fingerType, joints, tipVelocity):
+        self.type = fingerType
+        self.is_valid = True
+        self.tip_position = _Vector(joints[-1])
+        self.tip_velocity = _Vector(tipVelocity)
+        self._bones = [_Bone(i, joints[i], joints[i + 1]) for i in range(4)]
+
+    def bone(self, boneType):
+        return self._bones[boneType]
+
+
+class _Hand(object):
+
+    def __init__(self, handID, palm, palmVelocity, joints, tipVelocities, isRight=True):
+        self.id = handID
+        self.is_valid = True
+        self.is_right = isRight
+        self.is_left = not isRight
+        self.confidence = 1.0
+        self.palm_position = _Vector(palm)
+        self.palm_velocity = _Vector(palmVelocity)
+        self.palm_normal = _Vector(_PALM_NORMAL)
+        self.direction = _Vector(_PALM_DIRECTION)
+        xBasis = np.cross(-_PALM_NORMAL, -_PALM_DIRECTION)
+        self.basis = _Matrix(xBasis, -_PALM_NORMAL, -_PALM_DIRECTION, palm)
+        self.fingers = _ItemList([_Finger(i, joints[i], tipVelocities[i]) for i in range(5)])
+
+
+class _Frame(object):
+
+    def __init__(self, frameID, timestamp, hands, images, interactionBox):
+        self.id = frameID
+        self.timestamp = timestamp
+        self.is_valid = True
+        self.hands = hands
+        self.fingers = _ItemList([f for h in hands for f in h.fingers])
+        self.images = images
+        self.interaction_box = interactionBox
+
+
+class _EmptyFrame(object):
+
+    def __init__(self):
+        self.id = -1
+        self.timestamp = 0
+        self.is_valid = False
+        self.hands = _ItemList()
+        self.fingers = _ItemList()
+        self.images = _ImageList()
+        self.interaction_box = _InteractionBox()
+
+
+class _ReplayFrame(object):
+
+    """A deserialized Leap.Frame with the replay index as its id and the
+       recorded images attached."""
+
+    def __init__(self, frame, frameID, images):
+        self._frame = frame
+        self.id = frameID
+        self.images = images
+
+    def __getattr__(self, name):
+        return getattr(self._frame, name)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Background writer for the frames saved during data collection.  Encoding
+    the two JPEG images and writing the serialized frame used to happen on the
+    GUI thread, so the collection rate was limited by the disk and the
+    encoder.  A FrameWriter copies the frame data, returns right away, and
+    encodes and writes on a pool of worker threads (the JPEG encoder releases
+    the GIL).  The queue is bounded:  when it is full, submitting blocks until
+    a worker catches up, so memory use stays bounded.
+"""
+
+import sys
+import threading
+
+import numpy as np
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class FrameWriter(object):
+
+    """Pool of 'workers' threads writing the jobs of a queue holding at most
+       maxQueue frames.  flush() waits until every submitted frame has been
+       written, close() flushes and stops the workers."""
+
+    def __init__(self, workers=2, maxQueue=64):
+
+        self._queue = queue.Queue(maxQueue)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.written = 0
+        self.blocked = 0
+        self.errors = []
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._run, name="FrameWriter-%d" % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job):
+
+        """This function queues a job, a callable taking no arguments.  It
+           blocks while the queue is full.
+
+           PARAMETERS:   job: callable
+                           writes one frame, must not refer to SDK memory"""
+
+        if self._queue.full():
+            with self._lock:
+                self.blocked += 1
+        self._queue.put(job)
+        self.submitted += 1
+
+    def saveFrame(self, lpath, rpath, limg, rimg, serialPath, serialized):
+
+        """This function queues the two images and the serialized frame of
+           one collected frame.  The images are copied before returning.
+
+           PARAMETERS:   lpath,rpath: string
+                           the output paths of the left and right images
+
+                         limg,rimg: numpy.ndarray
+                           the left and right images
+
+                         serialPath: string
+                           the output path of the serialized frame, or None
+                           if it is saved elsewhere
+
+                         serialized: bytes
+                           the serialized frame, see lutils.serializeFrame"""
+
+        limg = np.array(limg, copy=True)
+        rimg = np.array(rimg, copy=True)
+
+        def job():
+            saveImage(limg, lpath)
+            saveImage(rimg, rpath)
+            if serialPath is not None:
+                with open(serialPath, 'wb') as data_file:
+                    data_file.write(serialized)
+
+        self.submit(job)
+
+    def writeFile(self, path, data):
+
+        """This function queues bytes to be written to a file.
+
+           PARAMETERS:   path: string
+                           the output path
+
+                         data: bytes
+                           the file contents, e.g. a serialized frame"""
+
+        def job():
+            with open(path, 'wb') as data_file:
+                data_file.write(data)
+
+        self.submit(job)
+
+    def flush(self):
+
+        """This function waits until every queued frame has been written."""
+
+        self._queue.join()
+
+    def close(self):
+
+        """This function writes the queued frames and stops the workers."""
+
+        self.flush()
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                job()
+                with self._lock:
+                    self.written += 1
+            except Exception as e:
+                with self._lock:
+                    self.errors.append(e)
+                sys.stdout.write("Error writing frame: %s\n" % e)
+            finally:
+                self._queue.task_done()
+
+
+def saveImage(img, fname):
+
+    """This function writes an image scaled to its own range, as done by
+       MainWindow.saveData.
+
+       PARAMETERS:   img: numpy.ndarray
+                       the image
+
+                     fname: string
+                       the output path"""
+
+    import scipy.misc
+    scipy.misc.toimage(img, cmin=np.min(img), cmax=np.max(img)).save(fname)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""
+    A compact copy of a Leap.Hand.  The palm, fingertip and bone joint
+    positions, the velocities, the palm basis and the handedness are read from
+    the SDK object in a single pass and stored in one contiguous float32
+    buffer.  Downstream stages (interaction box check, motion detection and
+    feature extraction) read from the buffer instead of walking the SWIG
+    object again, and snapshots can be queued across threads or stacked into
+    (N, SNAPSHOT_SIZE) arrays for batch processing.
+"""
+
+import numpy as np
+
+## Layout of the snapshot buffer.  POSITIONS and VELOCITIES hold the palm
+## followed by the five fingertips, the layout used by lutils.handsChanged and
+## lutils.handsMoving.  JOINTS holds the five joints of each finger, from the
+## base of the metacarpal to the tip of the distal bone.  BASIS holds the
+## x, y and z basis vectors of the palm and its origin.
+POSITIONS = slice(0, 18)
+VELOCITIES = slice(18, 36)
+JOINTS = slice(36, 111)
+PALM_NORMAL = slice(111, 114)
+DIRECTION = slice(114, 117)
+BASIS = slice(117, 129)
+IS_RIGHT = 129
+SNAPSHOT_SIZE = 130
+
+# Leap.Bone types, metacarpal to distal
+_BONE_TYPES = (0, 1, 2, 3)
+
+
+class HandSnapshot(object):
+
+    """Array backed copy of a Leap.Hand.  Use HandSnapshot.fromHand() to copy
+       a hand from the SDK."""
+
+    __slots__ = ("buffer", "id", "frameID")
+
+    def __init__(self, buffer, handID=-1, frameID=-1):
+        self.buffer = buffer
+        self.id = handID
+        self.frameID = frameID
+
+    @classmethod
+    def fromHand(cls, hand, frameID=-1):
+
+        """This function copies a Leap.Hand into a new snapshot.  Every SDK
+           attribute used by the project is read exactly once.
+
+           PARAMETERS:   hand: Leap.Hand
+                           the hand to copy
+
+                         frameID: integer
+                           the id of the frame the hand belongs to
+
+           RETURNS:      snapshot: HandSnapshot"""
+
+        fingers = [hand.fingers[i] for i in range(0, 5)]
+        values = []
+        extend = values.extend
+        v = hand.palm_position
+        extend((v.x, v.y, v.z))
+        for f in fingers:
+            v = f.tip_position
+            extend((v.x, v.y, v.z))
+        v = hand.palm_velocity
+        extend((v.x, v.y, v.z))
+        for f in fingers:
+            v = f.tip_velocity
+            extend((v.x, v.y, v.z))
+        for f in fingers:
+            bones = [f.bone(t) for t in _BONE_TYPES]
+            v = bones[0].prev_joint
+            extend((v.x, v.y, v.z))
+            for b in bones:
+                v = b.next_joint
+                extend((v.x, v.y, v.z))
+        for v in (hand.palm_normal, hand.direction):
+            extend((v.x, v.y, v.z))
+        basis = hand.basis
+        for v in (basis.x_basis, basis.y_basis, basis.z_basis, basis.origin):
+            extend((v.x, v.y, v.z))
+        values.append(1.0 if hand.is_right else 0.0)
+
+        return cls(np.array(values, dtype=np.float32), hand.id, frameID)
+
+    @property
+    def positions(self):
+        # (6,3) palm and fingertip positions
+        return self.buffer[POSITIONS].reshape(6, 3)
+
+    @property
+    def velocities(self):
+        # (6,3) palm and fingertip velocities
+        return self.buffer[VELOCITIES].reshape(6, 3)
+
+    @property
+    def joints(self):
+        # (5,5,3) joint positions of each finger
+        return self.buffer[JOINTS].reshape(5, 5, 3)
+
+    @property
+    def palmPosition(self):
+        return self.buffer[0:3]
+
+    @property
+    def palmVelocity(self):
+        return self.buffer[18:21]
+
+    @property
+    def tipPositions(self):
+        return self.buffer[3:18].reshape(5, 3)
+
+    @property
+    def palmNormal(self):
+        return self.buffer[PALM_NORMAL]
+
+    @property
+    def direction(self):
+        return self.buffer[DIRECTION]
+
+    @property
+    def basis(self):
+        # (4,3) x, y, z basis vectors and origin
+        return self.buffer[BASIS].reshape(4, 3)
+
+    @property
+    def isRight(self):
+        return bool(self.buffer[IS_RIGHT])
+
+    @property
+    def orient(self):
+        return "Right" if self.buffer[IS_RIGHT] else "Left"
+
+    def __getstate__(self):
+        return (self.buffer, self.id, self.frameID)
+
+    def __setstate__(self, state):
+        self.buffer, self.id, self.frameID = state
+
+
+def stackSnapshots(snapshots):
+
+    """This function stacks the buffers of several snapshots for batch
+       processing.
+
+       PARAMETERS:   snapshots: list of HandSnapshot
+
+       RETURNS:      buffers: numpy.ndarray
+                       (N, SNAPSHOT_SIZE) float32 array"""
+
+    if len(snapshots) == 0:
+        return np.empty((0, SNAPSHOT_SIZE), dtype=np.float32)
+    return np.vstack([s.buffer for s in snapshots])
+
+
+def batchPositions(buffers):
+    # (N,6,3) palm and fingertip positions of stacked snapshot buffers
+    return buffers[:, POSITIONS].reshape(-1, 6, 3)
+
+
+def batchVelocities(buffers):
+    # (N,6,3) palm and fingertip velocities of stacked snapshot buffers
+    return buffers[:, VELOCITIES].reshape(-1, 6, 3)
+
+
+def batchJoints(buffers):
+    # (N,5,5,3) finger joint positions of stacked snapshot buffers
+    return buffers[:, JOINTS].reshape(-1, 5, 5, 3)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""
+    A fixed pool of preallocated uint8 stereo image buffers.  The arrays made
+    by lutils.image_to_np_array are views of SDK memory, which the SDK may
+    recycle before the GUI thread has built its QImage.  Instead, the capture
+    thread acquires a slot, copies each sensor image into it with a single
+    memmove, and passes the slot to the GUI.  The GUI wraps the slot memory in
+    a QImage without copying and releases the slot once the preview is drawn.
+    Memory use stays flat however long the session runs.
+"""
+
+import collections
+import threading
+
+import numpy as np
+
+import leap_utilities as lutils
+
+
+class ImageSlot(object):
+
+    """A pooled stereo buffer.  images is a (2,H,W) uint8 array, the left
+       image followed by the right image."""
+
+    __slots__ = ("index", "generation", "images")
+
+    def __init__(self, index, generation, images):
+        self.index = index
+        self.generation = generation
+        self.images = images
+
+
+class ImagePool(object):
+
+    """Pool of 'slots' stereo buffers.  The buffers are allocated when the
+       first frame is copied, and reallocated if the sensor image size
+       changes.  acquire() returns None when every slot is in use, the frame
+       should then be skipped rather than waiting for the GUI."""
+
+    def __init__(self, slots=4):
+
+        self.slots = slots
+        self.exhausted = 0
+        self._lock = threading.Lock()
+        self._buffers = None
+        self._generation = 0
+        self._free = collections.deque()
+
+    def acquire(self, shape):
+
+        """This function takes a free slot for images of the given shape.
+
+           PARAMETERS:   shape: tuple
+                           (height, width) of the sensor images
+
+           RETURNS:      slot: ImageSlot, or None if all slots are in use"""
+
+        with self._lock:
+            if self._buffers is None or self._buffers.shape[2:] != tuple(shape):
+                # slots of the previous size are dropped when released
+                self._buffers = np.zeros((self.slots, 2) + tuple(shape), dtype=np.uint8)
+                self._generation += 1
+                self._free = collections.deque(range(self.slots))
+            if not self._free:
+                self.exhausted += 1
+                return None
+            index = self._free.popleft()
+            return ImageSlot(index, self._generation, self._buffers[index])
+
+    def release(self, slot):
+
+        """This function returns a slot to the pool.
+
+           PARAMETERS:   slot: ImageSlot"""
+
+        with self._lock:
+            if slot.generation == self._generation:
+                self._free.append(slot.index)
+
+    def copyFrame(self, images):
+
+        """This function copies the images of a Leap.ImageList into a free
+           slot, with one memmove per valid image.
+
+           PARAMETERS:   images: Leap.ImageList
+                           the left and right images of the frame
+
+           RETURNS:      slot: ImageSlot, or None if no image is valid or all
+                           slots are in use"""
+
+        if images.is_empty:
+            return None
+        valid = [img for img in (images[0], images[1]) if img.is_valid]
+        if not valid:
+            return None
+        slot = self.acquire((valid[0].height, valid[0].width))
+        if slot is None:
+            return None
+        for i in range(0, 2):
+            if images[i].is_valid:
+                lutils.copy_image_into(images[i], slot.images[i])
+
+        return slot
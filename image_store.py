@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Append-only storage for the collected stereo images.  Writing two JPEG
+    files per frame leaves hundreds of thousands of tiny files in the data
+    directories, and training has to decode them one at a time.  An
+    ImageStore appends the raw uint8 (2,H,W) stereo pairs of one user and
+    session to preallocated memory-mapped shard files, and records each frame
+    in a sidecar index of fixed-size records.  Reading a store maps the shards
+    and reads the index in one call, so the frames of a class are returned as
+    array slices of the shards, without copying or decoding.
+
+    A store is a directory holding:
+
+        store.json        image shape and shard capacity
+        index.bin         one INDEX_DTYPE record per frame, in append order
+        shard_0000.u8     (capacity,2,H,W) uint8 frames, shard_0001.u8, ...
+
+    The index record is appended after the images are copied, so a frame is
+    only visible to readers once it is complete.
+"""
+
+import json
+import os
+
+import numpy as np
+
+import leap_utilities as lutils
+
+
+INDEX_DTYPE = np.dtype([("user", "<u2"),
+                        ("char", "S4"),
+                        ("hand", "S2"),
+                        ("count", "<u4"),
+                        ("frame_id", "<i8"),
+                        ("shard", "<u2"),
+                        ("row", "<u4")])
+META_FILE = "store.json"
+INDEX_FILE = "index.bin"
+SHARD_FILE = "shard_%04d.u8"
+
+
+class ImageStore(object):
+
+    """Memory-mapped store of the stereo images of one user and session.
+       Opened with mode 'a' the store can be appended to, new shards of
+       'capacity' frames are allocated as needed.  Opened with mode 'r' the
+       shards are mapped read-only."""
+
+    def __init__(self, path, mode="a", user=0, capacity=512):
+
+        if mode not in ("a", "r"):
+            raise ValueError("mode must be 'a' or 'r'")
+        self.path = path
+        self.mode = mode
+        self.user = user
+        self.capacity = capacity
+        self.shape = None
+        self._shards = []
+        self._indexFile = None
+
+        metaPath = os.path.join(path, META_FILE)
+        if os.path.exists(metaPath):
+            with open(metaPath) as meta_file:
+                meta = json.load(meta_file)
+            self.shape = tuple(meta["shape"])
+            self.capacity = meta["capacity"]
+            self.user = meta.get("user", user)
+        elif mode == "r":
+            raise IOError("No image store in %s" % path)
+        elif not os.path.isdir(path):
+            os.makedirs(path)
+
+        self._index = self._readIndex()
+        self._size = len(self._index)
+        if self.shape is not None:
+            numShards = (self._size + self.capacity - 1) // self.capacity
+            for shard in range(numShards):
+                self._shards.append(self._mapShard(shard))
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def index(self):
+        # (N,) INDEX_DTYPE records, in append order
+        return self._index[:self._size]
+
+    def append(self, images, char="", hand="", count=0, frameID=-1, user=None):
+
+        """This function appends a stereo pair to the store.
+
+           PARAMETERS:   images: numpy.ndarray
+                           (2,H,W) uint8 array, or a (left, right) pair of
+                           (H,W) arrays
+
+                         char,hand: string
+                           the character and the hand ('LH' or 'RH')
+
+                         count: integer
+                           the count of the frame in its collection
+
+                         frameID: integer
+                           the id of the Leap frame
+
+                         user: integer
+                           the user id, defaults to the store's user
+
+           RETURNS:      record: numpy.void
+                           the index record of the frame"""
+
+        left, right = images[0], images[1]
+        rows = self._nextRow(left.shape)
+        rows[0] = left
+        rows[1] = right
+
+        return self._commit(char, hand, count, frameID, user)
+
+    def appendFrame(self, frame, char="", hand="", count=0, user=None):
+
+        """This function copies the images of a Leap frame straight into the
+           store, with one memmove per image.
+
+           PARAMETERS:   frame: Leap.Frame
+                           a frame whose two images are valid
+
+                         char,hand,count,user: see append()
+
+           RETURNS:      record: numpy.void, or None if the images are not
+                           valid"""
+
+        images = frame.images
+        if images.is_empty or not (images[0].is_valid and images[1].is_valid):
+            return None
+        rows = self._nextRow((images[0].height, images[0].width))
+        lutils.copy_image_into(images[0], rows[0])
+        lutils.copy_image_into(images[1], rows[1])
+
+        return self._commit(char, hand, count, frame.id, user)
+
+    def images(self, records=None):
+
+        """This function returns the images of index records.
+
+           PARAMETERS:   records: numpy.ndarray
+                           INDEX_DTYPE records of this store, defaults to the
+                           whole index
+
+           RETURNS:      images: list of numpy.ndarray
+                           (n,2,H,W) views of the shards, one per run of
+                           consecutive rows"""
+
+        if records is None:
+            records = self.index
+        views = []
+        if len(records) == 0:
+            return views
+        shards = records["shard"].astype(np.int64)
+        rows = records["row"].astype(np.int64)
+        # a run ends where the next record is not the next row of the shard
+        breaks = np.nonzero((np.diff(shards) != 0) | (np.diff(rows) != 1))[0] + 1
+        starts = np.concatenate(([0], breaks))
+        ends = np.concatenate((breaks, [len(records)]))
+        for start, end in zip(starts, ends):
+            shard = self._shards[shards[start]]
+            views.append(shard[rows[start]:rows[end - 1] + 1])
+
+        return views
+
+    def select(self, char=None, hand=None, user=None):
+
+        """This function returns the index records matching a character, hand
+           and user.  Arguments left as None match every record."""
+
+        records = self.index
+        mask = np.ones(len(records), dtype=bool)
+        if char is not None:
+            mask &= records["char"] == _asBytes(char)
+        if hand is not None:
+            mask &= records["hand"] == _asBytes(hand)
+        if user is not None:
+            mask &= records["user"] == user
+
+        return records[mask]
+
+    def loadClass(self, char, hand=None, user=None):
+
+        """This function returns the images of a class as views of the shards,
+           see images()."""
+
+        return self.images(self.select(char, hand, user))
+
+    def flush(self):
+
+        """This function writes the mapped shards and the index to disk."""
+
+        for shard in self._shards:
+            if self.mode == "a":
+                shard.flush()
+        if self._indexFile is not None:
+            self._indexFile.flush()
+
+    def close(self):
+
+        """This function flushes and closes the store."""
+
+        self.flush()
+        if self._indexFile is not None:
+            self._indexFile.close()
+            self._indexFile = None
+        self._shards = []
+
+    def _nextRow(self, shape):
+        if self.mode != "a":
+            raise IOError("The image store is read-only")
+        shape = tuple(shape)
+        if self.shape is None:
+            self.shape = shape
+            with open(os.path.join(self.path, META_FILE), "w") as meta_file:
+                json.dump({"shape": list(shape), "capacity": self.capacity,
+                           "user": self.user}, meta_file)
+        elif shape != self.shape:
+            raise ValueError("Image shape %s does not match the store's %s" % (shape, self.shape))
+        shard, row = divmod(self._size, self.capacity)
+        if shard == len(self._shards):
+            self._shards.append(self._mapShard(shard))
+
+        return self._shards[shard][row]
+
+    def _commit(self, char, hand, count, frameID, user):
+        shard, row = divmod(self._size, self.capacity)
+        if self._size == len(self._index):
+            grown = np.zeros(max(64, 2 * len(self._index)), dtype=INDEX_DTYPE)
+            grown[:self._size] = self._index
+            self._index = grown
+        record = self._index[self._size]
+        record["user"] = self.user if user is None else user
+        record["char"] = _asBytes(char)
+        record["hand"] = _asBytes(hand)
+        record["count"] = count
+        record["frame_id"] = frameID
+        record["shard"] = shard
+        record["row"] = row
+        if self._indexFile is None:
+            self._indexFile = open(os.path.join(self.path, INDEX_FILE), "ab")
+        self._indexFile.write(self._index[self._size:self._size + 1].tobytes())
+        self._indexFile.flush()
+        self._size += 1
+
+        return record
+
+    def _mapShard(self, shard):
+        fname = os.path.join(self.path, SHARD_FILE % shard)
+        shape = (self.capacity, 2) + self.shape
+        if self.mode == "r":
+            return np.memmap(fname, dtype=np.uint8, mode="r", shape=shape)
+        mode = "r+" if os.path.exists(fname) else "w+"
+        return np.memmap(fname, dtype=np.uint8, mode=mode, shape=shape)
+
+    def _readIndex(self):
+        fname = os.path.join(self.path, INDEX_FILE)
+        if not os.path.exists(fname):
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        # a record cut short by a crash is ignored
+        count = os.path.getsize(fname) // INDEX_DTYPE.itemsize
+        return np.fromfile(fname, dtype=INDEX_DTYPE, count=count)
+
+
+def findStores(root):
+
+    """This function finds the image stores below a directory.
+
+       PARAMETERS:   root: string
+                       e.g. the data directory holding the User_XX directories
+
+       RETURNS:      paths: list of string
+                       the store directories, sorted"""
+
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if META_FILE in filenames:
+            paths.append(dirpath)
+            del dirnames[:]
+
+    return sorted(paths)
+
+
+def loadClassImages(root, char, hand=None, user=None):
+
+    """This function collects the images of a class from every store below a
+       directory.
+
+       PARAMETERS:   root: string
+                       the directory to search, see findStores()
+
+                     char,hand,user: see ImageStore.select()
+
+       RETURNS:      images: list of numpy.ndarray
+                       (n,2,H,W) read-only views of the shards"""
+
+    views = []
+    for path in findStores(root):
+        views.extend(ImageStore(path, mode="r").loadClass(char, hand, user))
+
+    return views
+
+
+def _asBytes(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode("ascii")
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Sign prediction for the ASL Translator.  A SignPredictor runs a fitted
+    classifier once per feature vector through predict_proba, on a
+    preallocated float32 row, and takes the predicted sign from the argmax of
+    the probabilities.  The prediction therefore costs one pass through the
+    model and carries the confidence and the runner-up signs for free.
+
+    A CachedPredictor puts a bounded LRU cache of predictions in front of a
+    SignPredictor.  A held sign gives nearly the same feature vector frame
+    after frame; the vector is rounded to a grid and frames that fall in the
+    same cell reuse the prediction of the first one.
+
+    An AsyncPredictor runs a SignPredictor on a worker thread, so that the
+    capture loop never waits on the model.
+"""
+
+import collections
+import sys
+import threading
+import traceback
+
+import numpy as np
+
+from instrumentation import DISABLED
+
+
+class SignPredictor(object):
+
+    """Wraps a fitted classifier that provides predict_proba and classes_,
+       such as the RandomForest used by the translator."""
+
+    def __init__(self, model, topK=3):
+
+        self.model = model
+        self.classes = np.asarray(model.classes_)
+        self.topK = topK
+        # tree models validate their input as float32, a float32 row is not
+        # copied again
+        self._row = None
+
+    def predict(self, features):
+
+        """This function predicts the sign of a single feature vector.
+
+           PARAMETERS:   features: numpy.ndarray
+                           (P,) feature vector in the model's column order
+
+           RETURNS:      prediction: dictionary
+                           the predicted sign ('Predict'), its probability
+                           ('Probability') and the topK most probable signs
+                           with their probabilities ('TopK')"""
+
+        if self._row is None or self._row.shape[1] != len(features):
+            self._row = np.empty((1, len(features)), dtype=np.float32)
+        self._row[0] = features
+        proba = self.model.predict_proba(self._row)
+
+        return self.result(proba[0])
+
+    def predictBatch(self, features):
+
+        """This function predicts the signs of several feature vectors with a
+           single model call.
+
+           PARAMETERS:   features: numpy.ndarray
+                           (N,P) feature vectors
+
+           RETURNS:      predictions: list of dictionary
+                           one prediction per row, as returned by predict()"""
+
+        features = np.asarray(features, dtype=np.float32)
+        if len(features) == 0:
+            return []
+        proba = self.model.predict_proba(features)
+
+        return [self.result(p) for p in proba]
+
+    def result(self, proba):
+
+        """This function builds the prediction dictionary from the class
+           probabilities of one sample.
+
+           PARAMETERS:   proba: numpy.ndarray
+                           (n_classes,) probabilities in classes order
+
+           RETURNS:      prediction: dictionary"""
+
+        best = int(np.argmax(proba))
+        order = np.argsort(-proba, kind="mergesort")[:self.topK]
+
+        return {"Predict": self.classes[best],
+                "Probability": float(proba[best]),
+                "TopK": [(self.classes[i], float(proba[i])) for i in order]}
+
+
+class CachedPredictor(object):
+
+    """Caches the predictions of a SignPredictor by quantized feature vector.
+       The key is the bytes of round(features / step), so two vectors share
+       an entry only if every feature lies in the same cell of width step.
+       The features are distances in millimetres, and a cached prediction is
+       therefore that of a hand whose distances all differ by less than step
+       from the one predicted.
+
+       Tolerance:  the forest is piecewise constant, and a cell only gives a
+       different answer than the model where a split threshold crosses it.
+       Every verifyEvery-th hit is predicted again by the model; the hit
+       agrees if the sign is the same and the probability is within
+       tolerance (0.1 by default).  A disagreeing entry is replaced by the
+       model's prediction and counted in mismatches, so a step that is too
+       coarse shows up as a mismatch rate instead of wrong signs.
+
+       The hits, misses, evictions and mismatches are counted, and reported
+       to metrics as the 'cache hit' and 'cache miss' counters.  The cache is
+       meant for a single thread, such as the worker of an AsyncPredictor."""
+
+    def __init__(self, predictor, step=1.0, capacity=256, verifyEvery=0,
+                 tolerance=0.1, metrics=None):
+
+        if step <= 0:
+            raise ValueError("The quantization step must be positive")
+        self.predictor = predictor
+        self.classes = predictor.classes
+        self.step = float(step)
+        self.capacity = capacity
+        self.verifyEvery = verifyEvery
+        self.tolerance = tolerance
+        self.metrics = DISABLED if metrics is None else metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.mismatches = 0
+        self._cache = collections.OrderedDict()
+
+    def key(self, features):
+
+        """This function quantizes a feature vector into a cache key.
+
+           PARAMETERS:   features: numpy.ndarray
+                           (P,) feature vector
+
+           RETURNS:      key: bytes"""
+
+        cells = np.floor(np.asarray(features, dtype=np.float64) / self.step + 0.5)
+        return cells.astype(np.int32).tobytes()
+
+    def predict(self, features):
+
+        """This function predicts the sign of a single feature vector, from
+           the cache if a vector of the same cell was predicted.
+
+           PARAMETERS:   features: numpy.ndarray
+                           (P,) feature vector in the model's column order
+
+           RETURNS:      prediction: dictionary
+                           as returned by SignPredictor.predict"""
+
+        key = self.key(features)
+        cached = self._lookup(key, features)
+        if cached is not None:
+            return dict(cached)
+        prediction = self.predictor.predict(features)
+        self._store(key, prediction)
+        return dict(prediction)
+
+    def predictBatch(self, features):
+
+        """This function predicts the signs of several feature vectors.  The
+           vectors missing from the cache are predicted with one model call.
+
+           PARAMETERS:   features: numpy.ndarray
+                           (N,P) feature vectors
+
+           RETURNS:      predictions: list of dictionary"""
+
+        features = np.asarray(features, dtype=np.float32)
+        keys = [self.key(row) for row in features]
+        predictions = [self._lookup(key, row) for key, row in zip(keys, features)]
+        missing = [i for i, prediction in enumerate(predictions) if prediction is None]
+        if missing:
+            for i, prediction in zip(missing, self.predictor.predictBatch(features[missing])):
+                self._store(keys[i], prediction)
+                predictions[i] = prediction
+        return [dict(prediction) for prediction in predictions]
+
+    def clear(self):
+
+        """This function empties the cache, e.g. when the model changes."""
+
+        self._cache.clear()
+
+    def summary(self):
+
+        """This function formats the cache counters."""
+
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return ("Prediction cache: %d hits, %d misses (%.1f%% hits), %d evictions, "
+                "%d mismatches, %d entries" % (self.hits, self.misses, rate, self.evictions,
+                                               self.mismatches, len(self._cache)))
+
+    def _lookup(self, key, features):
+        # the cached prediction, moved to the recent end, or None on a miss
+        prediction = self._cache.get(key)
+        if prediction is None:
+            self.misses += 1
+            self.metrics.count("cache miss")
+            return None
+        self.hits += 1
+        self.metrics.count("cache hit")
+        if self.verifyEvery and self.hits % self.verifyEvery == 0:
+            checked = self.predictor.predict(features)
+            if (checked["Predict"] != prediction["Predict"] or
+                    abs(checked["Probability"] - prediction["Probability"]) > self.tolerance):
+                self.mismatches += 1
+                self.metrics.count("cache mismatch")
+                prediction = checked
+        # Python 2 OrderedDict has no move_to_end
+        del self._cache[key]
+        self._cache[key] = prediction
+        return prediction
+
+    def _store(self, key, prediction):
+        self._cache[key] = prediction
+        if len(self._cache) > self.capacity:
+            # least recently used first
+            self._cache.popitem(last=False)
+            self.evictions += 1
+
+
+class AsyncPredictor(object):
+
+    """Runs a SignPredictor on a dedicated worker thread.  submit() never
+       blocks:  the request is stored in a single pending slot, and a request
+       that has not been started yet is dropped when a newer one arrives, so
+       the model always works on the most recent frame.  Completed predictions
+       are picked up by frame id with results().  The tree models release the
+       GIL while they are evaluated, so the capture thread keeps running while
+       the worker predicts.  The time spent in the model is recorded in the
+       'predict' span of metrics.  A request whose prediction raises is
+       counted in failed and printed, the worker goes on with the next one."""
+
+    def __init__(self, predictor, metrics=None):
+
+        self.predictor = predictor
+        self.metrics = DISABLED if metrics is None else metrics
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+        self.lastError = None
+        self._cond = threading.Condition()
+        self._pending = None
+        self._results = collections.deque()
+        self._running = True
+        self._working = False
+        self._thread = threading.Thread(target=self._run, name="AsyncPredictor")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def busy(self):
+        # True while a request is waiting or being predicted
+        with self._cond:
+            return self._pending is not None or self._working
+
+    def submit(self, frameID, features, context=None):
+
+        """This function queues a feature vector for prediction and returns
+           immediately.
+
+           PARAMETERS:   frameID: integer
+                           the id of the frame the features belong to
+
+                         features: numpy.ndarray
+                           (P,) feature vector, or (N,P) feature vectors
+                           predicted with one model call (predictBatch), it
+                           must not be modified afterwards
+
+                         context: object
+                           returned with the prediction, e.g. the snapshot"""
+
+        with self._cond:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = (frameID, features, context)
+            self.submitted += 1
+            self._cond.notify()
+
+    def results(self):
+
+        """This function returns the predictions completed since the last
+           call, oldest first.
+
+           RETURNS:      results: list of tuple
+                           (frameID, prediction, context) for each request,
+                           prediction is a list for (N,P) features"""
+
+        results = []
+        while self._results:
+            results.append(self._results.popleft())
+        return results
+
+    def summary(self):
+
+        """This function formats the request counters."""
+
+        return ("Inference: %d submitted, %d dropped, %d completed, %d failed" %
+                (self.submitted, self.dropped, self.completed, self.failed))
+
+    def close(self):
+
+        """This function stops the worker thread once the current request is
+           done.  Pending requests are dropped."""
+
+        with self._cond:
+            self._running = False
+            self._pending = None
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._working = False
+                while self._running and self._pending is None:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                frameID, features, context = self._pending
+                self._pending = None
+                self._working = True
+            try:
+                with self.metrics.span("predict"):
+                    if features.ndim == 2:
+                        prediction = self.predictor.predictBatch(features)
+                    else:
+                        prediction = self.predictor.predict(features)
+            except Exception as error:
+                self._failed(frameID, features, error)
+                continue
+            self._results.append((frameID, prediction, context))
+            self.completed += 1
+
+    def _failed(self, frameID, features, error):
+        # the same error usually repeats on every frame, it is printed once
+        self.failed += 1
+        self.metrics.count("predict error")
+        message = "%s: %s" % (type(error).__name__, error)
+        if message != self.lastError:
+            sys.stderr.write("Prediction of frame %s with %s features failed:\n%s" %
+                             (frameID, features.shape, traceback.format_exc()))
+        self.lastError = message
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Low overhead latency instrumentation for the capture loop.  Code under
+    test is wrapped in named spans:
+
+        with metrics.span("features"):
+            features = self.extractFeatures(snapshot, hand)
+
+    Each span adds its duration to a histogram with fixed, logarithmic
+    buckets, so recording costs a bisect and a few additions however long
+    the session runs, and percentiles can be read at any time.  Counters
+    record events such as cache hits.
+
+    A disabled Metrics hands out a shared span that does nothing, so the
+    instrumentation can stay in the loop at almost no cost.
+"""
+
+import bisect
+import json
+import threading
+import time
+
+try:
+    from time import perf_counter
+except ImportError:
+    from timeit import default_timer as perf_counter
+
+# bucket upper bounds in seconds, 4 per decade from 10 us to 10 s
+BUCKETS = [10 ** (e / 4.0) for e in range(-20, 5)]
+
+
+class Histogram(object):
+
+    """Counts of durations per bucket.  The last bucket holds everything
+       above the largest bound."""
+
+    __slots__ = ("counts", "count", "total", "maximum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+
+        """This function estimates a percentile from the buckets.
+
+           PARAMETERS:   q: float
+                           the percentile, between 0 and 100
+
+           RETURNS:      seconds: float
+                           the upper bound of the bucket holding it"""
+
+        if not self.count:
+            return 0.0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return BUCKETS[index] if index < len(BUCKETS) else self.maximum
+        return self.maximum
+
+
+class _Span(object):
+
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, perf_counter() - self.start)
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Metrics(object):
+
+    """Histograms of named spans and event counters.  All methods may be
+       called from any thread."""
+
+    def __init__(self, enabled=True):
+
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+
+        """This function clears the histograms and counters."""
+
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+            self.started = time.time()
+
+    def span(self, name):
+
+        """This function returns a context manager timing its block.
+
+           PARAMETERS:   name: string
+                           the histogram the duration is added to"""
+
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name, seconds):
+
+        """This function adds a duration measured elsewhere."""
+
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds)
+
+    def count(self, name, n=1):
+
+        """This function increments an event counter."""
+
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self, names=None):
+
+        """This function formats the median and 95th percentile of the spans
+           and the counters on one line, e.g. for the status bar.
+
+           PARAMETERS:   names: list of string
+                           the spans to show, in order, defaults to all"""
+
+        with self._lock:
+            if names is None:
+                names = sorted(self.histograms)
+            parts = []
+            for name in names:
+                histogram = self.histograms.get(name)
+                if histogram is not None and histogram.count:
+                    parts.append("%s %.2f/%.2f ms" % (name, histogram.percentile(50) * 1e3,
+                                                     histogram.percentile(95) * 1e3))
+            for name in sorted(self.counters):
+                parts.append("%s %d" % (name, self.counters[name]))
+        return " | ".join(parts)
+
+    def snapshot(self):
+
+        """This function returns the metrics as a dictionary of plain values,
+           with the bucket bounds in seconds."""
+
+        with self._lock:
+            spans = {}
+            for name, histogram in self.histograms.items():
+                spans[name] = {"count": histogram.count,
+                               "mean": histogram.mean,
+                               "max": histogram.maximum,
+                               "p50": histogram.percentile(50),
+                               "p95": histogram.percentile(95),
+                               "p99": histogram.percentile(99),
+                               "buckets": list(histogram.counts)}
+            return {"started": self.started,
+                    "time": time.time(),
+                    "bounds": BUCKETS,
+                    "spans": spans,
+                    "counters": dict(self.counters)}
+
+    def dump(self, fname):
+
+        """This function appends the snapshot to a file, one JSON object per
+           line.
+
+           PARAMETERS:   fname: string
+                           the metrics file"""
+
+        with open(fname, "a") as metrics_file:
+            metrics_file.write(json.dumps(self.snapshot(), sort_keys=True) + "\n")
+
+
+# shared by code that is not given a Metrics
+DISABLED = Metrics(enabled=False)
@@ -10,16 +10,14 @@ __date__    : "09/16/17"
 __version__ : "Version 0.1"
 """
 
-import array
-import cv2
+## Only light modules are imported here.  Image encoding (scipy, PIL) is
+## imported by the functions that write images.
 import ctypes
+import mmap
 import numpy as np
-import scipy.misc
-from sklearn.model_selection import train_test_split
-from sklearn import preprocessing
+import os
 import struct
 import sys
-import timeit
 
 # Paths to Leap SDK
 src_dir = r'S:\LeapDeveloperKit_3.2.0+45899_win\LeapDeveloperKit_3.2.0+45899_win\LeapSDK\lib'
@@ -29,100 +27,212 @@ arch_dir = r'S:\LeapDeveloperKit_3.2.0+45899_win\LeapDeveloperKit_3.2.0+45899_wi
 sys.path.insert(0,src_dir)
 sys.path.insert(0,arch_dir)
 # import the API
-import Leap
+try:
+    import Leap
+except ImportError:
+    # The SDK is only required to read and deserialize Leap frames, the
+    # hand checks also work on HandSnapshots of other frame sources
+    Leap = None
+from hand_snapshot import HandSnapshot, POSITIONS, VELOCITIES
+from frame_writer import saveImage
+
+# Speed (mm/s) above which the palm or a fingertip is considered moving
+SPEEDTHRESH = 10
+# Distance (mm) the palm or a fingertip must travel for the hand to have changed
+MOVETHRESH = 7
+
+# path types: unicode paths are strings too on Python 2
+try:
+    _STRING_TYPES = basestring
+except NameError:
+    _STRING_TYPES = str
+
+def handPositions(hand):
+    
+    """This function copies the palm and fingertip positions of a hand into
+       a numpy array, in the layout used by handsChanged.
+       
+       PARAMETERS:   hand: Leap.Hand or HandSnapshot
+                       The hand to copy
+                       
+       RETURNS:      positions: numpy.ndarray
+                       (6,3) array, the palm followed by the five fingertips"""
+    
+    if isinstance(hand, HandSnapshot):
+        return hand.positions
+    positions = np.empty((6,3))
+    pos = hand.palm_position
+    positions[0] = pos.x, pos.y, pos.z
+    fingers = hand.fingers
+    for i in range(0,5):
+        pos = fingers[i].tip_position
+        positions[i+1] = pos.x, pos.y, pos.z
+    
+    return positions
+
+def handVelocities(hand):
+    
+    """This function copies the palm and fingertip velocities of a hand into
+       a numpy array, in the layout used by handsMoving.
+       
+       PARAMETERS:   hand: Leap.Hand or HandSnapshot
+                       The hand to copy
+                       
+       RETURNS:      velocities: numpy.ndarray
+                       (6,3) array, the palm followed by the five fingertips"""
+    
+    if isinstance(hand, HandSnapshot):
+        return hand.velocities
+    velocities = np.empty((6,3))
+    vel = hand.palm_velocity
+    velocities[0] = vel.x, vel.y, vel.z
+    fingers = hand.fingers
+    for i in range(0,5):
+        vel = fingers[i].tip_velocity
+        velocities[i+1] = vel.x, vel.y, vel.z
+    
+    return velocities
+
+def handsMoving(velocities, thresh=SPEEDTHRESH):
+    
+    """This function checks a batch of hands for movement.  A hand is moving
+       if the speed of the palm or of any fingertip exceeds the threshold.
+       
+       PARAMETERS:   velocities: numpy.ndarray
+                       (N,6,3) palm and fingertip velocities, or (6,3) for a
+                       single hand
+                       
+                     thresh: float
+                       the speed threshold in mm/s
+                       
+       RETURNS:      moving: numpy.ndarray
+                       (N,) boolean mask, True where the hand is moving"""
+    
+    v = np.asarray(velocities, dtype=np.float64)
+    speedSq = np.einsum('...ij,...ij->...i', v, v)
+    
+    return (speedSq > thresh**2).any(axis=-1)
+
+def handsChanged(pPositions, cPositions, thresh=MOVETHRESH):
+    
+    """This function checks a batch of hand pairs for a change of position.
+       A hand has changed if the palm or any fingertip moved further than the
+       threshold between the previous and the current hand.  For a recorded
+       session, handsChanged(positions[:-1], positions[1:]) compares each
+       frame with the one before it.
+       
+       PARAMETERS:   pPositions,cPositions: numpy.ndarray
+                       (N,6,3) palm and fingertip positions of the previous
+                       and the current hands, or (6,3) for a single pair
+                       
+                     thresh: float
+                       the distance threshold in mm
+                       
+       RETURNS:      changed: numpy.ndarray
+                       (N,) boolean mask, True where the hand has changed"""
+    
+    d = np.asarray(cPositions, dtype=np.float64) - np.asarray(pPositions, dtype=np.float64)
+    distSq = np.einsum('...ij,...ij->...i', d, d)
+    
+    return (distSq > thresh**2).any(axis=-1)
+
+def _anyExceeds(values, threshSq):
+    # True if any of the (x,y,z) triples of a flat list is longer than the
+    # threshold, checked one point at a time
+    for i in range(0,len(values),3):
+        x, y, z = values[i], values[i+1], values[i+2]
+        if x*x + y*y + z*z > threshSq:
+            return True
+    return False
+
+def _anyMoved(pValues, cValues, threshSq):
+    # True if any (x,y,z) triple moved further than the threshold
+    for i in range(0,len(pValues),3):
+        x = cValues[i] - pValues[i]
+        y = cValues[i+1] - pValues[i+1]
+        z = cValues[i+2] - pValues[i+2]
+        if x*x + y*y + z*z > threshSq:
+            return True
+    return False
+
+def _flatPositions(hand):
+    # the 18 palm and fingertip coordinates of a hand as Python floats
+    if isinstance(hand, HandSnapshot):
+        return hand.buffer[POSITIONS].tolist()
+    return handPositions(hand).ravel().tolist()
 
 def handMoving(hand):
     """This function will check whether the hand under test is moving or not.  A
        threshold value is used to check for movement, since the Leap sensor reports
-       movement in millimeters.
+       movement in millimeters.  A single hand is checked one point at a time,
+       stopping at the first moving one, use handsMoving for arrays of hands.
        
-       PARAMETERS:   hand: Leap.Hand
+       PARAMETERS:   hand: Leap.Hand or HandSnapshot
                        The hand to check for movement
                        
        RETURNS:      moving: boolean
                        True if hand is moving"""
     
-    moving = False
-    x = hand.palm_velocity.x
-    y = hand.palm_velocity.y
-    z = hand.palm_velocity.z
-    
-    SPEEDTHRESH = 10
-    
-    handSpd = np.sqrt(x**2 + y**2 + z**2)
-    
-    #print "HANDMOVING",handSpd
-    
-    if handSpd > SPEEDTHRESH:
-        #print "HandMove(): Hand Moved"
-        moving = True
-    
-    else:
-        #print "HandMove(): %s" % handSpd
-        ## Hand is considered not moving. Check fingers
-        for i in range(0,5):
-            fngr = hand.fingers[i]
-            fx = fngr.tip_velocity.x
-            fy = fngr.tip_velocity.y
-            fz = fngr.tip_velocity.z
-            fngrSpd = np.sqrt(fx**2 + fy**2 + fz**2)
-            #print "FINGERMOVING",fngrSpd
-            if fngrSpd > (SPEEDTHRESH):
-                #print "HandMove(): Finger Moved"
-                moving = True
-                break
-    
-    return moving
+    threshSq = SPEEDTHRESH**2
+    if isinstance(hand, HandSnapshot):
+        return _anyExceeds(hand.buffer[VELOCITIES].tolist(),threshSq)
+    v = hand.palm_velocity
+    if v.x*v.x + v.y*v.y + v.z*v.z > threshSq:
+        return True
+    fingers = hand.fingers
+    for i in range(0,5):
+        v = fingers[i].tip_velocity
+        if v.x*v.x + v.y*v.y + v.z*v.z > threshSq:
+            return True
+    return False
 
 def handChanged(pHand,cHand):
     
     """This function will check the distance between a point in two frames (hands).
        If the distance between the points exceeds the threshold, the hand is 
-       considered to be moving.
+       considered to be moving.  A single pair is checked one point at a time,
+       stopping at the first moved one, use handsChanged for arrays of hands.
        
-       PARAMETERS:   pHand,cHand: Leap.Hand
+       PARAMETERS:   pHand,cHand: Leap.Hand or HandSnapshot
                        the previouis hand and the current hand to check for 
                        movement
                        
        RETURNS:     changed: boolean
                        True if hand has changed position"""
     
-    changed = False
-    MOVETHRESH = 7
-    
-    px = pHand.palm_position.x
-    py = pHand.palm_position.y
-    pz = pHand.palm_position.z
-    cx = pHand.palm_position.x
-    cy = pHand.palm_position.y
-    cz = pHand.palm_position.z
-    
-    #print "HANDCHANGE",distanceR3(px,cx,py,cy,pz,cz)
-    #print pHand.frame.id,cHand.frame.id
-    #print "Valid: %s,%s" %(pHand.is_valid,cHand.is_valid)
-    if distanceR3(px,cx,py,cy,pz,cz) > MOVETHRESH:
-        #print "HANDCHANGE(): Hand Moved"
-        changed = True
-        
-    else:
-        ## Hand is considered to not be changed.  Check fingers
-        for i in range(0,5):
-            pfngr = pHand.fingers[i]
-            cfngr = cHand.fingers[i]
-            px = pfngr.tip_position.x
-            py = pfngr.tip_position.y
-            pz = pfngr.tip_position.z
-            cx = cfngr.tip_position.x
-            cy = cfngr.tip_position.y
-            cz = cfngr.tip_position.z
-            #print "FINGERCHANGE",distanceR3(px,cx,py,cy,pz,cz)
-            if distanceR3(px,cx,py,cy,pz,cz) > MOVETHRESH:
-                #print "HANDCHANGE(): Finger Moved"
-                changed = True
-                break
+    threshSq = MOVETHRESH**2
+    if isinstance(pHand, HandSnapshot) or isinstance(cHand, HandSnapshot):
+        return _anyMoved(_flatPositions(pHand),_flatPositions(cHand),threshSq)
+    p, c = pHand.palm_position, cHand.palm_position
+    x, y, z = c.x - p.x, c.y - p.y, c.z - p.z
+    if x*x + y*y + z*z > threshSq:
+        return True
+    pFingers, cFingers = pHand.fingers, cHand.fingers
+    for i in range(0,5):
+        p, c = pFingers[i].tip_position, cFingers[i].tip_position
+        x, y, z = c.x - p.x, c.y - p.y, c.z - p.z
+        if x*x + y*y + z*z > threshSq:
+            return True
+    return False
 
-        
-    return changed
+def findHand(hands,isRight):
+    
+    """This function picks the hand of the given handedness, rather than the
+       first hand, when both hands are in view.
+       
+       PARAMETERS:   hands: Leap.HandList
+                       the hands of a frame
+                       
+                     isRight: boolean
+                       True for the right hand
+                       
+       RETURNS:     hand: Leap.Hand
+                       the first valid hand of that handedness, or None"""
+    
+    for hand in hands:
+        if hand.is_valid and bool(hand.is_right) == isRight:
+            return hand
+    return None
     
 
 def distanceR3(x1,x2,y1,y2,z1,z2):
@@ -141,8 +251,9 @@ def putHandInIBox(palmPos,iBox):
        of the Leap Frame Interaction Box.  Will return a message indicating if 
        hand is in box, or how to get hand in box.
        
-       PARAMETERS:   palmPos: Leap.Vector
-                       A Leap.Vector containing the X/Y/Z position of the palm
+       PARAMETERS:   palmPos: Leap.Vector or numpy.ndarray
+                       A Leap.Vector containing the X/Y/Z position of the palm,
+                       or the palmPosition of a HandSnapshot
                      
                      iBox:  Leap.InteractionBox
                        The Leap.Interaction box to compare position to.
@@ -152,32 +263,36 @@ def putHandInIBox(palmPos,iBox):
                      the InteractionBox.
     """
     
+    if isinstance(palmPos, np.ndarray):
+        x, y, z = palmPos
+    else:
+        x, y, z = palmPos.x, palmPos.y, palmPos.z
     iBoxWidth = iBox.width # x-axis
     iBoxHeight = iBox.height # y-axis
     iBoxDepth = iBox.depth # z-axis
     iBoxCenter = iBox.center # vector
     msg = ""
     ## Assuming orientation is facing user,light down (bottom right corner),plug on left
-    if palmPos.z > (iBoxCenter.z + (iBoxDepth / 2)):
+    if z > (iBoxCenter.z + (iBoxDepth / 2)):
         msg = "Move hand up"
-    if palmPos.z < (iBoxCenter.z - (iBoxDepth / 2)):
+    if z < (iBoxCenter.z - (iBoxDepth / 2)):
         msg = "Move hand down"
-    if palmPos.x > (iBoxCenter.x + (iBoxWidth / 2)):
+    if x > (iBoxCenter.x + (iBoxWidth / 2)):
         if msg == "":
             msg = "Move hand left"
         else:
             msg = msg + ", left"
-    if palmPos.x < (iBoxCenter.x - (iBoxWidth / 2)):
+    if x < (iBoxCenter.x - (iBoxWidth / 2)):
         if msg == "":
             msg = "Move hand right"
         else:
             msg = msg + ", right"
-    if palmPos.y > (iBoxCenter.y + (iBoxHeight / 2)):
+    if y > (iBoxCenter.y + (iBoxHeight / 2)):
         if msg == "":
             msg = "Move hand forward"
         else:
             msg = msg + ", forward"
-    if palmPos.y < (iBoxCenter.y - (iBoxHeight / 2)):
+    if y < (iBoxCenter.y - (iBoxHeight / 2)):
         if msg == "":
             msg = "Move hand backward"
         else:
@@ -212,6 +327,29 @@ def image_to_np_array(image):
         sys.stdout.write("Image is not valid\n")
         return None
 
+def copy_image_into(image, out):
+    
+    """This function copies the data of a Leap Image object into a numpy array
+       with a single memmove, so that the array remains valid after the SDK
+       recycles the image buffer.
+    
+       PARAMETERS:  image: Leap.Image
+                       A Leap.Image object to be copied
+                       
+                    out: numpy.ndarray
+                       a C contiguous uint8 array of shape (height, width)
+                       
+       RETURNS  :   valid: boolean
+                       False if the image is not valid and nothing was copied"""
+    
+    if not image.is_valid:
+        return False
+    if out.shape != (image.height, image.width) or not out.flags.c_contiguous:
+        raise ValueError("The output array does not match the image size")
+    ctypes.memmove(out.ctypes.data, int(image.data_pointer), out.nbytes)
+    
+    return True
+
 def images_to_np_arrays(images):
     
     """This funtion takes a Leap ImageList object and converts the images in the
@@ -229,7 +367,7 @@ def images_to_np_arrays(images):
       
     return l_img,r_img
 
-def saveImages(frame,count,path):
+def saveImages(frame,count,path,store=None,char="",hand=""):
     
     """This function will write the Leap images to the specified path.
     
@@ -242,8 +380,19 @@ def saveImages(frame,count,path):
                      path:  string
                            the output path for the image
                            
+                     store: image_store.ImageStore
+                           if given, the images are appended to the store
+                           instead of being written as JPEG files to path
+                           
+                     char,hand: string
+                           the character and hand ("RH" or "LH") recorded
+                           with the images in the store
+                           
        RETURNS:  NONE"""
     
+    if store is not None:
+        store.appendFrame(frame,char=char,hand=hand,count=count)
+        return
     images = frame.images
     #wrap image data in numpy array
     if images[0].is_valid and images[1].is_valid:
@@ -261,11 +410,11 @@ def saveImages(frame,count,path):
         imagePath = path + "\\Images"
         lname = "left_image_%s.jpg" % str(count).zfill(5)
         rname = "right_image_%s.jpg" % str(count).zfill(5)
-        scipy.misc.toimage(limg, cmin=np.min(limg), cmax=np.max(limg)).save(imagePath+"\\"+lname)
-        scipy.misc.toimage(rimg, cmin=np.min(rimg), cmax=np.max(rimg)).save(imagePath+"\\"+rname)
+        saveImage(limg, imagePath+"\\"+lname)
+        saveImage(rimg, imagePath+"\\"+rname)
     else:
-        print images[0].is_valid, images[1].is_valid
-        print images.is_empty
+        sys.stdout.write("%s %s\n" % (images[0].is_valid, images[1].is_valid))
+        sys.stdout.write("%s\n" % images.is_empty)
 
 ###############################################################################
 # The following functions do not work as functions.  See the Leap Motion API IRT
@@ -316,20 +465,55 @@ def deserializeData(fname, controller = None):
       RETURNS:     frame: Leap.Frame
                    the deserialized frame object"""    
     
+    with open(fname, 'rb') as data_file:
+        data = data_file.read()
+
+    return deserializeBytes(data, controller)
+
+###############################################################################
+
+def serializeFrame(frame):
+
+    """This function serializes a leap motion frame into a bytes copy.  Unlike
+       serializeData, the data is copied while the serialized buffer is still
+       alive, so the result is safe to keep and to pass to other threads.
+
+       PARAMETERS :  frame: Leap.Frame
+                       a single frame from the leap motion controller
+
+       RETURNS:    data: bytes
+                       the serialized leap motion frame"""
+
+    serialized_tuple = frame.serialize
+    serialized_data = serialized_tuple[0]
+    serialized_length = serialized_tuple[1]
+    data_address = serialized_data.cast().__long__()
+
+    return ctypes.string_at(data_address, serialized_length)
+
+def deserializeBytes(data, controller = None):
+
+    """This function deserializes a Leap Motion Frame from the bytes written
+       by serializeFrame, e.g. a record of a FrameContainer.
+
+       PARAMETERS: data: bytes
+                   the serialized frame
+
+                   controller: Leap.Controller
+                   the controller required to deserialize data, defaults to
+                   sharedController()
+
+      RETURNS:     frame: Leap.Frame
+                   the deserialized frame object"""
+
     if controller is None:
-        try:
-            controller = Leap.Controller()
-        except:
-            sys.stdout.write("Error creating Leap.Controller object\n")
+        controller = sharedController()
+        if controller is None:
             return None
 
-    # need an empty frame to populate    
-    #frame = Leap.Frame()
+    # need an empty frame to populate
     frame = controller.frame()
 
-    with open(fname, 'rb') as data_file:
-        data = data_file.read()
-
     leap_byte_array = Leap.byte_array(len(data))
     address = leap_byte_array.cast().__long__()
     ctypes.memmove(address, data, len(data))
@@ -338,4 +522,399 @@ def deserializeData(fname, controller = None):
 
     return frame
 
+_controller = None
+
+def sharedController():
+
+    """This function returns a Leap.Controller shared by the deserializing
+       functions, created on first use.  Creating a controller per frame is
+       slow, and a controller does not need to be connected to deserialize.
+
+      RETURNS:     controller: Leap.Controller
+                   or None if the controller cannot be created"""
+
+    global _controller
+    if _controller is None:
+        try:
+            _controller = Leap.Controller()
+        except:
+            sys.stdout.write("Error creating Leap.Controller object\n")
+            return None
+
+    return _controller
+
+class FrameDeserializer(object):
+
+    """Deserializes frames from memory through one controller and one
+       Leap.byte_array, which grows to the largest frame seen.  Frame copies
+       the data it deserializes, so the byte array is reused for every
+       frame."""
+
+    def __init__(self, controller = None):
+
+        if controller is None:
+            controller = sharedController()
+        self.controller = controller
+        self._array = None
+        self._capacity = 0
+        self._address = 0
+
+    def fromAddress(self, address, length):
+
+        """This function deserializes 'length' bytes at a memory address.
+
+           PARAMETERS: address: integer
+                       the address of the serialized frame
+
+                       length: integer
+                       its size in bytes
+
+          RETURNS:     frame: Leap.Frame"""
+
+        if length > self._capacity:
+            self._capacity = max(length, 2 * self._capacity, 4096)
+            self._array = Leap.byte_array(self._capacity)
+            self._address = self._array.cast().__long__()
+        ctypes.memmove(self._address, address, length)
+        frame = self.controller.frame()
+        frame.deserialize((self._array, length))
+
+        return frame
+
+###############################################################################
+# Multi-frame container.  Serialized frames differ in size, so a container
+# stores them as length-prefixed records appended to one file:
+#
+#     FRAME_MAGIC
+#     record:  <uint32 length><2s hand><4s char><uint32 count><length bytes>
+#     ...
+#     footer:  FRAME_INDEX_DTYPE entries, one per record
+#              <uint64 number of records><uint64 offset of the entries>
+#              FRAME_FOOTER_MAGIC
+#
+# The footer is written when the container is closed and gives O(1) access
+# to any frame.  A container whose footer is missing (e.g. after a crash) is
+# read by scanning the records.
+
+FRAME_MAGIC = b"LEAPFRM1"
+FRAME_FOOTER_MAGIC = b"LEAPIDX1"
+FRAME_RECORD = struct.Struct("<I2s4sI")
+FRAME_FOOTER = struct.Struct("<QQ8s")
+FRAME_INDEX_DTYPE = np.dtype([("offset", "<u8"),
+                              ("length", "<u4"),
+                              ("hand", "S2"),
+                              ("char", "S4"),
+                              ("count", "<u4")])
+
+def _frameBytes(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode("ascii")
+
+def _scanFrameRecords(buf, start, end):
+
+    """This function rebuilds the index of a container by walking its records
+       from start to end.  A record cut short at the end is ignored."""
+
+    entries = []
+    offset = start
+    while offset + FRAME_RECORD.size <= end:
+        length, hand, char, count = FRAME_RECORD.unpack_from(buf, offset)
+        if offset + FRAME_RECORD.size + length > end:
+            break
+        entries.append((offset, length, hand, char.rstrip(b"\0"), count))
+        offset += FRAME_RECORD.size + length
+
+    return np.array(entries, dtype=FRAME_INDEX_DTYPE), offset
+
+def _readFrameIndex(buf, size):
+
+    """This function reads the index of a container from its footer, or by
+       scanning the records if there is no valid footer.
+
+       RETURNS:    index: numpy.ndarray
+                   FRAME_INDEX_DTYPE entries
+
+                   end: integer
+                   the offset just past the last record"""
+
+    if size >= len(FRAME_MAGIC) + FRAME_FOOTER.size:
+        count, indexOffset, magic = FRAME_FOOTER.unpack_from(buf, size - FRAME_FOOTER.size)
+        indexEnd = indexOffset + count * FRAME_INDEX_DTYPE.itemsize
+        if magic == FRAME_FOOTER_MAGIC and indexEnd == size - FRAME_FOOTER.size:
+            index = np.frombuffer(buf[indexOffset:indexEnd], dtype=FRAME_INDEX_DTYPE)
+            return index.copy(), indexOffset
+
+    return _scanFrameRecords(buf, len(FRAME_MAGIC), size)
+
+class FrameContainerWriter(object):
+
+    """Appends serialized frames to a container file.  An existing container
+       is reopened for appending:  its footer is dropped and rewritten on
+       close()."""
+
+    def __init__(self, path):
+
+        self.path = path
+        entries = []
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self._file = open(path, 'r+b')
+            buf = self._file.read()
+            if buf[:len(FRAME_MAGIC)] != FRAME_MAGIC:
+                self._file.close()
+                raise IOError("%s is not a frame container" % path)
+            index, end = _readFrameIndex(buf, len(buf))
+            entries = index.tolist()
+            self._file.seek(end)
+            self._file.truncate()
+        else:
+            self._file = open(path, 'wb')
+            self._file.write(FRAME_MAGIC)
+        self._entries = entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, data, hand="", char="", count=0):
+
+        """This function appends a serialized frame.
+
+           PARAMETERS:   data: bytes
+                           the serialized frame, see serializeFrame
+
+                         hand,char,count:
+                           the hand ('LH' or 'RH'), the character and the
+                           count of the frame, as in the .data file names
+
+           RETURNS:      number: integer
+                           the frame number of the record"""
+
+        hand, char = _frameBytes(hand), _frameBytes(char)
+        offset = self._file.tell()
+        self._file.write(FRAME_RECORD.pack(len(data), hand, char, count))
+        self._file.write(data)
+        self._entries.append((offset, len(data), hand, char, count))
+
+        return len(self._entries) - 1
+
+    def appendFrame(self, frame, hand="", char="", count=0):
+
+        """This function serializes and appends a Leap frame, see append()."""
+
+        return self.append(serializeFrame(frame), hand, char, count)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+
+        """This function writes the footer and closes the file."""
+
+        if self._file is None:
+            return
+        index = np.array(self._entries, dtype=FRAME_INDEX_DTYPE)
+        indexOffset = self._file.tell()
+        self._file.write(index.tobytes())
+        self._file.write(FRAME_FOOTER.pack(len(index), indexOffset, FRAME_FOOTER_MAGIC))
+        self._file.close()
+        self._file = None
+
+class FrameContainer(object):
+
+    """Read access to a container.  The file is memory-mapped, frame number i
+       is read without touching the other records."""
+
+    def __init__(self, path):
+
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(FRAME_MAGIC):
+            self._file.close()
+            raise IOError("%s is not a frame container" % path)
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(FRAME_MAGIC)] != FRAME_MAGIC:
+            self.close()
+            raise IOError("%s is not a frame container" % path)
+        self.index = _readFrameIndex(self._map, size)[0]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, number):
+
+        """This function returns the serialized bytes of frame 'number'."""
+
+        entry = self.index[number]
+        start = int(entry["offset"]) + FRAME_RECORD.size
+        return self._map[start:start + int(entry["length"])]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def frame(self, number, controller = None):
+
+        """This function deserializes frame 'number', see deserializeBytes."""
+
+        return deserializeBytes(self[number], controller)
+
+    def find(self, hand, char, count):
+
+        """This function returns the frame number of a hand, character and
+           count, or None if the container does not hold it."""
+
+        matches = np.nonzero((self.index["hand"] == _frameBytes(hand)) &
+                             (self.index["char"] == _frameBytes(char)) &
+                             (self.index["count"] == count))[0]
+        if len(matches) == 0:
+            return None
+        return int(matches[-1])
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+def convertSerializedDir(path, output):
+
+    """This function converts a directory of .data files, as written by the
+       data collection GUI, into one container.  Frames are stored in hand,
+       character and count order.
+
+       PARAMETERS: path: string
+                   the Serialized directory
+
+                   output: string
+                   the container to write
+
+      RETURNS:     count: integer
+                   the number of frames converted"""
+
+    from frame_sources import FRAME_FILE_RE
+
+    files = []
+    for name in os.listdir(path):
+        match = FRAME_FILE_RE.match(name)
+        if match is not None:
+            key = (match.group("hand"), match.group("char"), int(match.group("count")))
+            files.append((key, os.path.join(path, name)))
+    files.sort()
+
+    with FrameContainerWriter(output) as container:
+        for (hand, char, count), fname in files:
+            with open(fname, 'rb') as data_file:
+                container.append(data_file.read(), hand, char, count)
+
+    return len(files)
+
 ###############################################################################
+# Bulk deserialization of .data files and containers.
+
+def _mapForCopy(fname):
+    # a copy-on-write map can be exported to ctypes, reading it copies nothing
+    with open(fname, 'rb') as data_file:
+        return mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+def _iterContainer(container, deserializer, item, onError):
+    # the frames of a container, read from one map of the file
+    if len(container) == 0:
+        return
+    mapped = _mapForCopy(container.path)
+    base = ctypes.c_char.from_buffer(mapped)
+    address = ctypes.addressof(base)
+    try:
+        for number, entry in enumerate(container.index):
+            start = address + int(entry["offset"]) + FRAME_RECORD.size
+            try:
+                value = item(deserializer.fromAddress(start, int(entry["length"])))
+            except Exception as e:
+                if onError is None:
+                    raise
+                onError(number, e)
+                continue
+            yield number, value
+    finally:
+        # the export must be released before the map can be closed
+        del base
+        mapped.close()
+
+def iterDeserialize(source, controller = None, snapshots = False, onError = None):
+
+    """This generator deserializes many frames with one controller and one
+       byte array.  The input is memory-mapped and copied straight into the
+       byte array, and one frame is held at a time, so memory use does not
+       grow with the dataset.
+
+       PARAMETERS: source: list of string, string or FrameContainer
+                   the .data files to read, or a container (or its path).
+                   A container given by its path is closed when the
+                   iteration ends, a container given open is left open
+
+                   controller: Leap.Controller
+                   the controller required to deserialize data, defaults to
+                   sharedController()
+
+                   snapshots: boolean
+                   yield the HandSnapshots of the frame's hands instead of
+                   the frame
+
+                   onError: function
+                   onError(key, exception) is called for a frame that cannot
+                   be read, which is then skipped.  By default the exception
+                   is raised
+
+      YIELDS:      key, item: tuple
+                   key is the file name, or the frame number in a container.
+                   item is the Leap.Frame, or a list of HandSnapshot"""
+
+    deserializer = FrameDeserializer(controller)
+
+    def item(frame):
+        if snapshots:
+            return [HandSnapshot.fromHand(hand, frame.id) for hand in frame.hands]
+        return frame
+
+    if isinstance(source, _STRING_TYPES):
+        # a container opened here is closed here, also when the caller stops
+        # iterating early
+        container = FrameContainer(source)
+        try:
+            for key, value in _iterContainer(container, deserializer, item, onError):
+                yield key, value
+        finally:
+            container.close()
+        return
+    if isinstance(source, FrameContainer):
+        for key, value in _iterContainer(source, deserializer, item, onError):
+            yield key, value
+        return
+
+    for fname in source:
+        try:
+            if os.path.getsize(fname) == 0:
+                sys.stdout.write("Skipping empty file %s\n" % fname)
+                continue
+            mapped = _mapForCopy(fname)
+            base = ctypes.c_char.from_buffer(mapped)
+            try:
+                frame = deserializer.fromAddress(ctypes.addressof(base), len(mapped))
+            finally:
+                del base
+                mapped.close()
+            value = item(frame)
+        except Exception as e:
+            if onError is None:
+                raise
+            onError(fname, e)
+            continue
+        yield fname, value
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Background loading of the translator model.  Unpickling the RandomForest
+    takes seconds, and used to hold up the window and the camera preview.  A
+    ModelLoader runs joblib.load on a thread, with mmap_mode so that the
+    numpy arrays stored in the pickle are mapped read-only from the model
+    file instead of being read into private memory.  Translators running on
+    the same machine then share those pages through the OS page cache.
+
+    Note that sklearn's Tree objects copy their node arrays when they are
+    unpickled, so the tree nodes themselves are still private to each
+    process:  mapping helps the arrays that stay numpy arrays (classes_,
+    importances, ...).  A forest flattened by flat_forest.py keeps all of its
+    node arrays mapped, loadModel() loads one when given its directory.
+
+    The load time and the resident memory of the process are recorded.
+    psutil is used when installed, otherwise the peak resident size from the
+    resource module, which is not available on Windows.
+"""
+
+import os
+import sys
+import threading
+from timeit import default_timer
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def residentMemory():
+
+    """This function returns the resident memory of the process.
+
+       RETURNS:      rss: integer
+                       bytes, or None if it cannot be measured.  Without
+                       psutil this is the peak resident size"""
+
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return rss if sys.platform == "darwin" else rss * 1024
+    return None
+
+
+def loadModel(path, mmapMode="r"):
+
+    """This function loads a model saved with joblib.dump, or a FlatForest
+       directory.
+
+       PARAMETERS:   path: string
+                       the model file or FlatForest directory
+
+                     mmapMode: string
+                       numpy.memmap mode of the stored arrays, or None to
+                       read them into memory.  Compressed files cannot be
+                       mapped, joblib then reads them normally
+
+       RETURNS:      model: object"""
+
+    if os.path.isdir(path):
+        from flat_forest import FlatForest
+        return FlatForest.load(path, mmapMode)
+
+    try:
+        from sklearn.externals import joblib
+    except ImportError:
+        import joblib
+
+    return joblib.load(path, mmap_mode=mmapMode)
+
+
+class ModelLoader(object):
+
+    """Loads a model on a background thread.  onLoaded(loader) is called on
+       that thread once the load has finished, successfully or not; model or
+       error is then set."""
+
+    def __init__(self, path, mmapMode="r", onLoaded=None):
+
+        self.path = path
+        self.mmapMode = mmapMode
+        self.onLoaded = onLoaded
+        self.model = None
+        self.error = None
+        self.loadTime = None
+        self.rssBefore = None
+        self.rssAfter = None
+        self._done = threading.Event()
+        self._thread = None
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def start(self):
+
+        """This function starts loading, once."""
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ModelLoader")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def wait(self, timeout=None):
+
+        """This function waits for the load to finish.
+
+           RETURNS:      done: boolean"""
+
+        return self._done.wait(timeout)
+
+    def summary(self):
+        if self.error is not None:
+            return "Model failed to load: %s" % self.error
+        if not self.done:
+            return "Model loading..."
+        msg = "Model loaded in %.2f s" % self.loadTime
+        if self.rssAfter is not None:
+            msg += ", %.0f MB resident" % (self.rssAfter / 1048576.0)
+            if self.rssBefore is not None:
+                msg += " (+%.0f MB)" % ((self.rssAfter - self.rssBefore) / 1048576.0)
+        return msg
+
+    def _run(self):
+        self.rssBefore = residentMemory()
+        start = default_timer()
+        try:
+            self.model = loadModel(self.path, self.mmapMode)
+        except Exception as e:
+            self.error = e
+        self.loadTime = default_timer() - start
+        self.rssAfter = residentMemory()
+        self._done.set()
+        if self.onLoaded is not None:
+            self.onLoaded(self)
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+"""
+    The sign pipeline of the translator without Qt:  for each frame every
+    hand is checked against the interaction box, the still hands are turned
+    into features and predicted, and the predictions are voted on by a
+    SignDebouncer per hand.  A sign is emitted once per stable pose of each
+    hand, tagged with the hand's id and handedness.
+
+    Each hand is followed by its Leap hand id in a HandTrack, which holds its
+    votes.  The features of all hands of a frame are stacked, so that two
+    hands cost a single model call.
+
+    The pipeline is used in two ways:
+      * process() predicts synchronously, for the benchmarks and the headless
+        service (translate_service.py), which calls it on a worker thread,
+      * gate(), features() and vote() split the work so that FrameGrabber can
+        run the model on its inference thread in between.
+"""
+
+import leap_utilities as lutils
+from debounce import SignDebouncer
+from hand_snapshot import HandSnapshot
+from instrumentation import DISABLED
+
+# message of putHandInIBox for a usable hand
+IN_POSITION = "Hand in position"
+NO_HANDS = "No Hands in Frame"
+
+
+class HandTrack(object):
+
+    """The votes of one hand.  pose is incremented when the pose changes, so
+       that predictions made for an earlier pose are not counted."""
+
+    def __init__(self, handID, handedness, window=5, votes=3):
+
+        self.id = handID
+        self.handedness = handedness
+        self.debouncer = SignDebouncer(window=window, votes=votes)
+        self.settled = None
+        self.pose = 0
+
+    def reset(self):
+
+        """This function clears the votes when the pose changes."""
+
+        self.debouncer.reset()
+        self.pose += 1
+
+
+class SignPipeline(object):
+
+    """Gating, features, prediction and voting of the hands of a frame
+       stream."""
+
+    def __init__(self, predictor=None, engine=None, window=5, votes=3, metrics=None):
+
+        """PARAMETERS:   predictor: SignPredictor or CachedPredictor
+                           needed by process() only
+
+                         engine: FeatureEngine
+                           the feature schema of the model (see
+                           features.loadSchema), needed by features() and
+                           process()
+
+                         window, votes: integer
+                           the SignDebouncer vote of each hand
+
+                         metrics: Metrics
+                           receives the snapshot, features and predict spans"""
+
+        self.predictor = predictor
+        self.engine = engine
+        self.window = window
+        self.votes = votes
+        self.metrics = DISABLED if metrics is None else metrics
+        self.iBox = None
+        self.tracks = {}
+        self.signs = 0
+
+    def reset(self):
+
+        """This function forgets all hands."""
+
+        for track in self.tracks.values():
+            track.reset()
+        self.tracks = {}
+
+    def gate(self, frame):
+
+        """This function checks every hand of a frame and lists the hands to
+           predict:  in the interaction box, still, and not settled on a sign.
+           Hands that left the frame are forgotten.
+
+           PARAMETERS:   frame: Leap.Frame
+                           or a frame of a frame source
+
+           RETURNS:      message: string
+                           where to move the hand, "Hand in position" if any
+                           hand is in position
+
+                         ready: list of tuple
+                           (track, snapshot, hand) of the hands to predict"""
+
+        if self.iBox is None:
+            self.iBox = frame.interaction_box
+        tracks = {}
+        messages = []
+        ready = []
+        for hand in frame.hands:
+            if not hand.is_valid:
+                continue
+            with self.metrics.span("snapshot"):
+                snapshot = HandSnapshot.fromHand(hand, frame.id)
+            track = self.tracks.get(hand.id)
+            if track is None:
+                track = HandTrack(hand.id, snapshot.orient, self.window, self.votes)
+            tracks[hand.id] = track
+
+            message = lutils.putHandInIBox(snapshot.palmPosition, self.iBox)
+            messages.append(message)
+            if message != IN_POSITION:
+                track.reset()
+                continue
+            if track.debouncer.settled and lutils.handChanged(track.settled, snapshot):
+                track.reset()
+            if lutils.handMoving(snapshot):
+                # votes from a moving hand belong to no pose
+                if not track.debouncer.settled:
+                    track.reset()
+                continue
+            if not track.debouncer.settled:
+                ready.append((track, snapshot, hand))
+        for handID, track in self.tracks.items():
+            if handID not in tracks:
+                track.reset()
+        self.tracks = tracks
+
+        if not messages:
+            return NO_HANDS, ready
+        return (IN_POSITION if IN_POSITION in messages else messages[0]), ready
+
+    def features(self, ready):
+
+        """This function computes the feature vectors of the hands listed by
+           gate(), in the column order of the model.
+
+           RETURNS:      features: numpy.ndarray
+                           (N,P) one row per hand"""
+
+        if self.engine is None:
+            raise ValueError("The pipeline has no feature schema")
+        with self.metrics.span("features"):
+            return self.engine.transformSnapshots([snapshot for track, snapshot, hand in ready])
+
+    def vote(self, track, pose, snapshot, prediction):
+
+        """This function adds a prediction to the votes of its hand.
+
+           PARAMETERS:   track: HandTrack
+                         pose: integer
+                           track.pose when the hand was gated
+                         snapshot: HandSnapshot
+                           the predicted hand
+                         prediction: dictionary
+                           from SignPredictor
+
+           RETURNS:      sign: dictionary
+                           the emitted prediction, with the 'HandId' and
+                           'Handedness' of the hand, or None"""
+
+        if pose != track.pose or track.debouncer.settled or self.tracks.get(track.id) is not track:
+            return None
+        sign = track.debouncer.push(prediction)
+        if sign is not None:
+            sign['HandId'] = track.id
+            sign['Handedness'] = track.handedness
+            track.settled = snapshot
+            self.signs += 1
+        return sign
+
+    def process(self, frame):
+
+        """This function runs the pipeline on one frame, with one model call
+           for all of its hands.
+
+           PARAMETERS:   frame: Leap.Frame
+                           or a frame of a frame source
+
+           RETURNS:      message: string
+                           where to move the hand, as shown by the GUI
+
+                         signs: list of dictionary
+                           the emitted predictions"""
+
+        message, ready = self.gate(frame)
+        if not ready:
+            return message, []
+        features = self.features(ready)
+        with self.metrics.span("predict"):
+            predictions = self.predictor.predictBatch(features)
+        signs = []
+        for (track, snapshot, hand), prediction in zip(ready, predictions):
+            sign = self.vote(track, track.pose, snapshot, prediction)
+            if sign is not None:
+                signs.append(sign)
+        return message, signs
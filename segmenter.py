@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Incremental word segmentation of the translated letters.  The translator
+    emits one letter per sign, without spaces, and the text is split into
+    the most probable sequence of words under a unigram model (Viterbi, as
+    ngrams.segment).  ngrams.segment starts over on the whole text for every
+    letter; a WordSegmenter keeps the Viterbi state of the unfinished tail
+    only:
+
+      * best[i] is the log probability of the best split of tail[:i], and
+        back[i] where its last word starts.  A new letter adds one entry,
+        looking back at most maxLen letters.
+      * once the best splits of every position a future word can start from
+        share a break, the words before it can no longer change.  They are
+        committed and the tail is cut there.
+      * dictionary words are found with a PrefixTrie, advanced by one letter
+        per open word, and word scores are memoized in a bounded LRU cache.
+
+    Each letter therefore costs about the same however long the session
+    has run.
+"""
+
+import bisect
+import collections
+import math
+
+
+class PrefixTrie(object):
+
+    """The dictionary words in sorted order.  A node is the range of words
+       that start with a prefix, so that the trie costs no memory beyond the
+       word list, and a child is found by bisecting the parent's range."""
+
+    def __init__(self, counts):
+
+        self.words = sorted(counts)
+        self.counts = [counts[word] for word in self.words]
+
+    def root(self):
+
+        """This function returns the node of the empty prefix."""
+
+        return (0, len(self.words), "")
+
+    def child(self, node, char):
+
+        """This function extends the prefix of a node by one character.
+
+           PARAMETERS:   node: tuple
+                           a node returned by root() or child()
+
+                         char: string
+
+           RETURNS:      node: tuple
+                           or None when no word starts with the prefix"""
+
+        lo, hi, prefix = node
+        # the words starting with prefix+char lie between prefix+char and the
+        # prefix followed by the next character
+        lo = bisect.bisect_left(self.words, prefix + char, lo, hi)
+        hi = bisect.bisect_left(self.words, prefix + chr(ord(char) + 1), lo, hi)
+        if lo == hi:
+            return None
+        return (lo, hi, prefix + char)
+
+    def count(self, node):
+
+        """This function returns the count of the node's prefix as a word, 0
+           if the prefix is not a word."""
+
+        lo, hi, prefix = node
+        if lo < hi and self.words[lo] == prefix:
+            return self.counts[lo]
+        return 0
+
+
+def avoidLongWords(word, N):
+    # probability of an unknown word, as ngrams.avoid_long_words
+    return 10.0 / (N * 10 ** len(word))
+
+
+class WordSegmenter(object):
+
+    """Viterbi segmentation of a growing string of letters.  push() adds a
+       letter, committed holds the final words and tailWords() the best split
+       of the rest."""
+
+    def __init__(self, counts, N=None, missing=avoidLongWords, maxLen=20,
+                 memoSize=4096, maxTail=None):
+
+        """PARAMETERS:   counts: dictionary
+                           word counts, e.g. ngrams.Pw
+
+                         N: float
+                           total count, defaults to the sum of counts
+
+                         missing: function
+                           missing(word, N), probability of an unknown word
+
+                         maxLen: integer
+                           longest word considered
+
+                         memoSize: integer
+                           word scores kept in the memo
+
+                         maxTail: integer
+                           letters kept before the best split is committed
+                           regardless, defaults to 4 * maxLen"""
+
+        self.trie = PrefixTrie(counts)
+        self.N = float(N if N is not None else sum(counts.values()))
+        self.missing = missing
+        self.maxLen = maxLen
+        self.memoSize = memoSize
+        self.maxTail = maxTail or 4 * maxLen
+        self._memo = collections.OrderedDict()
+        self.reset()
+
+    @classmethod
+    def fromNgrams(cls, ngrams, **kwargs):
+
+        """This function builds a segmenter from the unigram model of the
+           ngrams module (its Pw distribution)."""
+
+        Pw = ngrams.Pw
+        return cls(Pw, N=Pw.N, missing=getattr(Pw, "missingfn", avoidLongWords), **kwargs)
+
+    def reset(self):
+
+        """This function clears the text."""
+
+        self.committed = []
+        self.tail = ""
+        self._best = [0.0]
+        self._back = [0]
+        # (start, node) of the tail suffixes that are dictionary prefixes
+        self._open = []
+
+    def push(self, chars):
+
+        """This function appends letters to the text.
+
+           PARAMETERS:   chars: string
+
+           RETURNS:      words: list of string
+                           the words committed by these letters"""
+
+        words = []
+        for char in chars:
+            words.extend(self._push(char))
+        return words
+
+    def tailWords(self):
+
+        """This function returns the best split of the uncommitted letters."""
+
+        words = []
+        end = len(self.tail)
+        while end > 0:
+            start = self._back[end]
+            words.append(self.tail[start:end])
+            end = start
+        words.reverse()
+        return words
+
+    def text(self):
+
+        """This function returns the whole segmented text."""
+
+        return " ".join(self.committed + self.tailWords())
+
+    def score(self, word, count):
+
+        """This function returns the memoized log probability of a word.
+
+           PARAMETERS:   word: string
+
+                         count: integer
+                           the dictionary count of the word, 0 if unknown"""
+
+        memo = self._memo
+        value = memo.get(word)
+        if value is not None:
+            # Python 2 OrderedDict has no move_to_end
+            del memo[word]
+        elif count:
+            value = math.log(count / self.N)
+        else:
+            value = math.log(self.missing(word, self.N))
+        memo[word] = value
+        if len(memo) > self.memoSize:
+            memo.popitem(last=False)
+        return value
+
+    def _push(self, char):
+        self.tail += char
+        n = len(self.tail)
+        trie = self.trie
+        counts = {}
+        opened = []
+        for start, node in self._open + [(n - 1, trie.root())]:
+            node = trie.child(node, char)
+            if node is not None:
+                opened.append((start, node))
+                counts[start] = trie.count(node)
+        self._open = opened
+
+        best, back = None, None
+        for start in range(max(0, n - self.maxLen), n):
+            score = self._best[start] + self.score(self.tail[start:], counts.get(start, 0))
+            if best is None or score > best:
+                best, back = score, start
+        self._best.append(best)
+        self._back.append(back)
+
+        return self._commit()
+
+    def _commit(self):
+        # future words start at one of the last maxLen positions, a break on
+        # the best split of all of them is final
+        n = len(self.tail)
+        first = max(0, n + 1 - self.maxLen)
+        common = None
+        for end in range(first, n + 1):
+            path = set()
+            while end > 0:
+                end = self._back[end]
+                path.add(end)
+            common = path if common is None else common & path
+        cut = max(c for c in common if c <= first) if common else 0
+        if cut == 0 and n > self.maxTail:
+            # no break is certain yet, take the best split so far
+            cut = self._back[n]
+            while cut > first:
+                cut = self._back[cut]
+        if cut == 0:
+            return []
+
+        words = []
+        end = cut
+        while end > 0:
+            start = self._back[end]
+            words.append(self.tail[start:end])
+            end = start
+        words.reverse()
+        self.committed.extend(words)
+
+        base = self._best[cut]
+        self.tail = self.tail[cut:]
+        self._best = [score - base for score in self._best[cut:]]
+        self._back = [max(0, start - cut) for start in self._back[cut:]]
+        self._open = [(start - cut, node) for start, node in self._open if start >= cut]
+        return words
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Startup profiling for the GUIs and the utility modules.  When enabled,
+    the profile wraps the import statement to time every module imported
+    for the first time, and records the wall time of named init stages.
+    report() prints the slowest imports, with the time spent in the module
+    itself and including the modules it imported, and the stages in order.
+
+    The GUIs enable the profile with --profile-startup, before their own
+    imports, and report once the event loop has started.  A module can be
+    profiled on its own with:
+
+        python startup_profile.py leap_utilities [module ...]
+
+    When the profile is not enabled stage() and mark() do nothing.
+"""
+
+import contextlib
+import sys
+from timeit import default_timer
+
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+
+class StartupProfile(object):
+
+    """Import and stage timings of one process."""
+
+    def __init__(self):
+
+        self.enabled = False
+        self.imports = []
+        self.stages = []
+        self._start = None
+        self._depth = 0
+        self._childTime = [0.0]
+        self._import = None
+
+    def enable(self):
+
+        """This function installs the import hook and starts the clock."""
+
+        if self.enabled:
+            return
+        self.enabled = True
+        self._start = default_timer()
+        self._import = builtins.__import__
+        builtins.__import__ = self._timedImport
+
+    def disable(self):
+
+        """This function removes the import hook."""
+
+        if self.enabled:
+            builtins.__import__ = self._import
+            self.enabled = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+
+        """This context manager records the wall time of an init stage.
+
+           PARAMETERS:   name: string
+                           the name shown in the report"""
+
+        if not self.enabled:
+            yield
+            return
+        start = default_timer()
+        try:
+            yield
+        finally:
+            self.stages.append((name, start - self._start, default_timer() - start))
+
+    def mark(self, name):
+
+        """This function records the time at which a point is reached, e.g.
+           the first frame shown."""
+
+        if self.enabled:
+            self.stages.append((name, default_timer() - self._start, None))
+
+    def _timedImport(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module = _absoluteName(name, globals, level)
+        # only the first import of a module costs anything
+        if module in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        self._depth += 1
+        self._childTime.append(0.0)
+        start = default_timer()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = default_timer() - start
+            children = self._childTime.pop()
+            self._depth -= 1
+            self._childTime[-1] += elapsed
+            self.imports.append((module, self._depth, elapsed, elapsed - children))
+
+    def report(self, stream=None, top=20):
+
+        """This function writes the slowest imports and the stages.
+
+           PARAMETERS:   stream: file
+                           defaults to sys.stdout
+
+                         top: integer
+                           number of imports listed"""
+
+        if stream is None:
+            stream = sys.stdout
+        total = sum(elapsed for name, depth, elapsed, own in self.imports if depth == 0)
+        stream.write("Startup profile: %.3f s in imports, %.3f s since the profile started\n" %
+                     (total, default_timer() - self._start))
+        stream.write("  %-40s %10s %10s\n" % ("import", "total (s)", "self (s)"))
+        for name, depth, elapsed, own in sorted(self.imports, key=lambda i: -i[2])[:top]:
+            stream.write("  %-40s %10.3f %10.3f\n" % (name, elapsed, own))
+        if self.stages:
+            stream.write("  %-40s %10s %10s\n" % ("stage", "at (s)", "wall (s)"))
+        for name, at, elapsed in self.stages:
+            wall = "" if elapsed is None else "%10.3f" % elapsed
+            stream.write("  %-40s %10.3f %10s\n" % (name, at, wall))
+
+
+def _absoluteName(name, globals, level):
+    # the module named by a relative import (level > 0) from 'globals'
+    if level <= 0 or not globals:
+        return name
+    package = globals.get("__package__") or globals.get("__name__", "").rpartition(".")[0]
+    if level > 1:
+        package = package.rsplit(".", level - 1)[0]
+    return "%s.%s" % (package, name) if name else package
+
+
+# the profile of this process
+profile = StartupProfile()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Time the import of modules")
+    parser.add_argument("modules", nargs="+", help="modules to import, e.g. leap_utilities")
+    parser.add_argument("--top", type=int, default=20, help="number of imports listed")
+    args = parser.parse_args()
+
+    profile.enable()
+    for module in args.modules:
+        with profile.stage("import %s" % module):
+            # through the import statement, so that the hook sees the module
+            __import__(module)
+    profile.disable()
+    profile.report(top=args.top)
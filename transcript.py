@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""
+    The translated text of a session.  Setting the whole text of a QTextEdit
+    for every sign copies and lays out the entire transcript again, which
+    gets slower the longer the session runs.  A Transcript instead:
+
+      * keeps the history in an append-only list of chunks,
+      * inserts new text at the end of the widget's document with a
+        QTextCursor, and drops the oldest text once the widget holds more
+        than maxVisible characters, in chunks of trimChunk characters so
+        that trimming is rare,
+      * writes committed text to a stream (a file, or a named pipe read by
+        another program) as it arrives.
+
+    The text may end with a pending part that can still change, such as the
+    words of the segmenter's tail.  setPending() replaces it in place.
+
+    Without a widget the Transcript only keeps and streams the text.
+"""
+
+import io
+
+
+class Transcript(object):
+
+    """Append-only transcript shown in a QTextEdit (or QPlainTextEdit)."""
+
+    def __init__(self, edit=None, maxVisible=20000, trimChunk=5000, stream=None):
+
+        """PARAMETERS:   edit: QTextEdit
+                           the widget showing the end of the transcript
+
+                         maxVisible: integer
+                           characters kept in the widget
+
+                         trimChunk: integer
+                           characters dropped at once from the widget
+
+                         stream: string or file
+                           file name or open file the committed text is
+                           written to.  A name is opened for appending, a
+                           named pipe blocks until a reader opens it"""
+
+        self.edit = edit
+        self.maxVisible = maxVisible
+        self.trimChunk = trimChunk
+        self.length = 0
+        self._chunks = []
+        self._pending = u""
+        self._visible = 0
+        self._ownStream = False
+        if isinstance(stream, (bytes, type(u""))):
+            stream = io.open(stream, "a", encoding="utf-8")
+            self._ownStream = True
+        self.stream = stream
+
+    def append(self, text):
+
+        """This function commits text at the end of the transcript, before
+           the pending part.
+
+           PARAMETERS:   text: string"""
+
+        text = _unicode(text)
+        if not text:
+            return
+        self._chunks.append(text)
+        self.length += len(text)
+        if self.stream is not None:
+            self.stream.write(text)
+            self.stream.flush()
+        if self.edit is not None:
+            pending = self._pending
+            self._replaceEnd(len(pending), text + pending)
+            self._visible += len(text)
+            if self._visible > self.maxVisible + self.trimChunk:
+                self._trim()
+
+    def setPending(self, text):
+
+        """This function replaces the pending text shown after the committed
+           text.  It is not part of the history until committed.
+
+           PARAMETERS:   text: string"""
+
+        text = _unicode(text)
+        if text == self._pending:
+            return
+        if self.edit is not None:
+            self._replaceEnd(len(self._pending), text)
+        self._pending = text
+
+    def text(self):
+
+        """This function returns the whole committed transcript."""
+
+        return u"".join(self._chunks)
+
+    def clear(self):
+
+        """This function clears the widget and starts a new history.  The
+           stream keeps what was written."""
+
+        self._chunks = []
+        self.length = 0
+        self._pending = u""
+        self._visible = 0
+        if self.edit is not None:
+            self.edit.clear()
+
+    def close(self):
+
+        """This function closes the stream if the Transcript opened it."""
+
+        if self.stream is not None and self._ownStream:
+            self.stream.close()
+        self.stream = None
+
+    def _replaceEnd(self, count, text):
+        # replaces the last 'count' characters of the document with text
+        cursor = self.edit.textCursor()
+        cursor.movePosition(cursor.End)
+        if count:
+            cursor.movePosition(cursor.Left, cursor.KeepAnchor, count)
+        cursor.insertText(text)
+        scrollBar = self.edit.verticalScrollBar()
+        scrollBar.setValue(scrollBar.maximum())
+
+    def _trim(self):
+        # drops the oldest characters from the widget only
+        count = self._visible - self.maxVisible
+        cursor = self.edit.textCursor()
+        cursor.movePosition(cursor.Start)
+        cursor.movePosition(cursor.Right, cursor.KeepAnchor, count)
+        cursor.removeSelectedText()
+        self._visible -= count
+
+
+def _unicode(text):
+    # the widget and the stream take unicode, also from Python 2 str
+    if isinstance(text, bytes):
+        return text.decode("utf-8")
+    return text
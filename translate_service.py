@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Headless translation service.  Runs the sign pipeline of the translator
+    (frame source, hand checks, features, prediction and voting, see
+    pipeline.py) on an asyncio loop, without Qt or a display, and publishes
+    the signs to any number of local clients over a Unix or TCP socket.
+
+    The pipeline runs on one worker thread, so the loop only waits on the
+    frame source and the sockets.  Each client has its own bounded queue of
+    messages and, with --preview, a single slot for the newest preview
+    frame.  A client that reads too slowly loses its oldest messages and
+    skips previews, it never holds up the pipeline or the other clients.
+
+    Protocol:  the service writes one JSON object per line, clients do not
+    need to write anything.
+
+        {"type": "hello", "classes": [...], "preview": true}
+        {"type": "status", "frame": 1234, "message": "Move hand up"}
+        {"type": "sign", "frame": 1234, "time": 1510000000.0, "sign": "A",
+         "probability": 0.92, "votes": 3, "topk": [["A", 0.92], ...],
+         "hand": 12, "handedness": "Right"}
+        {"type": "preview", "frame": 1234, "width": 160, "height": 60,
+         "data": "<base64 of the uint8 pixels, row by row>"}
+
+    The service needs Python 3.7 or later.  The Leap SDK 3.2 bindings only
+    exist for Python 2.7, so the service runs on the synthetic frame source
+    only: --source live and --source replay are refused.  Stop it with
+    Ctrl-C.  If the
+    pipeline fails, e.g. on a model that does not match the feature schema,
+    the service prints the error and exits with status 1.
+
+    usage: python3 translate_service.py --model MODEL [--features SCHEMA.npz]
+                                        [--source synthetic] [--rate R] [--fast]
+                                        [--hands 1|2]
+                                        [--unix PATH | --host HOST --port PORT]
+                                        [--queue N] [--preview]
+                                        [--preview-scale S] [--preview-rate R]
+                                        [--cache-step STEP] [--metrics-file FILE]
+"""
+
+import argparse
+import asyncio
+import base64
+import collections
+import concurrent.futures
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+
+import frame_sources
+import leap_utilities as lutils
+from features import loadSchema, schemaFile
+from inference import SignPredictor, CachedPredictor
+from instrumentation import Metrics
+from model_loader import loadModel
+from pipeline import SignPipeline
+
+
+class Client(object):
+
+    """A connected client.  Messages wait in a bounded queue that drops the
+       oldest message when full, previews in a slot that keeps the newest."""
+
+    def __init__(self, writer, maxQueue=64):
+
+        self.writer = writer
+        self.peer = writer.get_extra_info("peername") or "unix socket"
+        self.sent = 0
+        self.dropped = 0
+        self.previewsDropped = 0
+        self._queue = collections.deque(maxlen=maxQueue)
+        self._preview = None
+        self._ready = asyncio.Event()
+
+    def put(self, line):
+
+        """This function queues a message, dropping the oldest one if the
+           client is too far behind."""
+
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(line)
+        self._ready.set()
+
+    def putPreview(self, line):
+
+        """This function replaces the preview waiting to be sent."""
+
+        if self._preview is not None:
+            self.previewsDropped += 1
+        self._preview = line
+        self._ready.set()
+
+    async def run(self):
+
+        """This coroutine writes the queued messages until the client leaves.
+           Messages are sent before the preview."""
+
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self._queue or self._preview is not None:
+                    if self._queue:
+                        line = self._queue.popleft()
+                    else:
+                        line, self._preview = self._preview, None
+                    self.writer.write(line)
+                    self.sent += 1
+                    await self.writer.drain()
+        except (ConnectionError, OSError):
+            pass
+
+    def summary(self):
+
+        """This function formats the client counters."""
+
+        return ("Client %s: %d sent, %d dropped, %d previews skipped" %
+                (self.peer, self.sent, self.dropped, self.previewsDropped))
+
+
+class TranslateService(object):
+
+    """Runs a SignPipeline on the frames of a frame source and publishes the
+       results to the connected clients."""
+
+    def __init__(self, source, pipeline, maxQueue=64, preview=False, previewScale=4,
+                 previewRate=10.0):
+
+        self.source = source
+        self.pipeline = pipeline
+        self.maxQueue = maxQueue
+        self.preview = preview
+        self.previewScale = previewScale
+        self.previewInterval = 1.0 / previewRate if previewRate > 0 else 0.0
+        self.clients = set()
+        self.frames = 0
+        self.signs = 0
+        self.error = None
+        self._message = None
+        self._lastPreview = 0.0
+        self._frameReady = None
+        self._stop = None
+        # the pipeline keeps state between frames, it runs on one thread
+        self._worker = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    async def serve(self, unixPath=None, host="127.0.0.1", port=8765):
+
+        """This coroutine listens for clients and runs the pipeline until
+           stop() is called, or until the pipeline fails, in which case the
+           exception is printed and kept in error.
+
+           PARAMETERS:   unixPath: string
+                           socket file, a TCP socket is used if None
+
+                         host, port:
+                           the TCP address"""
+
+        loop = asyncio.get_running_loop()
+        self._frameReady = asyncio.Event()
+        self._stop = asyncio.Event()
+        if unixPath is not None:
+            if os.path.exists(unixPath):
+                os.remove(unixPath)
+            server = await asyncio.start_unix_server(self._handleClient, path=unixPath)
+            address = unixPath
+        else:
+            server = await asyncio.start_server(self._handleClient, host, port)
+            address = "%s:%d" % (host, port)
+        sys.stdout.write("Serving on %s\n" % address)
+
+        # the source calls back from its own thread
+        self.source.listen(lambda frameID: loop.call_soon_threadsafe(self._frameReady.set))
+        capture = asyncio.ensure_future(self._captureLoop())
+        capture.add_done_callback(self._captureDone)
+        try:
+            await self._stop.wait()
+        finally:
+            self.source.stopListening()
+            capture.cancel()
+            server.close()
+            for client in list(self.clients):
+                client.writer.close()
+            await server.wait_closed()
+            self._worker.shutdown(wait=True)
+            if unixPath is not None and os.path.exists(unixPath):
+                os.remove(unixPath)
+
+    def stop(self):
+
+        """This function stops serve(), it must be called on the loop."""
+
+        if self._stop is not None:
+            self._stop.set()
+
+    def publish(self, message):
+
+        """This function sends a message to every client.
+
+           PARAMETERS:   message: dictionary
+                           serializable with json"""
+
+        line = (json.dumps(message) + "\n").encode("utf-8")
+        for client in self.clients:
+            client.put(line)
+
+    def summary(self):
+
+        """This function formats the service counters."""
+
+        return "Translate service: %d frames, %d signs, %d clients" % (
+            self.frames, self.signs, len(self.clients))
+
+    async def _captureLoop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._frameReady.wait()
+            # frames that arrived meanwhile are skipped, the newest is read
+            self._frameReady.clear()
+            frame = self.source.frame()
+            self.frames += 1
+            # the clients belong to the loop, the worker is only told whether
+            # a preview is due
+            now = time.time()
+            wantPreview = (self.preview and bool(self.clients) and
+                           now - self._lastPreview >= self.previewInterval)
+            message, signs, preview = await loop.run_in_executor(self._worker, self._process,
+                                                                 frame, wantPreview)
+            if message != self._message:
+                self._message = message
+                self.publish({"type": "status", "frame": frame.id, "message": message})
+            for sign in signs:
+                self.signs += 1
+                self.publish(signMessage(frame.id, sign))
+            if preview is not None:
+                self._lastPreview = now
+                line = (json.dumps(preview) + "\n").encode("utf-8")
+                for client in self.clients:
+                    client.putPreview(line)
+
+    def _captureDone(self, task):
+        # a failed pipeline stops the service instead of leaving it serving
+        # clients without signs
+        if task.cancelled() or task.exception() is None:
+            return
+        self.error = task.exception()
+        sys.stderr.write("Capture stopped at frame %d:\n" % self.frames)
+        traceback.print_exception(type(self.error), self.error, self.error.__traceback__)
+        self.stop()
+
+    def _process(self, frame, wantPreview):
+        # on the worker thread
+        message, signs = self.pipeline.process(frame)
+        preview = previewMessage(frame, self.previewScale) if wantPreview else None
+        return message, signs, preview
+
+    async def _handleClient(self, reader, writer):
+        client = Client(writer, self.maxQueue)
+        classes = getattr(self.pipeline.predictor, "classes", [])
+        client.put((json.dumps({"type": "hello", "classes": [_label(c) for c in classes],
+                                "preview": self.preview}) + "\n").encode("utf-8"))
+        if self._message is not None:
+            client.put((json.dumps({"type": "status", "frame": None,
+                                    "message": self._message}) + "\n").encode("utf-8"))
+        self.clients.add(client)
+        sender = asyncio.ensure_future(client.run())
+        try:
+            # clients only listen, the end of their input means they left
+            while await reader.read(4096):
+                pass
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+            writer.close()
+            sys.stdout.write(client.summary() + "\n")
+
+
+def signMessage(frameID, sign):
+
+    """This function converts an emitted prediction to a 'sign' message."""
+
+    return {"type": "sign",
+            "frame": frameID,
+            "time": time.time(),
+            "sign": _label(sign["Predict"]),
+            "probability": float(sign["Probability"]),
+            "votes": int(sign.get("Votes", 0)),
+            "topk": [[_label(label), float(p)] for label, p in sign.get("TopK", [])],
+            "hand": sign.get("HandId"),
+            "handedness": sign.get("Handedness")}
+
+
+def _label(value):
+    # class labels of models saved by Python 2 load as bytes
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return str(value)
+
+
+def previewMessage(frame, scale):
+
+    """This function downscales the first valid image of a frame into a
+       'preview' message, or returns None if the frame has no image."""
+
+    if frame.images.is_empty:
+        return None
+    for image in (frame.images[0], frame.images[1]):
+        if image.is_valid:
+            pixels = lutils.image_to_np_array(image)[::scale, ::scale]
+            return {"type": "preview",
+                    "frame": frame.id,
+                    "width": pixels.shape[1],
+                    "height": pixels.shape[0],
+                    "data": base64.b64encode(pixels.tobytes()).decode("ascii")}
+    return None
+
+
+def createPipeline(args, metrics):
+
+    """This function loads the model and its feature schema as the translator
+       does:  a flattened <model>.flat directory is preferred to the model
+       file, and <model>_features.npz is the default schema.  A missing
+       schema, or one that does not fit the model, raises ValueError."""
+
+    modelPath = args.model
+    flatPath = os.path.splitext(args.model)[0] + ".flat"
+    if os.path.isdir(flatPath):
+        modelPath = flatPath
+    start = time.time()
+    model = loadModel(modelPath, "r")
+    sys.stdout.write("Model %s loaded in %.1f s\n" % (modelPath, time.time() - start))
+
+    engine = loadSchema(args.features or schemaFile(args.model), model)
+    predictor = SignPredictor(model, topK=3)
+    if args.cache_step > 0:
+        predictor = CachedPredictor(predictor, step=args.cache_step, metrics=metrics)
+    return SignPipeline(predictor, engine, metrics=metrics)
+
+
+async def main(args):
+    metrics = Metrics(enabled=bool(args.metrics_file))
+    try:
+        pipeline = createPipeline(args, metrics)
+    except ValueError as error:
+        sys.stderr.write("%s\n" % error)
+        return error
+    source = frame_sources.createFrameSource(args.source, None, args.rate, not args.fast, args.hands)
+    service = TranslateService(source, pipeline, maxQueue=args.queue, preview=args.preview,
+                               previewScale=args.preview_scale, previewRate=args.preview_rate)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, service.stop)
+        except (NotImplementedError, RuntimeError):
+            # not available on Windows, Ctrl-C raises KeyboardInterrupt there
+            pass
+    try:
+        await service.serve(args.unix, args.host, args.port)
+    finally:
+        sys.stdout.write(service.summary() + "\n")
+        if isinstance(pipeline.predictor, CachedPredictor):
+            sys.stdout.write(pipeline.predictor.summary() + "\n")
+        if args.metrics_file:
+            sys.stdout.write(metrics.summary() + "\n")
+            metrics.dump(args.metrics_file)
+    return service.error
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless ASL translation service")
+    parser.add_argument("--model", required=True, help="model file or FlatForest directory")
+    parser.add_argument("--features", help="feature schema of the model (default: <model>_features.npz, "
+                        "created by features.py)")
+    parser.add_argument("--source", choices=["live", "replay", "synthetic"], default="synthetic",
+                        help="where frames come from, only synthetic runs on Python 3 (default: synthetic)")
+    parser.add_argument("--rate", type=float, help="frames per second of the synthetic source")
+    parser.add_argument("--fast", action="store_true", help="produce frames as fast as they are read")
+    parser.add_argument("--hands", type=int, choices=[1, 2], default=1, help="hands of the synthetic source")
+    parser.add_argument("--unix", help="Unix socket path (default: TCP)")
+    parser.add_argument("--host", default="127.0.0.1", help="TCP address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port (default: 8765)")
+    parser.add_argument("--queue", type=int, default=64, help="messages queued per client")
+    parser.add_argument("--preview", action="store_true", help="also publish preview images")
+    parser.add_argument("--preview-scale", type=int, default=4,
+                        help="keep every Nth pixel of the previews (default: 4)")
+    parser.add_argument("--preview-rate", type=float, default=10.0,
+                        help="previews per second (default: 10)")
+    parser.add_argument("--cache-step", type=float, default=1.0,
+                        help="quantization step in mm of the prediction cache, 0 disables it")
+    parser.add_argument("--metrics-file", help="append the stage latency histograms to this file")
+    args = parser.parse_args()
+    if args.source != "synthetic":
+        parser.error("--source %s needs the Leap SDK 3.2 bindings, which only exist for Python 2.7; "
+                     "the service runs on Python 3 with --source synthetic only" % args.source)
+
+    try:
+        if asyncio.run(main(args)) is not None:
+            sys.exit(1)
+    except KeyboardInterrupt:
+        pass